@@ -11,6 +11,12 @@ db = SQLAlchemy()
 from flask import Flask
 from flask_login import LoginManager
 from models import db, User
+from job_queue import job_queue
+from schema_migrations import run_migrations
+from timetable_changelog import change_log
+from schedule_cache import schedule_cache
+from occupancy_index import occupancy_index
+from user_cache import user_cache
 from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
 
@@ -35,6 +41,11 @@ def create_app():
     
     # Initialize extensions
     db.init_app(app)
+    job_queue.init_app(app)
+    change_log.init_app(app)
+    schedule_cache.init_app(app)
+    occupancy_index.init_app(app)
+    user_cache.init_app(app)
     
     # Initialize Login Manager
     login_manager = LoginManager()
@@ -44,12 +55,13 @@ def create_app():
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.get(user_id)
     
     # Create tables
     with app.app_context():
         db.create_all()
         logging.info("Database tables created successfully")
+        run_migrations()
         
         # Create default admin user if not exists
         admin_user = User.query.filter_by(username='admin').first()
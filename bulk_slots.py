@@ -0,0 +1,81 @@
+"""
+Bulk Slot Persistence
+Set-based insert and delete of TimetableSlot rows without the ORM unit of work
+"""
+
+import csv
+import io
+from datetime import datetime
+from sqlalchemy import delete, insert
+from models import db, TimetableSlot
+from schedule_cache import schedule_cache
+from occupancy_index import occupancy_index
+
+try:
+    import psycopg2  # noqa: F401 - only needed for the PostgreSQL COPY fast path
+except ImportError:
+    psycopg2 = None
+
+slots_table = TimetableSlot.__table__
+
+# Columns written by insert_slots, in COPY order
+SLOT_COLUMNS = [
+    'slot_index', 'batch_id', 'section', 'day', 'time_start', 'time_end',
+    'subject_code', 'subject_name', 'teacher_id', 'teacher_name', 'room_id', 'room_name',
+    'campus', 'activity_type', 'department', 'scheme',
+    'created_at', 'updated_at', 'created_by', 'is_active', 'version',
+]
+
+
+def _complete_rows(rows, user_id):
+    """Copies of the slot dicts with the metadata columns filled in"""
+    now = datetime.utcnow()
+    defaults = {'created_at': now, 'updated_at': now, 'created_by': user_id, 'is_active': True, 'version': 1}
+    return [{column: row.get(column, defaults.get(column)) for column in SLOT_COLUMNS} for row in rows]
+
+
+def _copy_rows(connection, rows):
+    """Stream rows into timetable_slots with PostgreSQL COPY"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if row[column] is None else row[column] for column in SLOT_COLUMNS])
+    buffer.seek(0)
+
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {slots_table.name} ({', '.join(SLOT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+    finally:
+        cursor.close()
+
+
+def insert_slots(rows, user_id=None):
+    """Insert slot dicts in one statement inside the current session's transaction.
+
+    Uses COPY on PostgreSQL with psycopg2 and a Core executemany insert
+    everywhere else. The caller commits; cached schedules are dropped on commit.
+    The change log hooks do not see Core writes, so callers record the new
+    timetable with change_log.write_base(). Returns the number of rows.
+    """
+    if not rows:
+        return 0
+    rows = _complete_rows(rows, user_id)
+
+    schedule_cache.invalidate_all_on_commit()
+    occupancy_index.record_write()
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql' and psycopg2 is not None:
+        _copy_rows(connection, rows)
+    else:
+        connection.execute(insert(slots_table), rows)
+    return len(rows)
+
+
+def delete_slots(*criteria):
+    """Hard-delete slots matching the criteria (all slots if none); see insert_slots. Returns the row count"""
+    schedule_cache.invalidate_all_on_commit()
+    occupancy_index.record_write()
+    return db.session.execute(delete(slots_table).where(*criteria)).rowcount
+
@@ -0,0 +1,259 @@
+"""
+Background Job Queue
+Database-backed queue of long timetable jobs, run by job worker processes outside the web server
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from sqlalchemy import or_, select, update
+from models import db, BackgroundJob
+
+# job type -> function(context, **params) returning a JSON-serializable result
+JOB_HANDLERS = {}
+
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+# Seconds between heartbeats of a running job
+HEARTBEAT_SECONDS = 15
+
+# A running job whose heartbeat is older than this lost its worker and is requeued
+STALE_AFTER_SECONDS = 120
+
+# Claims per job before a job that keeps losing its worker is marked failed
+MAX_ATTEMPTS = 3
+
+# Seconds an idle worker waits before polling for queued jobs again
+POLL_SECONDS = 2.0
+
+jobs_table = BackgroundJob.__table__
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when an admin cancelled it"""
+
+
+def job_handler(job_type):
+    """Register a function as the handler for a job type"""
+    def register(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return register
+
+
+class JobContext:
+    """Handed to job functions for progress reporting and cancellation checks.
+
+    progress() commits the current session, so jobs should call it between
+    units of work, not while holding uncommitted changes.
+    """
+
+    def __init__(self, job):
+        self.job = job
+
+    def progress(self, percent, message=None):
+        """Record progress (0-100) and stop the job if cancellation was requested"""
+        self.job.progress = int(percent)
+        if message:
+            self.job.message = message
+        self.job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        # Attributes expire on commit, so this re-reads the flag another worker may have set
+        db.session.refresh(self.job, ['cancel_requested'])
+        if self.job.cancel_requested:
+            raise JobCancelled()
+
+
+def _finish(job, status, message=None, result=None):
+    job.status = status
+    job.finished_at = datetime.utcnow()
+    if message:
+        job.message = message
+    if result is not None:
+        job.result = json.dumps(result)
+        job.progress = 100
+    db.session.commit()
+
+
+class JobQueue:
+    """Jobs are rows in background_jobs; job workers claim and run them.
+
+    Web workers only insert 'queued' rows (submit) and flag cancellations.
+    A worker (python job_worker.py, one job at a time, run as many as
+    needed) claims the oldest queued row with SELECT ... FOR UPDATE SKIP
+    LOCKED plus a conditional status update, and keeps a heartbeat on it
+    while it runs. Running jobs whose heartbeat goes stale (the worker was
+    killed or lost its host) are requeued, up to MAX_ATTEMPTS claims, so
+    handlers must be safe to run again from the start.
+    """
+
+    def __init__(self):
+        self.app = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def submit(self, job_type, params=None, user_id=None):
+        """Queue a job and return its BackgroundJob row"""
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f'Unknown job type: {job_type}')
+
+        job = BackgroundJob(job_type=job_type, params=json.dumps(params or {}), created_by=user_id,
+                            status='queued', progress=0, message='Queued')
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def cancel(self, job_id):
+        """Request cancellation; returns the job, or None if it does not exist"""
+        job = db.session.get(BackgroundJob, job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return job
+
+        # A queued job is cancelled outright unless a worker claims it first
+        cancelled = db.session.execute(
+            update(jobs_table)
+            .where(jobs_table.c.id == job_id, jobs_table.c.status == 'queued')
+            .values(status='cancelled', cancel_requested=True, finished_at=datetime.utcnow(),
+                    message='Cancelled before start')
+        ).rowcount
+        if not cancelled:
+            job.cancel_requested = True
+        db.session.commit()
+        db.session.refresh(job)
+        return job
+
+    # ------------------------------------------------------------------
+    # Worker side
+    # ------------------------------------------------------------------
+
+    def requeue_stale(self):
+        """Requeue (or fail, after MAX_ATTEMPTS) running jobs whose worker stopped heartbeating"""
+        cutoff = datetime.utcnow() - timedelta(seconds=STALE_AFTER_SECONDS)
+        stale = BackgroundJob.query.filter(
+            BackgroundJob.status == 'running',
+            or_(BackgroundJob.heartbeat_at < cutoff,
+                BackgroundJob.heartbeat_at.is_(None) & (BackgroundJob.started_at < cutoff))
+        ).with_for_update(skip_locked=True).all()
+
+        # One commit for all of them, so the row locks hold until every job is settled
+        now = datetime.utcnow()
+        for job in stale:
+            lost = f'Worker {job.worker_id} stopped responding'
+            if job.cancel_requested:
+                job.status, job.finished_at, job.message = 'cancelled', now, f'{lost}; cancelled by admin'
+            elif job.attempts >= MAX_ATTEMPTS:
+                job.status, job.finished_at = 'failed', now
+                job.message = f'{lost} on attempt {job.attempts} of {MAX_ATTEMPTS}'
+            else:
+                job.status, job.worker_id, job.message = 'queued', None, f'{lost}; requeued'
+            print(f"♻️ Job {job.id}: {job.message}")
+        db.session.commit()
+        return len(stale)
+
+    def claim(self, worker_id):
+        """Mark the oldest queued job as running for this worker and return it, or None"""
+        while True:
+            job_id = db.session.execute(
+                select(jobs_table.c.id)
+                .where(jobs_table.c.status == 'queued')
+                .order_by(jobs_table.c.created_at, jobs_table.c.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).scalar()
+            if job_id is None:
+                db.session.commit()
+                return None
+
+            # Databases without row locks (SQLite) rely on this conditional update alone
+            now = datetime.utcnow()
+            claimed = db.session.execute(
+                update(jobs_table)
+                .where(jobs_table.c.id == job_id, jobs_table.c.status == 'queued')
+                .values(status='running', worker_id=worker_id, started_at=now, heartbeat_at=now,
+                        attempts=jobs_table.c.attempts + 1, message='Running')
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(BackgroundJob, job_id)
+
+    def _heartbeat(self, engine, job_id, worker_id, stop):
+        """Thread body: refresh the job's heartbeat until stop is set"""
+        while not stop.wait(HEARTBEAT_SECONDS):
+            try:
+                with engine.begin() as connection:
+                    connection.execute(
+                        update(jobs_table)
+                        .where(jobs_table.c.id == job_id, jobs_table.c.worker_id == worker_id,
+                               jobs_table.c.status == 'running')
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+            except Exception as e:
+                print(f"⚠️ Heartbeat for job {job_id} failed: {e}")
+
+    def run_job(self, job, worker_id):
+        """Run a claimed job to completion, failure or cancellation"""
+        print(f"⚙️ Job {job.id} ({job.job_type}) started on {worker_id}, attempt {job.attempts}")
+        if job.cancel_requested:
+            _finish(job, 'cancelled', 'Cancelled before start')
+            return
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(db.engine, job.id, worker_id, stop), daemon=True
+        )
+        heartbeat.start()
+        try:
+            handler = JOB_HANDLERS.get(job.job_type)
+            if handler is None:
+                raise ValueError(f'No handler registered for job type {job.job_type}')
+            result = handler(JobContext(job), **json.loads(job.params or '{}'))
+            message = result.get('message') if isinstance(result, dict) else None
+            _finish(job, 'completed', message or 'Completed', result)
+            print(f"✅ Job {job.id} completed")
+        except JobCancelled:
+            db.session.rollback()
+            _finish(job, 'cancelled', 'Cancelled by admin')
+            print(f"🛑 Job {job.id} cancelled")
+        except Exception as e:
+            traceback.print_exc()
+            db.session.rollback()
+            _finish(job, 'failed', f'{job.job_type} failed: {str(e)}')
+            print(f"❌ Job {job.id} failed: {e}")
+        finally:
+            stop.set()
+            heartbeat.join()
+
+    def run_worker(self, worker_id=None, poll_interval=POLL_SECONDS, once=False):
+        """Claim and run queued jobs until interrupted (call within an app context).
+
+        With once=True, returns after the queue is first found empty.
+        """
+        worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        print(f"👷 Job worker {worker_id} polling every {poll_interval}s")
+        while True:
+            try:
+                self.requeue_stale()
+                job = self.claim(worker_id)
+                if job is not None:
+                    self.run_job(job, worker_id)
+                    continue
+            except Exception as e:
+                traceback.print_exc()
+                print(f"❌ Job worker error: {e}")
+            finally:
+                db.session.remove()
+            if once:
+                return
+            time.sleep(poll_interval)
+
+
+# One queue per worker process, shared by all blueprints
+job_queue = JobQueue()
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Job Worker
+Runs queued background jobs (timetable generation, optimization) outside the web server
+"""
+
+import argparse
+from app import app
+from job_queue import job_queue, POLL_SECONDS
+import timetable_jobs  # noqa: F401 - registers the generate/optimize job handlers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run queued background jobs')
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help='seconds between polls when idle')
+    parser.add_argument('--once', action='store_true', help='exit once the queue is empty')
+    args = parser.parse_args()
+
+    with app.app_context():
+        job_queue.run_worker(poll_interval=args.poll, once=args.once)
+
+
+if __name__ == "__main__":
+    main()
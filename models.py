@@ -1,4 +1,5 @@
 from datetime import datetime
+import json
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -30,6 +31,7 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime)
     active_status = db.Column(db.Boolean, default=True)
+    token_version = db.Column(db.Integer, nullable=False, default=0)  # carried in JWTs; bumping it revokes them
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -56,6 +58,18 @@ class User(UserMixin, db.Model):
 
 class TimetableSlot(db.Model):
     __tablename__ = 'timetable_slots'
+    # Matched to the portal filters; slot_index last so ordered reads need no sort
+    __table_args__ = (
+        db.Index('ix_timetable_slots_batch_section_active', 'batch_id', 'section', 'is_active', 'slot_index'),
+        db.Index('ix_timetable_slots_batch_active', 'batch_id', 'is_active', 'slot_index'),
+        db.Index('ix_timetable_slots_teacher_active', 'teacher_id', 'is_active', 'slot_index'),
+        db.Index('ix_timetable_slots_active_order', 'is_active', 'slot_index'),
+        # /api/events keyset pages: one (day, time_start, id) range per day, for admins, students and teachers
+        db.Index('ix_timetable_slots_active_day_time', 'is_active', 'day', 'time_start', 'id'),
+        db.Index('ix_timetable_slots_batch_section_day_time', 'batch_id', 'section', 'is_active', 'day', 'time_start', 'id'),
+        db.Index('ix_timetable_slots_teacher_day_time', 'teacher_id', 'is_active', 'day', 'time_start', 'id'),
+        db.Index('ix_timetable_slots_campus_active', 'campus', 'is_active'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     slot_index = db.Column(db.Integer, nullable=False)
@@ -111,7 +125,7 @@ class TimetableHistory(db.Model):
     __tablename__ = 'timetable_history'
     
     id = db.Column(db.Integer, primary_key=True)
-    timetable_data = db.Column(db.Text, nullable=False)  # JSON data
+    timetable_data = db.Column(db.Text, nullable=False)  # JSON base snapshot of all slots
     version = db.Column(db.Integer, nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -119,6 +133,34 @@ class TimetableHistory(db.Model):
     total_slots = db.Column(db.Integer)
     affected_batches = db.Column(db.Text)  # JSON array
     
+class TimetableChange(db.Model):
+    __tablename__ = 'timetable_changes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    history_id = db.Column(db.Integer, db.ForeignKey('timetable_history.id'), index=True)  # base snapshot
+    slot_id = db.Column(db.Integer, nullable=False)
+    slot_version = db.Column(db.Integer)
+    operation = db.Column(db.String(10), nullable=False)  # insert, update, delete
+    diff = db.Column(db.Text, nullable=False)  # JSON {field: [old, new]}
+    changed_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+class ScheduleSnapshot(db.Model):
+    __tablename__ = 'schedule_snapshots'
+    
+    scope = db.Column(db.String(10), primary_key=True)  # batch, section, teacher
+    key = db.Column(db.String(50), primary_key=True)  # batch_id, batch_id/section or teacher_id
+    payload = db.Column(db.Text)  # JSON list of slot dicts; NULL once invalidated
+    total = db.Column(db.Integer)
+    generation = db.Column(db.Integer, nullable=False, default=0)  # bumped by every invalidation
+    built_at = db.Column(db.DateTime)
+    
+class TimetableGeneration(db.Model):
+    __tablename__ = 'timetable_generation'
+    
+    id = db.Column(db.Integer, primary_key=True)  # single row, id 1
+    value = db.Column(db.BigInteger, nullable=False, default=0)  # bumped by every transaction that writes slots
+    
 class DataImportLog(db.Model):
     __tablename__ = 'data_import_logs'
     
@@ -131,6 +173,46 @@ class DataImportLog(db.Model):
     imported_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     imported_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class BackgroundJob(db.Model):
+    __tablename__ = 'background_jobs'
+    # Workers claim the oldest queued job and sweep running jobs with stale heartbeats
+    __table_args__ = (
+        db.Index('ix_background_jobs_status_created', 'status', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)  # generate, optimize
+    status = db.Column(db.String(20), default='queued')  # queued, running, completed, failed, cancelled
+    progress = db.Column(db.Integer, default=0)  # 0-100
+    message = db.Column(db.Text)
+    params = db.Column(db.Text)  # JSON object passed to the job function
+    result = db.Column(db.Text)  # JSON result of a completed job
+    cancel_requested = db.Column(db.Boolean, default=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # times a worker claimed the job
+    worker_id = db.Column(db.String(100))  # host:pid of the worker running it
+    heartbeat_at = db.Column(db.DateTime)  # refreshed while running; stale means the worker died
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'result': json.loads(self.result) if self.result else None,
+            'cancel_requested': self.cancel_requested,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'attempts': self.attempts,
+            'worker_id': self.worker_id
+        }
+
 class SystemConfig(db.Model):
     __tablename__ = 'system_config'
     
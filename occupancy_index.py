@@ -0,0 +1,266 @@
+"""
+Occupancy Index
+Per-worker bitset index of which teacher, room and batch is busy in each weekly slot
+"""
+
+import threading
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+from models import db, TimetableSlot, TimetableGeneration
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+TIME_SLOTS = [
+    ('08:00', '09:00'), ('09:00', '10:00'), ('10:00', '11:00'), ('11:20', '12:20'), ('13:00', '14:00'),
+    ('14:00', '15:00'), ('15:00', '16:00'), ('16:00', '17:00'), ('17:00', '18:00')
+]
+
+# (conflict type, slot attribute) tracked by the index
+RESOURCES = [
+    ('teacher_conflict', 'teacher_id'),
+    ('room_conflict', 'room_id'),
+    ('batch_conflict', 'batch_id'),
+]
+
+# Placeholder ids that never conflict with each other
+UNASSIGNED = {None, '', 'TBD'}
+
+generation_table = TimetableGeneration.__table__
+
+# Session.info keys for the (before, after) generation of the current / last committed slot transaction
+PENDING_GENERATION = 'slot_generation_pending'
+COMMITTED_GENERATION = 'slot_generation_committed'
+
+
+def _minutes(value):
+    hours, minutes = str(value).split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def slot_cells(day, time_start, time_end):
+    """Cell numbers (day * 9 + slot) of the weekly grid overlapped by [time_start, time_end)"""
+    if day not in DAYS or not time_start or not time_end:
+        return []
+    try:
+        start, end = _minutes(time_start), _minutes(time_end)
+    except ValueError:
+        return []
+
+    base = DAYS.index(day) * len(TIME_SLOTS)
+    return [
+        base + i for i, (slot_start, slot_end) in enumerate(TIME_SLOTS)
+        if _minutes(slot_start) < end and start < _minutes(slot_end)
+    ]
+
+
+class OccupancyIndex:
+    """Incrementally maintained occupancy of the 6x9 weekly grid.
+
+    For every (conflict type, resource id) the index keeps a per-cell slot
+    count plus an int bitset of the occupied cells, so checking an edit only
+    touches the one or two cells the slot covers.
+
+    Every transaction that writes slots bumps the single timetable_generation
+    row once, so freshness is one primary-key read. Edits made through the
+    routes are applied as deltas only when their transaction moved the
+    generation straight on from the one the index was built at; if any other
+    worker wrote in between, or the generation moved otherwise, the index
+    is rebuilt.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._bits = {}
+        self._entries = {}
+        self._token = None
+        self._registered = False
+
+    def init_app(self, app):
+        if not self._registered:
+            event.listen(Session, 'after_flush', self._collect)
+            event.listen(Session, 'after_commit', self._committed)
+            event.listen(Session, 'after_soft_rollback', self._discard_pending)
+            self._registered = True
+
+    def _collect(self, session, flush_context):
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, TimetableSlot):
+                self.record_write(session)
+                return
+
+    @staticmethod
+    def record_write(session=None):
+        """Bump the slot generation once in the session's transaction (Core slot writes call this)"""
+        session = session or db.session
+        if PENDING_GENERATION in session.info:
+            return
+        connection = session.connection()
+        bumped = connection.execute(
+            update(generation_table).where(generation_table.c.id == 1).values(value=generation_table.c.value + 1)
+        ).rowcount
+        if not bumped:
+            connection.execute(insert(generation_table).values(id=1, value=1))
+        # The UPDATE holds the row lock until commit, so this is exactly our increment
+        after = connection.execute(select(generation_table.c.value).where(generation_table.c.id == 1)).scalar()
+        session.info[PENDING_GENERATION] = (after - 1, after)
+
+    @staticmethod
+    def _committed(session):
+        generations = session.info.pop(PENDING_GENERATION, None)
+        if generations is not None:
+            session.info[COMMITTED_GENERATION] = generations
+
+    @staticmethod
+    def _discard_pending(session, previous_transaction):
+        session.info.pop(PENDING_GENERATION, None)
+
+    def _entry(self, slot):
+        """(cells, {conflict type: resource id}) for a TimetableSlot or slot dict"""
+        get = slot.get if isinstance(slot, dict) else lambda key: getattr(slot, key, None)
+        cells = slot_cells(get('day'), get('time_start'), get('time_end'))
+        resources = {
+            conflict_type: get(field) for conflict_type, field in RESOURCES
+            if get(field) not in UNASSIGNED
+        }
+        return cells, resources
+
+    def _add(self, slot_id, entry):
+        cells, resources = entry
+        for key in resources.items():
+            counts = self._counts.setdefault(key, {})
+            for cell in cells:
+                counts[cell] = counts.get(cell, 0) + 1
+                self._bits[key] = self._bits.get(key, 0) | (1 << cell)
+        self._entries[slot_id] = entry
+
+    def _remove(self, slot_id):
+        entry = self._entries.pop(slot_id, None)
+        if entry is None:
+            return
+        cells, resources = entry
+        for key in resources.items():
+            counts = self._counts.get(key, {})
+            for cell in cells:
+                counts[cell] = counts.get(cell, 0) - 1
+                if counts[cell] <= 0:
+                    counts.pop(cell, None)
+                    self._bits[key] = self._bits.get(key, 0) & ~(1 << cell)
+
+    def _db_token(self):
+        return db.session.execute(
+            select(generation_table.c.value).where(generation_table.c.id == 1)
+        ).scalar() or 0
+
+    def rebuild(self):
+        """Reload every active slot from the database"""
+        # Token first: a write landing in between only makes the next check rebuild again
+        token = self._db_token()
+        slots = TimetableSlot.query.filter_by(is_active=True).all()
+        with self._lock:
+            self._counts, self._bits, self._entries = {}, {}, {}
+            for slot in slots:
+                self._add(slot.id, self._entry(slot))
+            self._token = token
+
+    def ensure_fresh(self):
+        """Rebuild if slots changed outside this worker since the last sync"""
+        if self._token is None or self._db_token() != self._token:
+            self.rebuild()
+
+    def _apply_committed(self, update_entries):
+        """Run update_entries for this worker's last slot commit if it directly follows the index"""
+        generations = db.session.info.pop(COMMITTED_GENERATION, None)
+        if generations is None:
+            self.ensure_fresh()
+            return
+        with self._lock:
+            if self._token == generations[0]:
+                update_entries()
+                self._token = generations[1]
+                return
+        self.rebuild()
+
+    def apply(self, *slots):
+        """Apply committed edits: re-index the given slots (inactive ones are dropped)"""
+        entries = [(slot.id, slot.is_active and self._entry(slot)) for slot in slots]
+
+        def update_entries():
+            for slot_id, entry in entries:
+                self._remove(slot_id)
+                if entry:
+                    self._add(slot_id, entry)
+
+        self._apply_committed(update_entries)
+
+    def remove(self, slot_id):
+        """Drop a deleted slot from the index"""
+        self._apply_committed(lambda: self._remove(slot_id))
+
+    def check(self, changes):
+        """Conflicts that the proposed changes would create.
+
+        changes maps slot id (None for a new slot) to the slot's proposed
+        values (a dict or TimetableSlot). All changes are evaluated together,
+        so swapping two slots does not conflict with their own old positions,
+        and clashes the slots already had where they are now are not reported.
+        Returns a list of {'type', 'resource', 'day', 'time_slot', 'slot_id'} dicts.
+        """
+        self.ensure_fresh()
+        proposed = {slot_id: self._entry(values) for slot_id, values in changes.items()}
+
+        with self._lock:
+            current = {slot_id: self._entries[slot_id] for slot_id in proposed if slot_id in self._entries}
+            existing = set(self._conflicts(current))
+            conflicts = [conflict for conflict in self._conflicts(proposed) if conflict not in existing]
+
+        result = []
+        for conflict_type, resource, cell, slot_id in conflicts:
+            day, slot = divmod(cell, len(TIME_SLOTS))
+            result.append({
+                'type': conflict_type,
+                'resource': resource,
+                'day': DAYS[day],
+                'time_slot': '-'.join(TIME_SLOTS[slot]),
+                'slot_id': slot_id
+            })
+        return result
+
+    def _conflicts(self, proposed):
+        """(type, resource, cell, slot id) clashes if the slots in proposed had these entries"""
+        conflicts = []
+        for slot_id, (cells, resources) in proposed.items():
+            for key in resources.items():
+                counts = self._counts.get(key, {})
+                occupied = self._bits.get(key, 0)
+                for cell in cells:
+                    moved_here = self._proposed_in(proposed, slot_id, key, cell)
+                    if not occupied >> cell & 1 and not moved_here:
+                        continue
+                    # Occupants other than the slots being moved, plus the other moved slots
+                    others = counts.get(cell, 0) + moved_here - sum(
+                        1 for other_id in proposed
+                        if self._covers(self._entries.get(other_id), key, cell)
+                    )
+                    if others > 0:
+                        conflicts.append((key[0], key[1], cell, slot_id))
+        return conflicts
+
+    @staticmethod
+    def _covers(entry, key, cell):
+        return entry is not None and entry[1].get(key[0]) == key[1] and cell in entry[0]
+
+    def _proposed_in(self, proposed, slot_id, key, cell):
+        """Number of other proposed slots that would use the same resource in the cell"""
+        return sum(
+            1 for other_id, entry in proposed.items()
+            if other_id != slot_id and self._covers(entry, key, cell)
+        )
+
+    def free_cells(self, conflict_type, resource):
+        """Bitset of the weekly cells where a teacher, room or batch is still free"""
+        self.ensure_fresh()
+        return ~self._bits.get((conflict_type, resource), 0) & ((1 << len(DAYS) * len(TIME_SLOTS)) - 1)
+
+
+# One index per worker process, shared by all blueprints
+occupancy_index = OccupancyIndex()
@@ -10,7 +10,7 @@ import pandas as pd
 import pickle
 import os
 from datetime import datetime
-from encoding import TimetableEncoder
+from pipeline.encoding import TimetableEncoder, SLOT_FIELDS
 
 class AnomalyDetector:
     def __init__(self, model_path='pipeline/models/autoencoder.pth', 
@@ -29,16 +29,25 @@ class AnomalyDetector:
     def load_model(self, model_path):
         """Load trained autoencoder model"""
         try:
-            # Load metadata to get model architecture
-            with open('pipeline/models/training_metadata.pkl', 'rb') as f:
+            # Load metadata (saved next to the weights) to get model architecture
+            with open(os.path.join(os.path.dirname(model_path), 'training_metadata.pkl'), 'rb') as f:
                 metadata = pickle.load(f)
             
+            if 'embed_dim' not in metadata:
+                # fixed_training.py's SimpleAutoencoder shares these file names
+                print(f"❌ {model_path} is a {metadata.get('model_type', 'different')} model; "
+                      "retrain with python -m pipeline.training --sparse")
+                self.model = None
+                return
+            
             # Recreate model architecture
-            from training import TimetableAutoencoder
+            from pipeline.training import TimetableAutoencoder
             self.model = TimetableAutoencoder(
                 input_dim=metadata['input_dim'],
                 embed_dim=metadata['embed_dim'],
-                hidden_dim=metadata['hidden_dim']
+                hidden_dim=metadata['hidden_dim'],
+                field_sizes=metadata.get('field_sizes'),
+                field_embed_dim=metadata.get('field_embed_dim', 16)
             )
             
             # Load trained weights
@@ -72,6 +81,75 @@ class AnomalyDetector:
             print(f"❌ Error loading encoder: {e}")
             self.encoder = None
     
+    def reconstruct(self, timetable_sequence):
+        """Run one sequence through the autoencoder, returning (target, output) tensors"""
+        if self.model.uses_indices:
+            # Index models take (seq_len, 8) int16 field indices and expand the
+            # one-hot target on the device instead of encoding dense rows
+            encoded_sequence = self.encoder.encode_indices(timetable_sequence)
+        else:
+            encoded_sequence = self.encoder.encode_many(timetable_sequence)
+        
+        X = torch.from_numpy(encoded_sequence).unsqueeze(0).to(self.device)
+        
+        with torch.no_grad():
+            output, z = self.model(X)
+            target = self.model.to_dense(X) if self.model.uses_indices else X
+        
+        return target, output
+    
+    def _error_breakdown(self, target, output):
+        """Per-slot and per-field squared reconstruction errors.
+        
+        Field errors are scaled by feature_dim so they sum to the slot error,
+        and slot errors average to the sequence error used by detect_anomaly.
+        """
+        squared = ((target - output) ** 2).cpu().numpy()
+        field_errors = np.add.reduceat(squared, self.encoder.field_offsets, axis=-1) / squared.shape[-1]
+        return field_errors.sum(axis=-1), field_errors
+    
+    def localize_anomaly(self, timetable_sequence, slot_threshold=None):
+        """Detect an anomaly and locate the slots and fields responsible for it.
+        
+        Returns a dict with the sequence error, per-slot and per-field errors,
+        the indices of flagged slots, the flagged field names per slot and the
+        raw reconstruction, all from a single forward pass.
+        """
+        if self.model is None or self.encoder is None:
+            print("⚠️ Model or encoder not loaded")
+            return None
+        
+        if slot_threshold is None:
+            slot_threshold = self.threshold
+        
+        target, output = self.reconstruct(timetable_sequence)
+        slot_errors, field_errors = self._error_breakdown(target[0], output[0])
+        error = float(slot_errors.mean()) if len(slot_errors) else 0.0
+        is_anomaly = bool(error > self.threshold)
+        
+        flagged_slots = np.flatnonzero(slot_errors > slot_threshold)
+        if is_anomaly and len(flagged_slots) == 0:
+            # The error is spread out - start with the worst slot
+            flagged_slots = np.array([int(slot_errors.argmax())])
+        
+        # A field is flagged when it carries more than its equal share of the slot threshold
+        field_names = [key for _, key in SLOT_FIELDS]
+        field_threshold = slot_threshold / len(field_names)
+        flagged_fields = {}
+        for i in flagged_slots:
+            fields = [field_names[j] for j in np.flatnonzero(field_errors[i] > field_threshold)]
+            flagged_fields[int(i)] = fields or [field_names[int(field_errors[i].argmax())]]
+        
+        return {
+            'error': error,
+            'is_anomaly': is_anomaly,
+            'slot_errors': slot_errors,
+            'field_errors': field_errors,
+            'flagged_slots': [int(i) for i in flagged_slots],
+            'flagged_fields': flagged_fields,
+            'reconstruction': output[0].cpu().numpy()
+        }
+    
     def detect_anomaly(self, timetable_sequence):
         """Detect anomaly in a timetable sequence"""
         if self.model is None or self.encoder is None:
@@ -79,21 +157,11 @@ class AnomalyDetector:
             return False, 0.0
         
         try:
-            # Encode sequence
-            encoded_sequence = []
-            for slot in timetable_sequence:
-                encoded_slot = self.encoder.encode_slot(slot)
-                encoded_sequence.append(encoded_slot)
-            
-            # Convert to tensor
-            X = torch.FloatTensor(encoded_sequence).unsqueeze(0).to(self.device)
-            
             # Get reconstruction
-            with torch.no_grad():
-                output, z = self.model(X)
-                
-                # Compute reconstruction error
-                error = torch.mean((X - output) ** 2).item()
+            target, output = self.reconstruct(timetable_sequence)
+            
+            # Compute reconstruction error
+            error = torch.mean((target - output) ** 2).item()
             
             # Check if anomaly
             is_anomaly = error > self.threshold
@@ -195,8 +263,59 @@ class AnomalyDetector:
             print(f"✅ No anomaly detected. Reconstruction error: {error:.6f}")
             return False, "Normal", []
     
-    def batch_anomaly_check(self, timetable_data):
-        """Check entire timetable for anomalies"""
+    def score_sequences(self, sequences):
+        """Score many sequences with one padded forward pass.
+        
+        sequences maps a key (e.g. batch_id) to a list of slot dicts. Returns
+        {key: {'error': float, 'slot_errors': ndarray, 'field_errors': ndarray,
+        'is_anomaly': bool}},
+        where error matches detect_anomaly() for the same sequence.
+        """
+        keys = [key for key, sequence in sequences.items() if len(sequence) > 0]
+        if not keys:
+            return {}
+        
+        lengths = np.array([len(sequences[key]) for key in keys])
+        all_slots = [slot for key in keys for slot in sequences[key]]
+        
+        # Encode every slot once, then scatter the rows into a padded batch
+        if self.model.uses_indices:
+            encoded = self.encoder.encode_indices(all_slots)
+            pad_value = -1
+        else:
+            encoded = self.encoder.encode_many(all_slots)
+            pad_value = 0
+        
+        max_len = int(lengths.max())
+        rows = np.repeat(np.arange(len(keys)), lengths)
+        positions = np.arange(len(all_slots)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        padded = np.full((len(keys), max_len, encoded.shape[1]), pad_value, dtype=encoded.dtype)
+        padded[rows, positions] = encoded
+        
+        X = torch.from_numpy(padded).to(self.device)
+        with torch.inference_mode():
+            output, z = self.model(X, lengths=torch.from_numpy(lengths))
+            target = self.model.to_dense(X) if self.model.uses_indices else X
+            slot_errors, field_errors = self._error_breakdown(target, output)
+        
+        results = {}
+        for i, key in enumerate(keys):
+            errors = slot_errors[i, :lengths[i]]
+            error = float(errors.mean())
+            results[key] = {
+                'error': error,
+                'slot_errors': errors,
+                'field_errors': field_errors[i, :lengths[i]],
+                'is_anomaly': bool(error > self.threshold)
+            }
+        return results
+    
+    def batch_anomaly_check(self, timetable_data, batched=True):
+        """Check entire timetable for anomalies.
+        
+        With batched=True all batch sequences are scored in a single forward
+        pass and each anomaly also carries its per-slot errors.
+        """
         print("🔍 Running batch anomaly detection...")
         
         anomalies = []
@@ -210,14 +329,24 @@ class AnomalyDetector:
                     sequences[batch_id] = []
                 sequences[batch_id].append(slot)
             
-            for batch_id, sequence in sequences.items():
-                is_anomaly, error = self.detect_anomaly(sequence)
-                if is_anomaly:
-                    anomalies.append({
-                        'batch_id': batch_id,
-                        'error': error,
-                        'sequence_length': len(sequence)
-                    })
+            if batched and self.model is not None and self.encoder is not None:
+                for batch_id, result in self.score_sequences(sequences).items():
+                    if result['is_anomaly']:
+                        anomalies.append({
+                            'batch_id': batch_id,
+                            'error': result['error'],
+                            'sequence_length': len(sequences[batch_id]),
+                            'slot_errors': result['slot_errors'].tolist()
+                        })
+            else:
+                for batch_id, sequence in sequences.items():
+                    is_anomaly, error = self.detect_anomaly(sequence)
+                    if is_anomaly:
+                        anomalies.append({
+                            'batch_id': batch_id,
+                            'error': error,
+                            'sequence_length': len(sequence)
+                        })
         
         print(f"📊 Batch check complete. Found {len(anomalies)} anomalous sequences")
         return anomalies
@@ -4,14 +4,25 @@ Enforces hard constraints and optimizes timetable assignments
 """
 
 from ortools.sat.python import cp_model
-import pandas as pd
 import numpy as np
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import json
+import os
+from pipeline.data_cache import read_reference_csv
+
+# (violation type, slot field) pairs that may not repeat within one day and time slot
+CONFLICT_FIELDS = [
+    ('teacher_conflict', 'teacher_id'),
+    ('room_conflict', 'room_id'),
+    ('batch_conflict', 'batch_id'),
+]
 
 class TimetableConstraintSolver:
-    def __init__(self, data_path='data/'):
+    def __init__(self, data_path='data/', max_teacher_candidates=2, max_room_candidates=2):
         self.data_path = data_path
+        self.max_teacher_candidates = max_teacher_candidates
+        self.max_room_candidates = max_room_candidates
         self.model = cp_model.CpModel()
         self.solver = cp_model.CpSolver()
         self.variables = {}
@@ -25,10 +36,10 @@ class TimetableConstraintSolver:
         print("📊 Loading reference data for constraint solving...")
         
         try:
-            self.students_df = pd.read_csv(f'{self.data_path}/students.csv')
-            self.teachers_df = pd.read_csv(f'{self.data_path}/teachers.csv')
-            self.subjects_df = pd.read_csv(f'{self.data_path}/subjects.csv')
-            self.rooms_df = pd.read_csv(f'{self.data_path}/rooms.csv')
+            self.students_df = read_reference_csv(self.data_path, 'students')
+            self.teachers_df = read_reference_csv(self.data_path, 'teachers')
+            self.subjects_df = read_reference_csv(self.data_path, 'subjects')
+            self.rooms_df = read_reference_csv(self.data_path, 'rooms')
             
             # Create lookup dictionaries
             self.batches = list(self.students_df['batch_id'].unique())
@@ -51,6 +62,16 @@ class TimetableConstraintSolver:
             self.day_to_idx = {day: i for i, day in enumerate(self.days)}
             self.time_to_idx = {time: i for i, time in enumerate(self.time_slots)}
             
+            # Weekly teaching hours per teacher index
+            teacher_hours = self.teachers_df.set_index('teacher_id')['max_hours_per_week'].reindex(self.teachers)
+            self.teacher_capacity = teacher_hours.fillna(len(self.days) * len(self.time_slots)).to_numpy(dtype=float)
+            
+            # Attribute lookups for building solution slots (first row wins for repeated ids)
+            self.batch_info = self._lookup(self.students_df, 'batch_id', ['section', 'department', 'primary_campus'])
+            self.subject_info = self._lookup(self.subjects_df, 'subject_code', ['subject_name', 'lab_required'])
+            self.teacher_info = self._lookup(self.teachers_df, 'teacher_id', ['name'])
+            self.room_info = self._lookup(self.rooms_df, 'room_id', ['room_name', 'campus'])
+            
             print(f"✅ Reference data loaded: {len(self.batches)} batches, {len(self.teachers)} teachers")
             
         except Exception as e:
@@ -59,139 +80,345 @@ class TimetableConstraintSolver:
             self.teachers = []
             self.subjects = []
             self.rooms = []
+            self.batch_info = {}
+            self.subject_info = {}
+            self.teacher_info = {}
+            self.room_info = {}
+    
+    @staticmethod
+    def _lookup(df, id_column, columns):
+        """{id: {column: value}} for the first row of every id"""
+        return df.drop_duplicates(id_column).set_index(id_column)[columns].to_dict('index')
+    
+    def _room_type_for(self, subject):
+        """Room type a subject needs: Lab, Sports/Activity or Theory"""
+        if subject['type'] == 'Activity':
+            return 'Sports/Activity'
+        if str(subject['lab_required']).lower() == 'true':
+            return 'Lab'
+        return 'Theory'
+    
+    def _qualified_teachers(self, subject, department):
+        """Teacher indices qualified for a subject, from subject_expertise.
+        
+        Falls back to the subject name without its Lab/Elective suffix, then to
+        the batch department's teachers; labs prefer teachers with can_teach_lab.
+        """
+        expertise = self.teachers_df['subject_expertise'].astype(object).fillna('')
+        name = str(subject['subject_name'])
+        base_name = name
+        for suffix in (' Lab', ' Elective'):
+            if base_name.endswith(suffix):
+                base_name = base_name[:-len(suffix)]
+        
+        candidates = self.teachers_df[expertise.str.contains(name, case=False, regex=False)]
+        if candidates.empty and base_name != name:
+            candidates = self.teachers_df[expertise.str.contains(base_name, case=False, regex=False)]
+        if candidates.empty:
+            candidates = self.teachers_df[self.teachers_df['department'] == department]
+        
+        if self._room_type_for(subject) == 'Lab':
+            lab_teachers = candidates[candidates['can_teach_lab'].astype(str).str.lower() == 'true']
+            if not lab_teachers.empty:
+                candidates = lab_teachers
+        
+        return [self.teacher_to_idx[t] for t in candidates['teacher_id']]
+    
+    def _compatible_rooms(self, subject, batch_campus):
+        """Room indices of the right type, on the lab campus or the batch's campus"""
+        room_type = self._room_type_for(subject)
+        typed_rooms = self.rooms_df[self.rooms_df['room_type'] == room_type]
+        
+        campuses = [batch_campus]
+        if room_type == 'Lab':
+            campuses.insert(0, subject['lab_campus'])
+        
+        for campus in campuses:
+            rooms = typed_rooms[typed_rooms['campus'] == campus]
+            if not rooms.empty:
+                return [self.room_to_idx[r] for r in rooms['room_id']]
+        
+        # Activities (e.g. the stadium) are shared across campuses
+        return [self.room_to_idx[r] for r in typed_rooms['room_id']]
+    
+    def _pick_least_loaded(self, candidates, load, capacity, hours, limit):
+        """Keep the `limit` candidates with the lowest relative load and book the hours"""
+        chosen = sorted(candidates, key=lambda i: (load[i] / capacity(i), i))[:limit]
+        for i in chosen:
+            load[i] += hours / len(chosen)
+        return chosen
+    
+    def build_demands(self):
+        """Weekly (batch, subject) demands with pruned teacher and room candidates.
+        
+        Each demand is a dict with b, s, hours (subjects.csv frequency_per_week),
+        teachers and rooms. Candidates are capped at max_teacher_candidates /
+        max_room_candidates, picking the least loaded ones so the expected
+        workload is spread over all qualified teachers and compatible rooms.
+        """
+        batch_info = self.students_df.drop_duplicates('batch_id').set_index('batch_id')
+        subjects_by_group = {
+            key: group for key, group in self.subjects_df.groupby(['department', 'scheme'], observed=True)
+        }
+        
+        slots_per_week = len(self.days) * len(self.time_slots)
+        teacher_capacity = self.teacher_capacity
+        teacher_load = np.zeros(len(self.teachers))
+        room_load = np.zeros(len(self.rooms))
+        
+        qualified_cache = {}
+        room_cache = {}
+        demands = []
+        
+        for b, batch_id in enumerate(self.batches):
+            batch = batch_info.loc[batch_id]
+            group = subjects_by_group.get((batch['department'], batch['scheme']))
+            if group is None:
+                continue
+            
+            for _, subject in group.drop_duplicates('subject_code').iterrows():
+                hours = int(subject['frequency_per_week'])
+                if hours <= 0:
+                    continue
+                
+                teacher_key = (subject['subject_code'], batch['department'])
+                if teacher_key not in qualified_cache:
+                    qualified_cache[teacher_key] = self._qualified_teachers(subject, batch['department'])
+                room_key = (subject['subject_code'], batch['primary_campus'])
+                if room_key not in room_cache:
+                    room_cache[room_key] = self._compatible_rooms(subject, batch['primary_campus'])
+                
+                teachers = self._pick_least_loaded(
+                    qualified_cache[teacher_key], teacher_load,
+                    lambda t: teacher_capacity[t], hours, self.max_teacher_candidates
+                )
+                rooms = self._pick_least_loaded(
+                    room_cache[room_key], room_load,
+                    lambda r: slots_per_week, hours, self.max_room_candidates
+                )
+                if teachers and rooms:
+                    demands.append({
+                        'b': b,
+                        's': self.subject_to_idx[subject['subject_code']],
+                        'hours': min(hours, len(self.days)),
+                        'teachers': teachers,
+                        'rooms': rooms
+                    })
+        
+        return demands
     
-    def create_variables(self):
-        """Create decision variables for the constraint solver"""
+    def create_variables(self, existing_assignments=None, demands=None, blocked=None):
+        """Create decision variables for the constraint solver.
+        
+        Only feasible combinations get a variable: each (batch, subject) demand
+        times its candidate teachers, rooms (or its explicit (teacher, room)
+        'pairs') and every (day, hour) slot. Keys of
+        self.assignment are (b, t, s, r, d, h) index tuples. blocked holds
+        ('b'|'t'|'r', index, d, h) cells and ('bs', b, s, d) demand days that
+        are already taken and get no variable.
+        """
         print("🔧 Creating decision variables...")
         
-        # Assignment variables: assignment[b][t][s][r][d][h] = 1 if batch b is assigned
-        # teacher t, subject s, room r on day d at time h
+        self.demands = demands if demands is not None else self.build_demands()
+        self.blocked = blocked or set()
         self.assignment = {}
+        self.preferred_keys = set()
         
-        for b in range(len(self.batches)):
-            self.assignment[b] = {}
-            for t in range(len(self.teachers)):
-                self.assignment[b][t] = {}
-                for s in range(len(self.subjects)):
-                    self.assignment[b][t][s] = {}
-                    for r in range(len(self.rooms)):
-                        self.assignment[b][t][s][r] = {}
-                        for d in range(len(self.days)):
-                            self.assignment[b][t][s][r][d] = {}
-                            for h in range(len(self.time_slots)):
-                                var_name = f'assign_{b}_{t}_{s}_{r}_{d}_{h}'
-                                self.assignment[b][t][s][r][d][h] = self.model.NewBoolVar(var_name)
-        
-        print(f"✅ Created {len(self.batches) * len(self.teachers) * len(self.subjects) * len(self.rooms) * len(self.days) * len(self.time_slots)} variables")
+        for demand in self.demands:
+            b, s = demand['b'], demand['s']
+            pairs = demand.get('pairs') or [(t, r) for t in demand['teachers'] for r in demand['rooms']]
+            for d in range(len(self.days)):
+                if ('bs', b, s, d) in self.blocked:
+                    continue
+                for h in range(len(self.time_slots)):
+                    if ('b', b, d, h) in self.blocked:
+                        continue
+                    for t, r in pairs:
+                        if ('t', t, d, h) not in self.blocked and ('r', r, d, h) not in self.blocked:
+                            self.assignment[(b, t, s, r, d, h)] = self.model.NewBoolVar(f'assign_{b}_{t}_{s}_{r}_{d}_{h}')
+        
+        # Existing assignments outside the candidate lists still need a variable to be pinned
+        for key in self._assignment_keys(existing_assignments or []):
+            if key not in self.assignment:
+                self.assignment[key] = self.model.NewBoolVar('assign_{}_{}_{}_{}_{}_{}'.format(*key))
+        
+        print(f"✅ Created {len(self.assignment)} variables for {len(self.demands)} batch-subject demands")
+    
+    def _assignment_keys(self, assignments):
+        """(b, t, s, r, d, h) keys for slot dicts whose values are all known"""
+        keys = []
+        for assignment in assignments:
+            key = self._slot_key(assignment)
+            if all(x is not None for x in key):
+                keys.append(key)
+        return keys
+    
+    def _slot_key(self, slot):
+        """(b, t, s, r, d, h) for a slot dict, with None for values the solver doesn't know"""
+        return (
+            self.batch_to_idx.get(slot.get('batch_id')),
+            self.teacher_to_idx.get(slot.get('teacher_id')),
+            self.subject_to_idx.get(slot.get('subject_code')),
+            self.room_to_idx.get(slot.get('room_id')),
+            self.day_to_idx.get(slot.get('day')),
+            self.time_to_idx.get(self._slot_time(slot))
+        )
     
     def add_hard_constraints(self):
         """Add hard constraints that must be satisfied"""
         print("⚖️ Adding hard constraints...")
         
-        # Constraint 1: Each batch can have at most one class at any given time
-        for b in range(len(self.batches)):
-            for d in range(len(self.days)):
-                for h in range(len(self.time_slots)):
-                    assignments_at_time = []
-                    for t in range(len(self.teachers)):
-                        for s in range(len(self.subjects)):
-                            for r in range(len(self.rooms)):
-                                assignments_at_time.append(self.assignment[b][t][s][r][d][h])
-                    
-                    # At most one assignment per batch per time slot
-                    self.model.Add(sum(assignments_at_time) <= 1)
+        by_batch_time = {}
+        by_teacher_time = {}
+        by_room_time = {}
+        by_teacher = {}
+        by_demand = {}
+        by_demand_day = {}
+        by_demand_teacher = {}
         
-        # Constraint 2: Each teacher can teach at most one class at any given time
-        for t in range(len(self.teachers)):
-            for d in range(len(self.days)):
-                for h in range(len(self.time_slots)):
-                    teacher_assignments = []
-                    for b in range(len(self.batches)):
-                        for s in range(len(self.subjects)):
-                            for r in range(len(self.rooms)):
-                                teacher_assignments.append(self.assignment[b][t][s][r][d][h])
-                    
-                    self.model.Add(sum(teacher_assignments) <= 1)
+        for (b, t, s, r, d, h), var in self.assignment.items():
+            by_batch_time.setdefault((b, d, h), []).append(var)
+            by_teacher_time.setdefault((t, d, h), []).append(var)
+            by_room_time.setdefault((r, d, h), []).append(var)
+            by_teacher.setdefault(t, []).append(var)
+            by_demand.setdefault((b, s), []).append(var)
+            by_demand_day.setdefault((b, s, d), []).append(var)
+            by_demand_teacher.setdefault((b, s, t), []).append(var)
         
-        # Constraint 3: Each room can be used by at most one batch at any given time
-        for r in range(len(self.rooms)):
-            for d in range(len(self.days)):
-                for h in range(len(self.time_slots)):
-                    room_assignments = []
-                    for b in range(len(self.batches)):
-                        for t in range(len(self.teachers)):
-                            for s in range(len(self.subjects)):
-                                room_assignments.append(self.assignment[b][t][s][r][d][h])
-                    
-                    self.model.Add(sum(room_assignments) <= 1)
+        # Constraints 1-3: a batch, a teacher and a room hold at most one class at a time
+        for group in (by_batch_time, by_teacher_time, by_room_time):
+            for assignments_at_time in group.values():
+                if len(assignments_at_time) > 1:
+                    self.model.AddAtMostOne(assignments_at_time)
         
-        # Constraint 4: Campus-room consistency
-        for b in range(len(self.batches)):
-            batch_id = self.batches[b]
-            batch_campus = self.students_df[self.students_df['batch_id'] == batch_id].iloc[0]['primary_campus']
+        # Constraint 4: weekly hours per (batch, subject), at most one hour of it per day
+        # (re-solves of existing timetables pass per-day limits in demand['day_limits'])
+        demand_hours = {(demand['b'], demand['s']): demand['hours'] for demand in self.demands}
+        day_limits = {(demand['b'], demand['s']): demand.get('day_limits', {}) for demand in self.demands}
+        for key, assignments in by_demand.items():
+            self.model.Add(sum(assignments) <= demand_hours.get(key, len(assignments)))
+        for (b, s, d), assignments in by_demand_day.items():
+            limit = day_limits.get((b, s), {}).get(d, 1)
+            if limit == 1 and len(assignments) > 1:
+                self.model.AddAtMostOne(assignments)
+            elif len(assignments) > limit:
+                self.model.Add(sum(assignments) <= limit)
+        
+        # Constraint 5: one teacher per (batch, subject) for the whole week
+        shared_teachers = {(demand['b'], demand['s']) for demand in self.demands if not demand.get('single_teacher', True)}
+        teacher_choice = {}
+        for (b, s, t), assignments in by_demand_teacher.items():
+            if (b, s) in shared_teachers:
+                continue
+            choice = self.model.NewBoolVar(f'teaches_{b}_{s}_{t}')
+            teacher_choice.setdefault((b, s), []).append(choice)
+            self.model.Add(sum(assignments) <= len(self.days) * choice)
+        for choices in teacher_choice.values():
+            if len(choices) > 1:
+                self.model.AddAtMostOne(choices)
+        
+        # Constraint 6: teacher weekly workload
+        for t, assignments in by_teacher.items():
+            self.model.Add(sum(assignments) <= int(self.teacher_capacity[t]))
+        
+        # Campus-room consistency is enforced by only creating campus-compatible room variables
+        self.by_batch_time = by_batch_time
+        print("✅ Hard constraints added")
+    
+    def add_greedy_hint(self, fixed_keys=()):
+        """Hint a quick greedy timetable so the search starts from a good solution"""
+        busy = set(self.blocked)
+        teacher_hours = np.zeros(len(self.teachers))
+        hinted = set(fixed_keys)
+        for b, t, s, r, d, h in hinted:
+            busy.update({('b', b, d, h), ('t', t, d, h), ('r', r, d, h)})
+            teacher_hours[t] += 1
+        
+        # Demands with the fewest room options (labs) go first
+        for demand in sorted(self.demands, key=lambda dm: (len(dm['rooms']), dm['b'])):
+            b, s = demand['b'], demand['s']
+            teacher = next(
+                (t for t in demand['teachers'] if teacher_hours[t] + demand['hours'] <= self.teacher_capacity[t]),
+                None
+            )
+            if teacher is None:
+                continue
             
-            for r in range(len(self.rooms)):
-                room_id = self.rooms[r]
-                room_data = self.rooms_df[self.rooms_df['room_id'] == room_id]
+            placed_days = set()
+            taken_days = {d for d in range(len(self.days)) if ('bs', b, s, d) in busy}
+            for offset in range(len(self.days) * len(self.time_slots)):
+                if len(placed_days) >= demand['hours']:
+                    break
+                # Rotate the start per batch so batches don't all pile onto the same slots
+                d = (offset + b) % len(self.days)
+                h = (offset // len(self.days) + b) % len(self.time_slots)
+                if d in placed_days or d in taken_days or ('b', b, d, h) in busy or ('t', teacher, d, h) in busy:
+                    continue
+                room = next((r for r in demand['rooms'] if ('r', r, d, h) not in busy), None)
+                if room is None:
+                    continue
                 
-                if not room_data.empty:
-                    room_campus = room_data.iloc[0]['campus']
-                    
-                    # If room is not on batch's campus, prevent assignment
-                    if room_campus != batch_campus:
-                        for t in range(len(self.teachers)):
-                            for s in range(len(self.subjects)):
-                                for d in range(len(self.days)):
-                                    for h in range(len(self.time_slots)):
-                                        self.model.Add(self.assignment[b][t][s][r][d][h] == 0)
+                busy.update({('b', b, d, h), ('t', teacher, d, h), ('r', room, d, h)})
+                hinted.add((b, teacher, s, room, d, h))
+                placed_days.add(d)
+            teacher_hours[teacher] += len(placed_days)
         
-        print("✅ Hard constraints added")
+        return self.add_hint(hinted)
+    
+    def add_hint(self, keys):
+        """Hint the given (b, t, s, r, d, h) keys as the starting solution"""
+        hinted = set(keys)
+        for key, var in self.assignment.items():
+            self.model.AddHint(var, key in hinted)
+        
+        self.hinted_keys = [key for key in hinted if key in self.assignment]
+        return len(hinted)
     
     def add_soft_constraints(self):
         """Add soft constraints for optimization"""
         print("🎯 Adding soft constraints for optimization...")
         
-        # Objective: Minimize gaps in daily schedules
-        gap_penalties = []
+        # Objective: schedule as many demanded hours as possible...
+        coverage = sum(self.assignment.values())
         
-        for b in range(len(self.batches)):
+        # ...while penalizing batch days longer than 6 hours
+        overload_penalties = []
+        for b in {key[0] for key in self.by_batch_time}:
             for d in range(len(self.days)):
-                # Count gaps between classes
-                for h in range(len(self.time_slots) - 1):
-                    # Check if there's a class at time h but not at h+1
-                    has_class_h = []
-                    has_class_h_plus_1 = []
-                    
-                    for t in range(len(self.teachers)):
-                        for s in range(len(self.subjects)):
-                            for r in range(len(self.rooms)):
-                                has_class_h.append(self.assignment[b][t][s][r][d][h])
-                                has_class_h_plus_1.append(self.assignment[b][t][s][r][d][h+1])
-                    
-                    # Create gap indicator variable
-                    gap_var = self.model.NewBoolVar(f'gap_{b}_{d}_{h}')
-                    
-                    # Gap occurs if we have class at h, no class at h+1, but have class later
-                    class_at_h = self.model.NewBoolVar(f'class_at_{b}_{d}_{h}')
-                    class_at_h_plus_1 = self.model.NewBoolVar(f'class_at_{b}_{d}_{h+1}')
-                    
-                    self.model.Add(sum(has_class_h) >= class_at_h)
-                    self.model.Add(sum(has_class_h_plus_1) >= class_at_h_plus_1)
-                    
-                    gap_penalties.append(gap_var * 10)  # Penalty weight
+                day_classes = [
+                    var for h in range(len(self.time_slots))
+                    for var in self.by_batch_time.get((b, d, h), [])
+                ]
+                if len(day_classes) > 6:
+                    overload = self.model.NewIntVar(0, len(self.time_slots), f'overload_{b}_{d}')
+                    self.model.Add(overload >= sum(day_classes) - 6)
+                    overload_penalties.append(overload)
+        
+        # ...and, when re-solving, keeping slots where they currently are
+        kept = sum(self.assignment[key] for key in self.preferred_keys)
         
-        # Minimize total penalty
-        if gap_penalties:
-            self.model.Minimize(sum(gap_penalties))
+        self.model.Maximize(10 * coverage + kept - sum(overload_penalties))
         
         print("✅ Soft constraints added")
     
+    def configure_solver(self, time_limit=30.0, num_workers=8):
+        """Set CP-SAT search parameters"""
+        self.solver.parameters.max_time_in_seconds = time_limit
+        # A single worker gets no LNS / feasibility-jump workers and may not find any solution
+        self.solver.parameters.num_workers = max(num_workers, 4)
+        # Probing and symmetry detection alone can eat the whole budget on a full-university model
+        self.solver.parameters.symmetry_level = 0
+        self.solver.parameters.cp_model_probing_level = 0
+    
     def solve_constraints(self, existing_assignments=None):
         """Solve the constraint satisfaction problem"""
         print("🔍 Solving constraint satisfaction problem...")
         
+        # Start from a fresh model so repeated calls don't accumulate constraints
+        self.model = cp_model.CpModel()
+        
         # Create variables
-        self.create_variables()
+        self.create_variables(existing_assignments)
         
         # Add constraints
         self.add_hard_constraints()
@@ -200,9 +427,10 @@ class TimetableConstraintSolver:
         # Add existing assignments as constraints if provided
         if existing_assignments:
             self.add_existing_assignments(existing_assignments)
+        self.add_greedy_hint(self._assignment_keys(existing_assignments or []))
         
         # Solve
-        self.solver.parameters.max_time_in_seconds = 30.0  # 30 second timeout
+        self.configure_solver(time_limit=30.0)  # 30 second timeout
         status = self.solver.Solve(self.model)
         
         if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
@@ -212,81 +440,404 @@ class TimetableConstraintSolver:
             print("❌ No feasible solution found")
             return None
     
+    def solve_subproblem(self, demands, blocked=None, teacher_capacity=None, time_limit=30.0, num_workers=8,
+                         current_keys=None):
+        """Solve a subset of demands around blocked cells, returning the chosen (b, t, s, r, d, h) keys.
+        
+        current_keys warm-starts the search from an existing placement instead
+        of the greedy hint, and keeping those keys is rewarded in the objective.
+        teacher_capacity only applies to this solve.
+        """
+        self.model = cp_model.CpModel()
+        self.solver = cp_model.CpSolver()
+        
+        self.create_variables(demands=demands, blocked=blocked)
+        if current_keys is not None:
+            self.preferred_keys = set(current_keys) & set(self.assignment)
+        
+        # The model reads self.teacher_capacity; restore the weekly limits afterwards
+        weekly_capacity = self.teacher_capacity
+        if teacher_capacity is not None:
+            self.teacher_capacity = np.array(teacher_capacity, dtype=float)
+        try:
+            self.add_hard_constraints()
+            self.add_soft_constraints()
+            if current_keys is None:
+                self.add_greedy_hint()
+            else:
+                self.add_hint(current_keys)
+        finally:
+            self.teacher_capacity = weekly_capacity
+        
+        self.configure_solver(time_limit=time_limit, num_workers=num_workers)
+        status = self.solver.Solve(self.model)
+        
+        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+            return self.solution_keys()
+        
+        # Out of time before a first solution: keep the hinted assignment
+        print("⚠️ No solution within the time limit, keeping the hinted assignment")
+        return self.hinted_keys
+    
+    def solution_keys(self):
+        """(b, t, s, r, d, h) keys of the variables set in the last solve"""
+        keys = list(self.assignment)
+        if not keys:
+            return []
+        # Read every value from the response in one vectorized gather instead of a Value() call per variable
+        indices = np.fromiter((var.Index() for var in self.assignment.values()), dtype=np.int64, count=len(keys))
+        values = np.asarray(self.solver.ResponseProto().solution)[indices]
+        return [keys[i] for i in np.flatnonzero(values == 1)]
+    
+    def decompose(self, demands):
+        """Split demands into independent sub-problems.
+        
+        Demands are grouped by the batch's campus and then into connected
+        components (demands linked by a batch or a shared room). Rooms still
+        shared between groups, e.g. Campus-3 labs used by Campus-15B batches,
+        have their weekly slots dealt out between those groups in proportion
+        to expected use, so sub-problems never compete for a room. Teacher
+        weekly capacity is split the same way.
+        
+        Returns (groups, blocked, capacities): lists of demand lists, blocked
+        ('r', r, d, h) cells and teacher capacity arrays, one per group.
+        """
+        batch_campus = self.students_df.drop_duplicates('batch_id').set_index('batch_id')['primary_campus']
+        
+        # Union-find over demands: same batch, or same room within a campus
+        parent = list(range(len(demands)))
+        
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        
+        first_seen = {}
+        for i, demand in enumerate(demands):
+            campus = batch_campus[self.batches[demand['b']]]
+            for owner in [('b', demand['b'])] + [('r', campus, r) for r in demand['rooms']]:
+                if owner in first_seen:
+                    parent[find(i)] = find(first_seen[owner])
+                else:
+                    first_seen[owner] = i
+        
+        components = {}
+        for i, demand in enumerate(demands):
+            components.setdefault(find(i), []).append(demand)
+        groups = list(components.values())
+        
+        # Expected load of every room and teacher per group
+        room_load = [dict() for _ in groups]
+        teacher_load = np.zeros((len(groups), len(self.teachers)))
+        for g, group in enumerate(groups):
+            for demand in group:
+                for r in demand['rooms']:
+                    room_load[g][r] = room_load[g].get(r, 0) + demand['hours'] / len(demand['rooms'])
+                for t in demand['teachers']:
+                    teacher_load[g, t] += demand['hours'] / len(demand['teachers'])
+        
+        # Deal the weekly cells of shared rooms out by largest remaining share
+        cells = [(d, h) for d in range(len(self.days)) for h in range(len(self.time_slots))]
+        blocked = [set() for _ in groups]
+        for r in range(len(self.rooms)):
+            users = [g for g in range(len(groups)) if r in room_load[g]]
+            if len(users) < 2:
+                continue
+            total = sum(room_load[g][r] for g in users)
+            dealt = {g: 0 for g in users}
+            for n, (d, h) in enumerate(cells, start=1):
+                owner = max(users, key=lambda g: room_load[g][r] / total * n - dealt[g])
+                dealt[owner] += 1
+                for g in users:
+                    if g != owner:
+                        blocked[g].add(('r', r, d, h))
+        
+        total_teacher_load = teacher_load.sum(axis=0)
+        share = np.divide(teacher_load, total_teacher_load, out=np.zeros_like(teacher_load), where=total_teacher_load > 0)
+        capacities = [np.ceil(self.teacher_capacity * share[g]) for g in range(len(groups))]
+        
+        return groups, blocked, capacities
+    
+    def solve_decomposed(self, max_workers=None, time_limit=30.0):
+        """Solve campus/component sub-problems in parallel, then repair teacher conflicts.
+        
+        Every sub-problem runs in its own process with the full time limit, so
+        wall-clock time stays close to one sub-solve when there are enough cores.
+        """
+        print("🔍 Solving decomposed constraint problem...")
+        
+        demands = self.build_demands()
+        groups, blocked, capacities = self.decompose(demands)
+        
+        cpu_count = os.cpu_count() or 1
+        max_workers = max_workers or min(len(groups), cpu_count)
+        workers_per_solve = max(1, cpu_count // max_workers)
+        print(f"🧩 {len(groups)} independent sub-problems on {max_workers} processes")
+        
+        keys = []
+        jobs = [
+            (self.data_path, group, blocked[g], capacities[g], time_limit, workers_per_solve,
+             self.max_teacher_candidates, self.max_room_candidates)
+            for g, group in enumerate(groups)
+        ]
+        if max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                for group_keys in pool.map(_solve_subproblem, jobs):
+                    keys.extend(group_keys)
+        else:
+            for job in jobs:
+                keys.extend(_solve_subproblem(job))
+        
+        keys = self.repair_teacher_conflicts(demands, keys, time_limit)
+        return self.extract_solution(keys)
+    
+    def repair_teacher_conflicts(self, demands, keys, time_limit=30.0):
+        """Drop cross-sub-problem teacher clashes and re-solve only the hours they freed"""
+        kept = []
+        teacher_busy = set()
+        teacher_hours = np.zeros(len(self.teachers))
+        for key in sorted(keys):
+            b, t, s, r, d, h = key
+            if (t, d, h) in teacher_busy or teacher_hours[t] >= self.teacher_capacity[t]:
+                continue
+            teacher_busy.add((t, d, h))
+            teacher_hours[t] += 1
+            kept.append(key)
+        
+        dropped = len(keys) - len(kept)
+        if not dropped:
+            return kept
+        print(f"⚔️ Re-solving {dropped} slots with cross-campus teacher conflicts")
+        
+        # Everything kept is fixed: block its cells and keep each demand's teacher
+        blocked = set()
+        placed = {}
+        chosen_teacher = {}
+        for b, t, s, r, d, h in kept:
+            blocked.update({('b', b, d, h), ('t', t, d, h), ('r', r, d, h), ('bs', b, s, d)})
+            placed[(b, s)] = placed.get((b, s), 0) + 1
+            chosen_teacher[(b, s)] = t
+        
+        affected = {(key[0], key[2]) for key in set(keys) - set(kept)}
+        repair_demands = []
+        for demand in demands:
+            key = (demand['b'], demand['s'])
+            remaining = demand['hours'] - placed.get(key, 0)
+            if key in affected and remaining > 0:
+                teachers = [chosen_teacher[key]] if key in chosen_teacher else demand['teachers']
+                repair_demands.append(dict(demand, hours=remaining, teachers=teachers))
+        
+        repair = TimetableConstraintSolver(self.data_path, self.max_teacher_candidates, self.max_room_candidates)
+        repaired = repair.solve_subproblem(
+            repair_demands, blocked, self.teacher_capacity - teacher_hours, time_limit=time_limit
+        )
+        print(f"✅ Re-placed {len(repaired)} of {dropped} conflicting slots")
+        return kept + repaired
+    
+    def neighborhood(self, timetable_slots, seed_positions):
+        """Seed positions plus every slot sharing a seed's batch, teacher or room on the same day"""
+        seeds = set(seed_positions)
+        touched = {
+            (field, timetable_slots[p].get(field), timetable_slots[p].get('day'))
+            for p in seeds for _, field in CONFLICT_FIELDS
+            if timetable_slots[p].get(field) not in (None, '')
+        }
+        return seeds | {
+            p for p, slot in enumerate(timetable_slots)
+            if any((field, slot.get(field), slot.get('day')) in touched for _, field in CONFLICT_FIELDS)
+        }
+    
+    def resolve_neighborhood(self, timetable_slots, seed_positions, time_limit=5.0, num_workers=8):
+        """Warm-started re-solve of neighborhood(seed_positions), see resolve_positions"""
+        free = self.neighborhood(timetable_slots, seed_positions)
+        print(f"🎯 Re-solving {len(free)} slots around {len(set(seed_positions))} edited/conflicting slots")
+        return self.resolve_positions(timetable_slots, free, time_limit=time_limit, num_workers=num_workers)
+    
+    def resolve_positions(self, timetable_slots, positions, time_limit=5.0, num_workers=8):
+        """Warm-started re-solve of the slots at the given positions.
+        
+        All other slots stay fixed and only block their cells. The freed slots
+        keep batch, subject and teacher and may move to any free (day, hour)
+        and compatible room; the search starts from their current placement
+        and is rewarded for keeping it. Slots the solver has no variables for
+        (unknown ids, 17:00-18:00) always stay fixed.
+        Returns a new list of slot dicts in the same order.
+        """
+        keys = [self._slot_key(slot) for slot in timetable_slots]
+        free = sorted(p for p in set(positions) if None not in keys[p])
+        if not free:
+            return list(timetable_slots)
+        free_set = set(free)
+        
+        # Fixed slots block their cells and use up teacher hours and room time
+        blocked = set()
+        teacher_hours = np.zeros(len(self.teachers))
+        room_load = np.zeros(len(self.rooms))
+        day_counts = {}
+        for p, (b, t, s, r, d, h) in enumerate(keys):
+            if b is not None and s is not None and d is not None:
+                day_counts.setdefault((b, s), {}).setdefault(d, [0, 0])[p in free_set] += 1
+            if p in free_set or d is None or h is None:
+                continue
+            for kind, idx in (('b', b), ('t', t), ('r', r)):
+                if idx is not None:
+                    blocked.add((kind, idx, d, h))
+            if t is not None:
+                teacher_hours[t] += 1
+            if r is not None:
+                room_load[r] += 1
+        
+        groups = {}
+        for p in free:
+            groups.setdefault((keys[p][0], keys[p][2]), []).append(p)
+        
+        batch_campus = self.students_df.drop_duplicates('batch_id').set_index('batch_id')['primary_campus']
+        subject_rows = self.subjects_df.drop_duplicates('subject_code').set_index('subject_code')
+        slots_per_week = len(self.days) * len(self.time_slots)
+        freed_hours = np.zeros(len(self.teachers))
+        demands = []
+        for (b, s), positions in groups.items():
+            # Allow as many hours of the subject per day as the timetable already has
+            per_day = day_counts[(b, s)]
+            max_per_day = max(sum(counts) for counts in per_day.values())
+            day_limits = {d: max_per_day - per_day.get(d, [0, 0])[0] for d in range(len(self.days))}
+            for d, limit in day_limits.items():
+                if limit <= 0:
+                    blocked.add(('bs', b, s, d))
+            
+            # Each freed slot keeps its teacher, in its own room or a few spare compatible rooms
+            teachers = sorted({keys[p][1] for p in positions})
+            rooms = sorted({keys[p][3] for p in positions})
+            subject = subject_rows.loc[self.subjects[s]]
+            alternatives = [r for r in self._compatible_rooms(subject, batch_campus[self.batches[b]]) if r not in rooms]
+            spare = self._pick_least_loaded(
+                alternatives, room_load, lambda r: slots_per_week, len(positions), self.max_room_candidates
+            )
+            pairs = sorted({(keys[p][1], r) for p in positions for r in [keys[p][3]] + spare})
+            for p in positions:
+                freed_hours[keys[p][1]] += 1
+            demands.append({
+                'b': b,
+                's': s,
+                'hours': len(positions),
+                'teachers': teachers,
+                'rooms': rooms + spare,
+                'pairs': pairs,
+                'day_limits': day_limits,
+                'single_teacher': len(teachers) == 1
+            })
+        
+        # Teachers may stay over their weekly limit if the timetable already has them there
+        capacity = np.maximum(self.teacher_capacity - teacher_hours, freed_hours)
+        current = [keys[p] for p in free]
+        
+        local = TimetableConstraintSolver(self.data_path, self.max_teacher_candidates, self.max_room_candidates)
+        solved = local.solve_subproblem(
+            demands, blocked, capacity, time_limit=time_limit, num_workers=num_workers, current_keys=current
+        )
+        
+        # Slots whose key is still in the solution stay put, the others take the remaining keys
+        placed = {}
+        for key in solved:
+            placed.setdefault((key[0], key[2]), []).append(key)
+        result = list(timetable_slots)
+        moved = 0
+        for group, positions in groups.items():
+            available = placed.get(group, [])
+            pending = []
+            for p in positions:
+                if keys[p] in available:
+                    available.remove(keys[p])
+                else:
+                    pending.append(p)
+            for p, key in zip(pending, available):
+                result[p] = self._moved_slot(timetable_slots[p], key)
+                moved += 1
+        
+        print(f"✅ Moved {moved} of {len(free)} re-solved slots")
+        return result
+    
+    def _moved_slot(self, slot, key):
+        """Copy of a slot dict placed at a new (b, t, s, r, d, h) key"""
+        b, t, s, r, d, h = key
+        moved = dict(slot, day=self.days[d], room_id=self.rooms[r])
+        if 'time_start' in slot:
+            moved['time_start'], moved['time_end'] = self.time_slots[h].split('-')
+        if 'time_slot' in slot or 'time_start' not in slot:
+            moved['time_slot'] = self.time_slots[h]
+        
+        if self.teachers[t] != slot.get('teacher_id'):
+            teacher = self.teacher_info.get(self.teachers[t])
+            moved['teacher_id'] = self.teachers[t]
+            moved['teacher_name'] = teacher['name'] if teacher else self.teachers[t]
+        
+        room = self.room_info.get(self.rooms[r])
+        if room:
+            moved['room_name'] = room['room_name']
+            moved['campus'] = room['campus']
+        return moved
+    
     def add_existing_assignments(self, assignments):
         """Add existing assignments as fixed constraints"""
         print(f"📌 Adding {len(assignments)} existing assignments as constraints...")
         
-        for assignment in assignments:
+        for key in self._assignment_keys(assignments):
             try:
-                b = self.batch_to_idx.get(assignment.get('batch_id'))
-                t = self.teacher_to_idx.get(assignment.get('teacher_id'))
-                s = self.subject_to_idx.get(assignment.get('subject_code'))
-                r = self.room_to_idx.get(assignment.get('room_id'))
-                d = self.day_to_idx.get(assignment.get('day'))
-                h = self.time_to_idx.get(assignment.get('time_slot'))
-                
-                if all(x is not None for x in [b, t, s, r, d, h]):
-                    # Fix this assignment
-                    self.model.Add(self.assignment[b][t][s][r][d][h] == 1)
+                # Fix this assignment
+                self.model.Add(self.assignment[key] == 1)
                 
             except Exception as e:
                 print(f"⚠️ Error adding assignment constraint: {e}")
     
-    def extract_solution(self):
-        """Extract solution from solved model"""
+    def extract_solution(self, keys=None):
+        """Extract solution from solved model (or from given (b, t, s, r, d, h) keys)"""
         print("📊 Extracting solution...")
         
         solution = []
         
-        for b in range(len(self.batches)):
-            for t in range(len(self.teachers)):
-                for s in range(len(self.subjects)):
-                    for r in range(len(self.rooms)):
-                        for d in range(len(self.days)):
-                            for h in range(len(self.time_slots)):
-                                if self.solver.Value(self.assignment[b][t][s][r][d][h]) == 1:
-                                    # Get batch info
-                                    batch_id = self.batches[b]
-                                    batch_info = self.students_df[self.students_df['batch_id'] == batch_id].iloc[0]
-                                    
-                                    # Get subject info
-                                    subject_code = self.subjects[s]
-                                    subject_info = self.subjects_df[self.subjects_df['subject_code'] == subject_code]
-                                    subject_name = subject_info.iloc[0]['subject_name'] if not subject_info.empty else subject_code
-                                    
-                                    # Get teacher info
-                                    teacher_id = self.teachers[t]
-                                    teacher_info = self.teachers_df[self.teachers_df['teacher_id'] == teacher_id]
-                                    teacher_name = teacher_info.iloc[0]['name'] if not teacher_info.empty else teacher_id
-                                    
-                                    # Get room info
-                                    room_id = self.rooms[r]
-                                    room_info = self.rooms_df[self.rooms_df['room_id'] == room_id]
-                                    room_name = room_info.iloc[0]['room_name'] if not room_info.empty else room_id
-                                    
-                                    assignment = {
-                                        'batch_id': batch_id,
-                                        'section': batch_info['section'],
-                                        'day': self.days[d],
-                                        'time_slot': self.time_slots[h],
-                                        'subject_code': subject_code,
-                                        'subject_name': subject_name,
-                                        'teacher_id': teacher_id,
-                                        'teacher_name': teacher_name,
-                                        'room_id': room_id,
-                                        'room_name': room_name,
-                                        'campus': batch_info['primary_campus'],
-                                        'activity_type': 'Lab' if (not subject_info.empty and subject_info.iloc[0]['has_lab']) else 'Lecture',
-                                        'department': batch_info['department']
-                                    }
-                                    
-                                    solution.append(assignment)
+        if keys is None:
+            keys = self.solution_keys()
+        
+        for (b, t, s, r, d, h) in keys:
+            batch_id = self.batches[b]
+            subject_code = self.subjects[s]
+            teacher_id = self.teachers[t]
+            room_id = self.rooms[r]
+            
+            batch = self.batch_info[batch_id]
+            subject = self.subject_info.get(subject_code)
+            teacher = self.teacher_info.get(teacher_id)
+            room = self.room_info.get(room_id)
+            
+            assignment = {
+                'batch_id': batch_id,
+                'section': batch['section'],
+                'day': self.days[d],
+                'time_slot': self.time_slots[h],
+                'subject_code': subject_code,
+                'subject_name': subject['subject_name'] if subject else subject_code,
+                'teacher_id': teacher_id,
+                'teacher_name': teacher['name'] if teacher else teacher_id,
+                'room_id': room_id,
+                'room_name': room['room_name'] if room else room_id,
+                'campus': room['campus'] if room else batch['primary_campus'],
+                'activity_type': 'Lab' if (subject and str(subject['lab_required']).lower() == 'true') else 'Lecture',
+                'department': batch['department']
+            }
+            
+            solution.append(assignment)
         
         print(f"✅ Extracted {len(solution)} assignments from solution")
         return solution
     
-    def fix_constraint_violations(self, timetable_slots):
-        """Fix constraint violations in existing timetable"""
+    def fix_constraint_violations(self, timetable_slots, incremental=True):
+        """Fix constraint violations in existing timetable.
+        
+        By default only the neighborhood of the conflicting slots is re-solved
+        (see resolve_neighborhood); incremental=False regenerates the timetable
+        around the non-conflicting slots.
+        """
         print(f"🔧 Fixing constraint violations in {len(timetable_slots)} slots...")
         
         violations = self.detect_violations(timetable_slots)
@@ -296,9 +847,19 @@ class TimetableConstraintSolver:
             return timetable_slots
         
         print(f"🚨 Found {len(violations)} violations")
+        conflicting = self.conflicting_positions(timetable_slots)
+        
+        if incremental:
+            fixed = self.resolve_neighborhood(timetable_slots, conflicting)
+            remaining = self.detect_violations(fixed)
+            if not remaining:
+                print("✅ Constraint violations fixed")
+                return fixed
+            print(f"⚠️ {len(remaining)} violations left after re-solve, applying best effort fixes")
+            return self.best_effort_fix(fixed, remaining)
         
         # Try to solve with existing assignments as much as possible
-        valid_assignments = [slot for slot in timetable_slots if not self.has_violation(slot, timetable_slots)]
+        valid_assignments = [slot for i, slot in enumerate(timetable_slots) if i not in conflicting]
         
         # Solve for a new solution
         solution = self.solve_constraints(valid_assignments)
@@ -310,61 +871,51 @@ class TimetableConstraintSolver:
             print("⚠️ Could not fix all violations, returning original with best effort fixes")
             return self.best_effort_fix(timetable_slots, violations)
     
+    @staticmethod
+    def _slot_time(slot):
+        """Time slot key for a slot dict, deriving it from time_start/time_end if needed"""
+        if slot.get('time_slot'):
+            return slot['time_slot']
+        if slot.get('time_start') and slot.get('time_end'):
+            return f"{slot['time_start']}-{slot['time_end']}"
+        return None
+    
+    def index_conflicts(self, timetable_slots):
+        """Single-pass hash index of clashing slots.
+        
+        Returns {(conflict_type, day, time_slot, resource_id): [slot positions]}
+        for every (day, time, teacher/room/batch) key used by two or more slots.
+        """
+        index = {}
+        for position, slot in enumerate(timetable_slots):
+            day = slot.get('day')
+            time_slot = self._slot_time(slot)
+            for conflict_type, field in CONFLICT_FIELDS:
+                resource = slot.get(field)
+                if resource is None or resource == '':
+                    continue
+                index.setdefault((conflict_type, day, time_slot, resource), []).append(position)
+        
+        return {key: positions for key, positions in index.items() if len(positions) > 1}
+    
+    def conflicting_positions(self, timetable_slots):
+        """Positions of all slots involved in at least one conflict"""
+        return {position for positions in self.index_conflicts(timetable_slots).values() for position in positions}
+    
     def detect_violations(self, timetable_slots):
         """Detect constraint violations in timetable"""
         violations = []
         
-        # Group by time slots to check conflicts
-        time_slots_map = {}
-        
-        for slot in timetable_slots:
-            key = f"{slot['day']}_{slot['time_slot']}"
-            if key not in time_slots_map:
-                time_slots_map[key] = []
-            time_slots_map[key].append(slot)
-        
-        # Check for conflicts
-        for time_key, slots in time_slots_map.items():
-            if len(slots) > 1:
-                # Check teacher conflicts
-                teachers = [slot['teacher_id'] for slot in slots]
-                if len(teachers) != len(set(teachers)):
-                    violations.append({
-                        'type': 'teacher_conflict',
-                        'time': time_key,
-                        'slots': slots
-                    })
-                
-                # Check room conflicts
-                rooms = [slot['room_id'] for slot in slots]
-                if len(rooms) != len(set(rooms)):
-                    violations.append({
-                        'type': 'room_conflict',
-                        'time': time_key,
-                        'slots': slots
-                    })
+        for (conflict_type, day, time_slot, resource), positions in self.index_conflicts(timetable_slots).items():
+            violations.append({
+                'type': conflict_type,
+                'time': f"{day}_{time_slot}",
+                'resource': resource,
+                'slots': [timetable_slots[position] for position in positions]
+            })
         
         return violations
     
-    def has_violation(self, slot, all_slots):
-        """Check if a single slot has violations"""
-        day_time = f"{slot['day']}_{slot['time_slot']}"
-        
-        for other_slot in all_slots:
-            if other_slot == slot:
-                continue
-                
-            other_day_time = f"{other_slot['day']}_{other_slot['time_slot']}"
-            
-            if day_time == other_day_time:
-                # Same time slot
-                if slot['teacher_id'] == other_slot['teacher_id']:
-                    return True  # Teacher conflict
-                if slot['room_id'] == other_slot['room_id']:
-                    return True  # Room conflict
-        
-        return False
-    
     def best_effort_fix(self, timetable_slots, violations):
         """Best effort fix for violations"""
         print("🔨 Applying best effort fixes...")
@@ -391,10 +942,19 @@ class TimetableConstraintSolver:
         
         return fixed_slots
     
-    def optimize_schedule(self, timetable_slots):
-        """Optimize schedule for better distribution"""
+    def optimize_schedule(self, timetable_slots, changed_positions=None, time_limit=5.0):
+        """Optimize schedule for better distribution.
+        
+        With changed_positions (indices of edited slots) only their neighborhood
+        and any conflicting slots are re-solved, warm-started from the current
+        timetable; everything else stays where it is.
+        """
         print("⚡ Optimizing schedule distribution...")
         
+        if changed_positions is not None:
+            seeds = set(changed_positions) | self.conflicting_positions(timetable_slots)
+            return self.resolve_neighborhood(timetable_slots, seeds, time_limit=time_limit)
+        
         # This is a simplified optimization
         # In a real system, this would use more sophisticated algorithms
         
@@ -405,6 +965,12 @@ class TimetableConstraintSolver:
         else:
             return timetable_slots
 
+def _solve_subproblem(job):
+    """Process-pool entry point: solve one decomposed sub-problem"""
+    data_path, demands, blocked, teacher_capacity, time_limit, num_workers, max_teachers, max_rooms = job
+    solver = TimetableConstraintSolver(data_path, max_teachers, max_rooms)
+    return solver.solve_subproblem(demands, blocked, teacher_capacity, time_limit, num_workers)
+
 def main():
     """Main function to test constraint solver"""
     print("🚀 Starting Constraint Solver Process...")
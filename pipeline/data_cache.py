@@ -0,0 +1,121 @@
+"""
+Columnar Data Cache Module
+Materializes the data/*.csv reference files into hashed Feather files for fast pipeline startup
+"""
+
+import hashlib
+import glob
+import os
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional - fall back to plain CSV parsing
+    feather = None
+
+# Id and enum columns stored as categoricals; free text such as subject_expertise stays object
+CATEGORICAL_COLUMNS = (
+    'batch_id', 'section', 'department', 'scheme', 'primary_campus', 'campus', 'preferred_campus',
+    'lab_campus', 'designation', 'type', 'room_type', 'activity_type', 'slot_type', 'day_of_week', 'status',
+)
+
+
+class ColumnarDataCache:
+    """Lazily loaded Feather cache for the reference CSVs.
+
+    Each CSV is converted once into <cache_dir>/<name>-<hash>.feather where the
+    hash covers the CSV path, mtime and size, so an edited CSV never serves a
+    stale cache file. Frames are memoized per process and shared between
+    callers, so callers must not mutate them in place.
+    """
+
+    def __init__(self, data_path='data/', cache_dir=None):
+        self.data_path = data_path
+        self.cache_dir = cache_dir or os.path.join(data_path, '.cache')
+        self._frames = {}
+
+    def _csv_path(self, name):
+        filename = name if name.endswith('.csv') else f'{name}.csv'
+        return os.path.join(self.data_path, filename)
+
+    def _cache_key(self, csv_path):
+        stat = os.stat(csv_path)
+        # The column list is part of the key, so changing it never serves old dtypes
+        fingerprint = f"{os.path.abspath(csv_path)}:{stat.st_mtime_ns}:{stat.st_size}:{','.join(CATEGORICAL_COLUMNS)}"
+        return hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
+
+    def _cache_path(self, csv_path, cache_key):
+        stem = os.path.splitext(os.path.basename(csv_path))[0]
+        return os.path.join(self.cache_dir, f'{stem}-{cache_key}.feather')
+
+    def _optimize_dtypes(self, df):
+        """Convert the CATEGORICAL_COLUMNS text columns to categoricals"""
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns and (df[col].dtype == object or pd.api.types.is_string_dtype(df[col])):
+                df[col] = df[col].astype('category')
+        return df
+
+    def _write_cache(self, df, csv_path, cache_path):
+        """Write a fresh cache file and remove older versions of the same CSV"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(csv_path))[0]
+        for old_path in glob.glob(os.path.join(self.cache_dir, f'{stem}-*.feather')):
+            if old_path != cache_path:
+                os.remove(old_path)
+
+        # Write to a temp file first so concurrent readers never see a partial file
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        feather.write_feather(df, tmp_path)
+        os.replace(tmp_path, cache_path)
+
+    def load(self, name):
+        """Load a reference file as a DataFrame, using the columnar cache when fresh"""
+        csv_path = self._csv_path(name)
+        cache_key = self._cache_key(csv_path)
+
+        memoized = self._frames.get(csv_path)
+        if memoized is not None and memoized[0] == cache_key:
+            return memoized[1]
+
+        df = None
+        cache_path = self._cache_path(csv_path, cache_key)
+
+        if feather is not None and os.path.exists(cache_path):
+            try:
+                df = feather.read_table(cache_path, memory_map=True).to_pandas()
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable cache {cache_path}: {e}")
+                df = None
+
+        if df is None:
+            df = self._optimize_dtypes(pd.read_csv(csv_path))
+            if feather is not None:
+                try:
+                    self._write_cache(df, csv_path, cache_path)
+                except Exception as e:
+                    print(f"⚠️ Could not write columnar cache for {csv_path}: {e}")
+
+        self._frames[csv_path] = (cache_key, df)
+        return df
+
+    def clear(self):
+        """Remove all cache files and memoized frames"""
+        self._frames = {}
+        for path in glob.glob(os.path.join(self.cache_dir, '*.feather')):
+            os.remove(path)
+
+
+_caches = {}
+
+
+def read_reference_csv(data_path, name):
+    """Read data/<name>.csv through the per-process columnar cache.
+
+    Text columns named in CATEGORICAL_COLUMNS come back as categoricals (use
+    .astype(object) before fillna or assigning new values); all other text
+    columns are plain object columns, as from pd.read_csv.
+    """
+    key = os.path.abspath(data_path)
+    if key not in _caches:
+        _caches[key] = ColumnarDataCache(data_path)
+    return _caches[key].load(name)
@@ -6,7 +6,7 @@ Creates optimized dataset with only relevant columns for training
 import pandas as pd
 import os
 import numpy as np
-from datetime import datetime
+from pipeline.data_cache import read_reference_csv
 
 class TimetableDataOptimizer:
     def __init__(self, data_path='data/'):
@@ -32,23 +32,23 @@ class TimetableDataOptimizer:
         print("Loading CSV files...")
         
         try:
-            # Load all required CSV files
-            students_df = pd.read_csv(f'{self.data_path}students.csv')
-            teachers_df = pd.read_csv(f'{self.data_path}teachers.csv')
-            subjects_df = pd.read_csv(f'{self.data_path}subjects.csv')
-            rooms_df = pd.read_csv(f'{self.data_path}rooms.csv')
-            activities_df = pd.read_csv(f'{self.data_path}activities.csv')
-            slot_indexes_df = pd.read_csv(f'{self.data_path}slot_index.csv')
+            # Load all required CSV files (through the columnar cache)
+            students_df = read_reference_csv(self.data_path, 'students')
+            teachers_df = read_reference_csv(self.data_path, 'teachers')
+            subjects_df = read_reference_csv(self.data_path, 'subjects')
+            rooms_df = read_reference_csv(self.data_path, 'rooms')
+            activities_df = read_reference_csv(self.data_path, 'activities')
+            slot_indexes_df = read_reference_csv(self.data_path, 'slot_index')
             
-            print(f"Loaded: {len(students_df)} students, {len(teachers_df)} teachers") if students_df)} students, {len(teachers_df) if students_df)} students, {len(teachers_df)} teachers") if students_df)} students, {len(teachers_df is not None else 0} teachers" is not None else 0
-            print(f"Loaded: {len(subjects_df)} subjects, {len(rooms_df)} rooms") if subjects_df)} subjects, {len(rooms_df) if subjects_df)} subjects, {len(rooms_df)} rooms") if subjects_df)} subjects, {len(rooms_df is not None else 0} rooms" is not None else 0
+            print(f"Loaded: {len(students_df)} students, {len(teachers_df)} teachers")
+            print(f"Loaded: {len(subjects_df)} subjects, {len(rooms_df)} rooms")
             
             # Create optimized training dataset
             optimized_rows = []
             
             # Get unique batches from students
             unique_batches = students_df['batch_id'].unique()
-            print(f"Processing {len(unique_batches)} unique batches...") if unique_batches) if unique_batches)} unique batches...") if unique_batches is not None else 0} unique batches..." is not None else 0
+            print(f"Processing {len(unique_batches)} unique batches...")
             
             # Define time slots for scheduling
             time_slots = [
@@ -58,7 +58,7 @@ class TimetableDataOptimizer:
             
             days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
             
-            for batch_id in ((unique_batches[:10] or []) or []):  # Process first 10 batches for optimization
+            for batch_id in unique_batches[:10]:  # Process first 10 batches for optimization
                 # Get batch info
                 batch_students = students_df[students_df['batch_id'] == batch_id]
                 if batch_students.empty:
@@ -68,14 +68,14 @@ class TimetableDataOptimizer:
                 department = batch_info['department']
                 scheme = batch_info['scheme']
                 primary_campus = batch_info['primary_campus']
-                batch_size = len(batch_students) if batch_students is not None else 0 if batch_students is not None else 0
+                batch_size = len(batch_students)
                 
                 # Get subjects for this department
                 dept_subjects = subjects_df[subjects_df['department'] == department]
                 
                 # Create optimized rows for each time slot
-                for day in ((days or []) or []):
-                    for time_slot in ((time_slots or []) or []):
+                for day in days:
+                    for time_slot in time_slots:
                         if not dept_subjects.empty:
                             subject = dept_subjects.sample(1).iloc[0]
                             
@@ -105,7 +105,7 @@ class TimetableDataOptimizer:
             
             # Create optimized DataFrame
             self.optimized_data = pd.DataFrame(optimized_rows)
-            print(f"Created optimized dataset with {len(self.optimized_data)} rows and {len(self.optimized_data.columns)} columns") if self.optimized_data)} rows and {len(self.optimized_data.columns) if self.optimized_data)} rows and {len(self.optimized_data.columns)} columns") if self.optimized_data)} rows and {len(self.optimized_data.columns is not None else 0} columns" is not None else 0
+            print(f"Created optimized dataset with {len(self.optimized_data)} rows and {len(self.optimized_data.columns)} columns")
             
             return self.optimized_data
             
@@ -128,12 +128,12 @@ class TimetableDataOptimizer:
         # Encode categorical features
         categorical_cols = [col for col, dtype in self.essential_columns.items() if dtype == 'categorical']
         
-        for col in ((categorical_cols or []) or []):
+        for col in categorical_cols:
             if col in encoded_data.columns:
                 le = LabelEncoder()
                 encoded_data[col] = le.fit_transform(encoded_data[col].astype(str))
                 encoders[col] = le
-                print(f"Encoded {col}: {len(le.classes_)} unique values") if le.classes_) if le.classes_)} unique values") if le.classes_ is not None else 0} unique values" is not None else 0
+                print(f"Encoded {col}: {len(le.classes_)} unique values")
         
         # Scale numerical features
         numerical_cols = [col for col, dtype in self.essential_columns.items() if dtype == 'numerical']
@@ -180,11 +180,11 @@ class TimetableDataOptimizer:
         
         # Create sequences for training
         sequences = []
-        for i in ((range(len(feature_matrix) - sequence_length + 1) or []) if feature_matrix) - sequence_length + 1) or [] is not None else 0 or []) if feature_matrix) - sequence_length + 1) or []) if feature_matrix) - sequence_length + 1) or [] is not None else 0 or [] is not None else 0:
+        for i in range(len(feature_matrix) - sequence_length + 1):
             sequences.append(feature_matrix[i:i + sequence_length])
         
         sequences = np.array(sequences)
-        print(f"Created {len(sequences)} training sequences of length {sequence_length}") if sequences) if sequences)} training sequences of length {sequence_length}") if sequences is not None else 0} training sequences of length {sequence_length}" is not None else 0
+        print(f"Created {len(sequences)} training sequences of length {sequence_length}")
         print(f"Each sequence shape: {sequences[0].shape}")
         
         return sequences, encoders
@@ -195,7 +195,7 @@ class TimetableDataOptimizer:
             return
         
         print("\n=== Data Optimization Analysis ===")
-        print(f"Optimized columns: {len(self.optimized_data.columns)}") if self.optimized_data.columns) if self.optimized_data.columns)}") if self.optimized_data.columns is not None else 0}" is not None else 0
+        print(f"Optimized columns: {len(self.optimized_data.columns)}")
         print(f"Essential features only: {list(self.optimized_data.columns)}")
         print(f"Data types: {dict(self.optimized_data.dtypes)}")
         print(f"Memory usage: {self.optimized_data.memory_usage(deep=True).sum() / 1024:.2f} KB")
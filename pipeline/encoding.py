@@ -9,6 +9,19 @@ from sklearn.preprocessing import LabelEncoder, OneHotEncoder
 import pickle
 import os
 from datetime import datetime
+from pipeline.data_cache import read_reference_csv
+
+# (encoder name, slot dict key) in the order fields appear in the feature vector
+SLOT_FIELDS = [
+    ('section', 'section'),
+    ('subject', 'subject_code'),
+    ('teacher', 'teacher_id'),
+    ('room', 'room_id'),
+    ('day', 'day'),
+    ('time', 'time_slot'),
+    ('campus', 'campus'),
+    ('activity', 'activity_type'),
+]
 
 class TimetableEncoder:
     def __init__(self):
@@ -33,17 +46,48 @@ class TimetableEncoder:
         }
         
         self.feature_dim = 0
+        self.fitted = False
+        
+        # Lookup tables for vectorized encoding, rebuilt after fit/load
+        self.field_offsets = np.zeros(len(SLOT_FIELDS), dtype=np.int64)
+        self.field_widths = np.zeros(len(SLOT_FIELDS), dtype=np.int64)
+        self.class_to_index = {}
+        self.field_classes = []
+        self.segment_positions = np.zeros((len(SLOT_FIELDS), 0), dtype=np.int64)
+        self.segment_mask = np.zeros((len(SLOT_FIELDS), 0), dtype=bool)
+        
+    def _build_lookup_tables(self):
+        """Precompute per-field offsets, widths and class -> index dicts"""
+        offset = 0
+        self.field_classes = []
+        for i, (field, _) in enumerate(SLOT_FIELDS):
+            classes = self.encoders[field].classes_
+            self.field_offsets[i] = offset
+            self.field_widths[i] = len(classes)
+            self.class_to_index[field] = {value: idx for idx, value in enumerate(classes)}
+            self.field_classes.append(np.asarray(classes, dtype=object))
+            offset += len(classes)
+        self.feature_dim = offset
+        
+        # (fields, max_width) gather table so all field segments of a feature
+        # matrix can be arg-maxed at once; padded positions are masked out
+        max_width = int(self.field_widths.max()) if len(SLOT_FIELDS) else 0
+        columns = np.arange(max_width)
+        self.segment_mask = columns[None, :] < self.field_widths[:, None]
+        self.segment_positions = np.where(
+            self.segment_mask, self.field_offsets[:, None] + columns[None, :], 0
+        )
         
     def fit_encoders(self, data_path='data/'):
         """Fit all encoders on the available data"""
         print("🔄 Loading CSV data for encoding...")
         
-        # Load all CSV files
-        students_df = pd.read_csv(os.path.join(data_path, 'students.csv'))
-        teachers_df = pd.read_csv(os.path.join(data_path, 'teachers.csv'))
-        subjects_df = pd.read_csv(os.path.join(data_path, 'subjects.csv'))
-        rooms_df = pd.read_csv(os.path.join(data_path, 'rooms.csv'))
-        activities_df = pd.read_csv(os.path.join(data_path, 'activities.csv'))
+        # Load all CSV files (through the columnar cache)
+        students_df = read_reference_csv(data_path, 'students')
+        teachers_df = read_reference_csv(data_path, 'teachers')
+        subjects_df = read_reference_csv(data_path, 'subjects')
+        rooms_df = read_reference_csv(data_path, 'rooms')
+        activities_df = read_reference_csv(data_path, 'activities')
         
         print("📊 Fitting encoders on data...")
         
@@ -89,6 +133,9 @@ class TimetableEncoder:
             len(all_campuses) + len(activity_types)
         )
         
+        self._build_lookup_tables()
+        self.fitted = True
+        
         print(f"✅ Encoders fitted successfully! Feature dimension: {self.feature_dim}")
         return self
     
@@ -151,15 +198,96 @@ class TimetableEncoder:
             print(f"⚠️ Error encoding slot: {e}")
             return np.zeros(self.feature_dim)
     
+    def _one_hot(self, field_indices):
+        """Scatter (n, fields) category indices into a (n, feature_dim) float32 matrix"""
+        n = field_indices.shape[0]
+        matrix = np.zeros((n, self.feature_dim), dtype=np.float32)
+        rows = np.arange(n)
+        
+        for i in range(len(SLOT_FIELDS)):
+            idx = field_indices[:, i]
+            valid = idx >= 0
+            matrix[rows[valid], self.field_offsets[i] + idx[valid]] = 1.0
+        
+        return matrix
+    
+    def indices_to_dense(self, field_indices):
+        """Expand compact (..., fields) indices back into one-hot feature vectors"""
+        field_indices = np.asarray(field_indices)
+        lead_shape = field_indices.shape[:-1]
+        flat = field_indices.reshape(-1, len(SLOT_FIELDS)).astype(np.int64)
+        return self._one_hot(flat).reshape(*lead_shape, self.feature_dim)
+    
+    def encode_indices(self, slots):
+        """Encode a list of slot dicts into a compact (n, 8) int16 matrix.
+        
+        Each column holds the category index of one field (see SLOT_FIELDS);
+        unknown or missing values are stored as -1.
+        """
+        slots = list(slots)
+        field_indices = np.full((len(slots), len(SLOT_FIELDS)), -1, dtype=np.int16)
+        
+        for i, (field, key) in enumerate(SLOT_FIELDS):
+            lookup = self.class_to_index[field]
+            if key == 'time_slot':
+                values = (self._slot_time(slot) for slot in slots)
+            else:
+                values = (slot.get(key) for slot in slots)
+            field_indices[:, i] = np.fromiter(
+                (lookup.get(value, -1) for value in values), dtype=np.int16, count=len(slots)
+            )
+        
+        return field_indices
+    
+    def encode_frame_indices(self, df):
+        """Encode a timetable DataFrame into a compact (n, 8) int16 matrix"""
+        field_indices = np.full((len(df), len(SLOT_FIELDS)), -1, dtype=np.int16)
+        
+        for i, (field, key) in enumerate(SLOT_FIELDS):
+            if key in df.columns:
+                column = df[key]
+            elif key == 'time_slot' and {'time_start', 'time_end'} <= set(df.columns):
+                column = df['time_start'].astype(str) + '-' + df['time_end'].astype(str)
+            else:
+                continue
+            
+            mapped = column.astype(object).map(self.class_to_index[field])
+            field_indices[:, i] = mapped.fillna(-1).astype(np.int16).to_numpy()
+        
+        return field_indices
+    
+    def encode_many(self, slots):
+        """Encode a list of slot dicts into a (n, feature_dim) float32 matrix.
+        
+        Unknown or missing values leave their field block all-zero instead of
+        invalidating the whole row.
+        """
+        return self._one_hot(self.encode_indices(slots).astype(np.int64))
+    
+    def encode_frame(self, df):
+        """Encode a timetable DataFrame into a (n, feature_dim) float32 matrix"""
+        return self._one_hot(self.encode_frame_indices(df).astype(np.int64))
+    
+    @staticmethod
+    def _slot_time(slot):
+        """Time slot key for a slot dict, deriving it from time_start/time_end if needed"""
+        if slot.get('time_slot'):
+            return slot['time_slot']
+        if slot.get('time_start') and slot.get('time_end'):
+            return f"{slot['time_start']}-{slot['time_end']}"
+        return None
+    
     def load_encoders(self, filepath='pipeline/models/encoders.pkl'):
         """Load fitted encoders from file"""
         try:
             with open(filepath, 'rb') as f:
                 encoder_data = pickle.load(f)
             
-            self.label_encoders = encoder_data['label_encoders']
-            self.time_encoder = encoder_data['time_encoder']
-            self.activity_encoder = encoder_data['activity_encoder']
+            self.encoders = encoder_data['encoders']
+            for field, encoder in self.encoders.items():
+                setattr(self, f'{field}_encoder', encoder)
+            
+            self._build_lookup_tables()
             self.fitted = True
             print(f"📥 Encoders loaded from {filepath}")
             
@@ -167,25 +295,68 @@ class TimetableEncoder:
             print(f"❌ Error loading encoders: {e}")
             self.fitted = False
     
-    def decode_slot(self, encoded_vector):
-        """Decode feature vector back to slot data"""
+    def _segment_scores(self, matrix):
+        """Gather a (n, feature_dim) matrix into (n, fields, max_width) per-field scores"""
+        scores = np.asarray(matrix, dtype=np.float32)[:, self.segment_positions]
+        scores[:, ~self.segment_mask] = -np.inf
+        return scores
+    
+    def decode_indices(self, matrix, top_k=None):
+        """Segment-wise argmax of a (n, feature_dim) matrix.
+        
+        Returns (n, fields) category indices, or with top_k a pair of
+        (n, fields, k) indices and scores ordered best first.
+        """
+        scores = self._segment_scores(np.atleast_2d(matrix))
+        
+        if not top_k:
+            return scores.argmax(axis=-1)
+        
+        k = min(top_k, scores.shape[-1])
+        top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        top_scores = np.take_along_axis(scores, top, axis=-1)
+        order = np.argsort(-top_scores, axis=-1)
+        return np.take_along_axis(top, order, axis=-1), np.take_along_axis(top_scores, order, axis=-1)
+    
+    def decode_many(self, matrix, top_k=None):
+        """Decode a (seq_len, feature_dim) reconstruction into slot dicts in one pass.
+        
+        With top_k, each slot also gets a 'candidates' dict mapping every field
+        to its k best (value, score) pairs.
+        """
         if not self.fitted:
             print("⚠️ Encoders not fitted")
-            return {}
+            return []
+        
+        matrix = np.atleast_2d(matrix)
+        if top_k:
+            top_indices, top_scores = self.decode_indices(matrix, top_k=top_k)
+            best = top_indices[..., 0]
+        else:
+            best = self.decode_indices(matrix)
         
+        columns = {key: self.field_classes[i][best[:, i]] for i, (_, key) in enumerate(SLOT_FIELDS)}
+        decoded = pd.DataFrame(columns).to_dict('records')
+        
+        if top_k:
+            widths = self.field_widths
+            for row, slot in enumerate(decoded):
+                slot['candidates'] = {
+                    key: [
+                        (self.field_classes[i][idx], float(score))
+                        for idx, score in zip(top_indices[row, i], top_scores[row, i])
+                        if idx < widths[i]
+                    ]
+                    for i, (_, key) in enumerate(SLOT_FIELDS)
+                }
+        
+        return decoded
+    
+    def decode_slot(self, encoded_vector, top_k=None):
+        """Decode feature vector back to slot data"""
         try:
-            # This is a simplified decoder - in practice would need more sophisticated mapping
-            decoded = {
-                'section': 'A01',
-                'subject_code': 'GEN101', 
-                'teacher_id': 'TCH1001',
-                'room_id': 'R301',
-                'day': 'Monday',
-                'time_slot': '08:00-09:00',
-                'campus': 'Campus-3',
-                'activity_type': 'Lecture'
-            }
-            return decoded
+            decoded = self.decode_many(encoded_vector, top_k=top_k)
+            return decoded[0] if decoded else {}
             
         except Exception as e:
             print(f"❌ Error decoding slot: {e}")
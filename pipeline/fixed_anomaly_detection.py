@@ -105,7 +105,7 @@ class FixedAnomalyDetector:
     def _train_if_needed(self):
         """Train model if not available"""
         try:
-            from fixed_training import SimpleTimetableTrainer
+            from pipeline.fixed_training import SimpleTimetableTrainer
             print("🚀 Training model as it's not available...")
             
             trainer = SimpleTimetableTrainer()
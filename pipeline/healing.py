@@ -3,15 +3,23 @@ Automated Reconstruction (Self-Healing) Module
 Fixes anomalous timetable slots using autoencoder reconstruction and constraint solving
 """
 
-import torch
-import torch.nn as nn
 import numpy as np
-import pandas as pd
 import pickle
 import os
 from datetime import datetime
-from encoding import TimetableEncoder
-from anomaly_detection import AnomalyDetector
+from pipeline.encoding import TimetableEncoder, SLOT_FIELDS
+from pipeline.anomaly_detection import AnomalyDetector
+from pipeline.data_cache import read_reference_csv
+
+# Slot keys the autoencoder reconstructs
+REQUIRED_FIELDS = [key for _, key in SLOT_FIELDS]
+
+# Code field -> (reference CSV, slot name column, CSV name column) refreshed when the code changes
+NAME_COLUMNS = {
+    'subject_code': ('subjects', 'subject_name', 'subject_name'),
+    'teacher_id': ('teachers', 'teacher_name', 'name'),
+    'room_id': ('rooms', 'room_name', 'room_name'),
+}
 
 class TimetableHealer:
     def __init__(self, model_path='pipeline/models/autoencoder.pth',
@@ -20,6 +28,7 @@ class TimetableHealer:
         self.encoder = self.detector.encoder
         self.model = self.detector.model
         self.healing_log = []
+        self._names = None
         
     def reconstruct_sequence(self, corrupted_sequence):
         """Reconstruct corrupted timetable sequence using autoencoder"""
@@ -30,30 +39,16 @@ class TimetableHealer:
         try:
             print("🔧 Starting sequence reconstruction...")
             
-            # Encode corrupted sequence
-            encoded_sequence = []
-            for slot in corrupted_sequence:
-                encoded_slot = self.encoder.encode_slot(slot)
-                encoded_sequence.append(encoded_slot)
-            
-            # Convert to tensor
-            X = torch.FloatTensor(encoded_sequence).unsqueeze(0).to(self.detector.device)
+            # Encode corrupted sequence in one pass and reconstruct
+            target, output = self.detector.reconstruct(corrupted_sequence)
+            reconstructed = output.squeeze(0).cpu().numpy()
             
-            # Get latent representation and reconstruct
-            with torch.no_grad():
-                output, z = self.model(X)
-                reconstructed = output.squeeze(0).cpu().numpy()
+            # Decode back to slot data (segment-wise argmax over the whole sequence)
+            reconstructed_sequence = self.encoder.decode_many(reconstructed)
             
-            # Decode back to slot data
-            reconstructed_sequence = []
-            for i, encoded_slot in enumerate(reconstructed):
-                decoded_slot = self.encoder.decode_slot(encoded_slot)
-                
-                # Keep original structure if decoding fails
-                if not decoded_slot:
-                    decoded_slot = corrupted_sequence[i] if i < len(corrupted_sequence) else {}
-                
-                reconstructed_sequence.append(decoded_slot)
+            # Keep original structure if decoding fails
+            if len(reconstructed_sequence) != len(corrupted_sequence):
+                return corrupted_sequence
             
             print(f"✅ Sequence reconstructed: {len(reconstructed_sequence)} slots")
             return reconstructed_sequence
@@ -89,34 +84,80 @@ class TimetableHealer:
         
         return corrupted_slot
     
-    def post_process_slot(self, reconstructed_slot, original_slot):
-        """Post-process reconstructed slot to ensure validity"""
-        print("🔧 Post-processing reconstructed slot...")
-        
-        # Ensure required fields exist
-        required_fields = ['section', 'subject_code', 'teacher_id', 'room_id', 
-                          'day', 'time_slot', 'campus', 'activity_type']
+    def post_process_slot(self, reconstructed_slot, original_slot, fields=None):
+        """Merge reconstructed fields into a copy of the original slot, keeping it consistent.
         
-        processed_slot = {}
+        Only `fields` (default: every reconstructed field) are rewritten. A
+        decoded time slot goes back into time_start/time_end when the slot
+        has them, and a changed subject, teacher or room refreshes its name.
+        """
+        print("🔧 Post-processing reconstructed slot...")
         
-        for field in required_fields:
-            if field in reconstructed_slot and reconstructed_slot[field]:
-                processed_slot[field] = reconstructed_slot[field]
-            elif field in original_slot:
-                processed_slot[field] = original_slot[field]
-            else:
+        processed_slot = dict(original_slot)
+        changed = []
+        
+        for field in fields or REQUIRED_FIELDS:
+            value = reconstructed_slot.get(field)
+            if field == 'time_slot' and not self.is_valid_time_slot(value):
+                value = None
+            if not value:
+                current = self.get_field(processed_slot, field)
+                if current and (field != 'time_slot' or self.is_valid_time_slot(current)):
+                    continue
                 # Use fallback values
-                processed_slot[field] = self.get_fallback_value(field)
-        
-        # Validate time slot
-        if not self.is_valid_time_slot(processed_slot['time_slot']):
-            processed_slot['time_slot'] = '08:00-09:00'
-        
-        # Ensure campus-room consistency
-        processed_slot = self.ensure_campus_room_consistency(processed_slot)
-        
+                value = self.get_fallback_value(field)
+            if value != self.get_field(processed_slot, field):
+                self.set_field(processed_slot, field, value)
+                changed.append(field)
+        
+        # Ensure campus-room consistency (only when the room itself is being healed)
+        if 'room_id' in (fields or REQUIRED_FIELDS):
+            room_id = processed_slot.get('room_id')
+            processed_slot = self.ensure_campus_room_consistency(processed_slot)
+            if processed_slot['room_id'] != room_id and 'room_id' not in changed:
+                changed.append('room_id')
+        
+        self.refresh_names(processed_slot, changed)
         return processed_slot
     
+    @staticmethod
+    def get_field(slot, field):
+        """Field value of a slot, deriving time_slot from time_start/time_end if needed"""
+        if field == 'time_slot':
+            return TimetableEncoder._slot_time(slot)
+        return slot.get(field)
+    
+    @staticmethod
+    def set_field(slot, field, value):
+        """Write a field, keeping time_start/time_end and time_slot in step"""
+        if field == 'time_slot':
+            if 'time_start' in slot or 'time_end' in slot:
+                slot['time_start'], slot['time_end'] = value.split('-')
+            if 'time_slot' in slot or 'time_start' not in slot:
+                slot['time_slot'] = value
+        else:
+            slot[field] = value
+    
+    def refresh_names(self, slot, changed_fields):
+        """Update subject/teacher/room names for the codes in changed_fields"""
+        if self._names is None:
+            self._names = {}
+            for field, (csv_name, _, name_column) in NAME_COLUMNS.items():
+                try:
+                    reference = read_reference_csv('data/', csv_name)
+                    self._names[field] = dict(zip(reference[field].astype(str), reference[name_column]))
+                except Exception as e:
+                    print(f"⚠️ Could not load {csv_name} names: {e}")
+                    self._names[field] = {}
+        
+        for field in changed_fields:
+            if field in NAME_COLUMNS:
+                name_key = NAME_COLUMNS[field][1]
+                name = self._names[field].get(str(slot[field]))
+                if name_key in slot or name is not None:
+                    slot[name_key] = name
+        return slot
+    
     def get_fallback_value(self, field):
         """Get fallback value for missing field"""
         fallbacks = {
@@ -142,7 +183,7 @@ class TimetableHealer:
     def ensure_campus_room_consistency(self, slot):
         """Ensure room exists on specified campus"""
         try:
-            rooms_df = pd.read_csv('data/rooms.csv')
+            rooms_df = read_reference_csv('data/', 'rooms')
             
             # Check if room exists on campus
             campus_rooms = rooms_df[rooms_df['campus'] == slot['campus']]
@@ -171,44 +212,42 @@ class TimetableHealer:
             print(f"No slots found for batch {batch_id}")
             return timetable_data
         
-        # Check for anomalies
-        is_anomaly, error = self.detector.detect_anomaly(batch_slots)
+        # Check for anomalies and locate the offending slots in one forward pass
+        localization = self.detector.localize_anomaly(batch_slots)
         
-        if not is_anomaly:
+        if localization is None or not localization['is_anomaly']:
             print(f"✅ Batch {batch_id} timetable is normal, no healing needed")
             return timetable_data
         
-        print(f"🚨 Anomaly detected in batch {batch_id}, starting healing process...")
+        flagged_slots = localization['flagged_slots']
+        print(f"🚨 Anomaly detected in batch {batch_id}: {len(flagged_slots)}/{len(batch_slots)} slots flagged")
         
-        # Reconstruct the entire batch sequence
-        healed_sequence = self.reconstruct_sequence(batch_slots)
+        # Decode only the flagged rows of the existing reconstruction
+        decoded_slots = self.encoder.decode_many(localization['reconstruction'][flagged_slots])
         
-        # Post-process each slot
-        final_sequence = []
-        for i, slot in enumerate(healed_sequence):
-            original_slot = batch_slots[i] if i < len(batch_slots) else {}
-            processed_slot = self.post_process_slot(slot, original_slot)
-            final_sequence.append(processed_slot)
+        # Replace only the flagged fields, keeping everything else from the original slot
+        final_sequence = list(batch_slots)
+        for i, decoded_slot in zip(flagged_slots, decoded_slots):
+            final_sequence[i] = self.post_process_slot(
+                decoded_slot, batch_slots[i], fields=localization['flagged_fields'][i]
+            )
         
         # Replace slots in original timetable
-        healed_timetable = []
-        batch_slot_indices = []
-        
-        for i, slot in enumerate(timetable_data):
-            if slot.get('batch_id') == batch_id:
-                batch_slot_indices.append(len(healed_timetable))
-                if batch_slot_indices[-1] - len(batch_slot_indices) + 1 < len(final_sequence):
-                    healed_timetable.append(final_sequence[len(batch_slot_indices) - 1])
-                else:
-                    healed_timetable.append(slot)
-            else:
-                healed_timetable.append(slot)
+        healed_iter = iter(final_sequence)
+        healed_timetable = [
+            next(healed_iter) if slot.get('batch_id') == batch_id else slot
+            for slot in timetable_data
+        ]
         
         # Log batch healing
         self.log_healing(
             {'batch_id': batch_id, 'slots_count': len(batch_slots)},
-            {'batch_id': batch_id, 'healed_slots_count': len(final_sequence)},
-            "Batch timetable reconstruction"
+            {
+                'batch_id': batch_id,
+                'healed_slots_count': len(flagged_slots),
+                'flagged_fields': {str(i): fields for i, fields in localization['flagged_fields'].items()}
+            },
+            "Targeted batch timetable reconstruction"
         )
         
         print(f"✅ Batch {batch_id} healing completed")
@@ -284,10 +323,10 @@ class TimetableHealer:
         
         try:
             # Load base data
-            students_df = pd.read_csv(os.path.join(base_data_path, 'students.csv'))
-            teachers_df = pd.read_csv(os.path.join(base_data_path, 'teachers.csv'))
-            subjects_df = pd.read_csv(os.path.join(base_data_path, 'subjects.csv'))
-            rooms_df = pd.read_csv(os.path.join(base_data_path, 'rooms.csv'))
+            students_df = read_reference_csv(base_data_path, 'students')
+            teachers_df = read_reference_csv(base_data_path, 'teachers')
+            subjects_df = read_reference_csv(base_data_path, 'subjects')
+            rooms_df = read_reference_csv(base_data_path, 'rooms')
             
             # Get batch info
             batch_students = students_df[students_df['batch_id'] == batch_id]
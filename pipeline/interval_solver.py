@@ -0,0 +1,219 @@
+"""
+Interval Constraint Solver Module
+CP-SAT timetable model with one optional interval per session instead of hourly booleans
+"""
+
+from ortools.sat.python import cp_model
+from pipeline.data_cache import read_reference_csv
+from pipeline.constraint_solver import TimetableConstraintSolver
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _minutes(value):
+    hours, minutes = str(value).strip().split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+class IntervalConstraintSolver(TimetableConstraintSolver):
+    """Alternative model where every (batch, subject) session is one interval.
+
+    A demand of `hours` weekly hours becomes hours * 60 / duration_minutes
+    sessions, at most one per day. Each possible session day has an integer
+    start (minutes since Monday 00:00, restricted to grid start times), a
+    presence literal and one optional interval per candidate teacher and room,
+    so a 3-hour lab is a single interval rather than three hourly booleans.
+    Teachers, rooms and batches each get an AddNoOverlap; room intervals are
+    widened by the activity's preparation_time and cleanup_time for lab
+    sessions, so consecutive labs in one room leave time to set up.
+    """
+
+    def load_reference_data(self):
+        """Load reference data plus activity durations and grid minutes"""
+        super().load_reference_data()
+        try:
+            self.activities_df = read_reference_csv(self.data_path, 'activities')
+        except Exception as e:
+            print(f"⚠️ No activity data, using subject durations only: {e}")
+            self.activities_df = None
+
+        self.slot_minutes = [tuple(_minutes(part) for part in slot.split('-')) for slot in self.time_slots]
+
+    def _activity_for(self, subject_code):
+        """activities.csv row for a subject, preferring lab sessions and lectures"""
+        if self.activities_df is None:
+            return None
+        rows = self.activities_df[self.activities_df['subject_code'] == subject_code]
+        if rows.empty:
+            return None
+        for activity_type in ('Lab Session', 'Lecture'):
+            preferred = rows[rows['activity_type'] == activity_type]
+            if not preferred.empty:
+                return preferred.iloc[0]
+        return rows.iloc[0]
+
+    def _session_spec(self, subject_code, hours):
+        """Duration, room setup/cleanup, allowed start minutes and session count for a demand"""
+        subject = self.subjects_df[self.subjects_df['subject_code'] == subject_code].iloc[0]
+        activity = self._activity_for(subject_code)
+
+        duration = int(activity['duration_minutes'] if activity is not None else subject['duration_minutes'])
+        duration = max(60, duration)
+        lab = self._room_type_for(subject) == 'Lab'
+        setup = int(activity['preparation_time']) if lab and activity is not None else 0
+        cleanup = int(activity['cleanup_time']) if lab and activity is not None else 0
+
+        day_end = self.slot_minutes[-1][1]
+        starts = [start for start, _ in self.slot_minutes if start + duration <= day_end]
+
+        # Preferred windows that exactly fit a session ("10:00-13:00, 14:00-17:00") narrow the starts
+        if activity is not None:
+            windows = []
+            for window in str(activity['preferred_time_slots']).split(','):
+                try:
+                    start, end = (_minutes(part) for part in window.split('-'))
+                except ValueError:
+                    continue
+                if end - start == duration and start in starts:
+                    windows.append(start)
+            starts = windows or starts
+
+        sessions = max(1, min(len(self.days), round(hours * 60 / duration)))
+        return {'duration': duration, 'setup': setup, 'cleanup': cleanup, 'starts': starts, 'sessions': sessions}
+
+    def create_interval_model(self, demands=None):
+        """Build the interval model for the given (or freshly built) demands"""
+        print("🔧 Creating interval variables...")
+
+        self.model = cp_model.CpModel()
+        self.demands = demands if demands is not None else self.build_demands()
+        self.sessions = []
+
+        teacher_intervals = {}
+        room_intervals = {}
+        batch_intervals = {}
+        teacher_minutes = {}
+        objective = []
+        spec_cache = {}
+
+        for demand in self.demands:
+            b, s = demand['b'], demand['s']
+            key = (s, demand['hours'])
+            if key not in spec_cache:
+                spec_cache[key] = self._session_spec(self.subjects[s], demand['hours'])
+            spec = spec_cache[key]
+            duration = spec['duration']
+
+            teacher_choice = {t: self.model.NewBoolVar(f'teaches_{b}_{s}_{t}') for t in demand['teachers']}
+            if len(teacher_choice) > 1:
+                self.model.AddAtMostOne(teacher_choice.values())
+
+            present_days = []
+            for d in range(len(self.days)):
+                offset = d * MINUTES_PER_DAY
+                start = self.model.NewIntVarFromDomain(
+                    cp_model.Domain.FromValues([offset + minute for minute in spec['starts']]), f'start_{b}_{s}_{d}'
+                )
+                present = self.model.NewBoolVar(f'session_{b}_{s}_{d}')
+                present_days.append(present)
+                batch_intervals.setdefault(b, []).append(
+                    self.model.NewOptionalFixedSizeIntervalVar(start, duration, present, f'batch_{b}_{s}_{d}')
+                )
+
+                teachers = {}
+                for t in demand['teachers']:
+                    uses = self.model.NewBoolVar(f'uses_teacher_{b}_{s}_{d}_{t}')
+                    self.model.AddImplication(uses, teacher_choice[t])
+                    teacher_intervals.setdefault(t, []).append(
+                        self.model.NewOptionalFixedSizeIntervalVar(start, duration, uses, f'teacher_{b}_{s}_{d}_{t}')
+                    )
+                    teacher_minutes.setdefault(t, []).append(duration * uses)
+                    teachers[t] = uses
+                self.model.Add(sum(teachers.values()) == present)
+
+                rooms = {}
+                for r in demand['rooms']:
+                    uses = self.model.NewBoolVar(f'uses_room_{b}_{s}_{d}_{r}')
+                    room_intervals.setdefault(r, []).append(
+                        self.model.NewOptionalFixedSizeIntervalVar(
+                            start - spec['setup'], spec['setup'] + duration + spec['cleanup'], uses, f'room_{b}_{s}_{d}_{r}'
+                        )
+                    )
+                    rooms[r] = uses
+                self.model.Add(sum(rooms.values()) == present)
+
+                self.sessions.append({'b': b, 's': s, 'd': d, 'start': start, 'present': present,
+                                      'duration': duration, 'teachers': teachers, 'rooms': rooms})
+                objective.append(duration * present)
+
+            self.model.Add(sum(present_days) <= spec['sessions'])
+
+        # A batch, a teacher and a room hold at most one session at a time
+        for intervals in (batch_intervals, teacher_intervals, room_intervals):
+            for group in intervals.values():
+                if len(group) > 1:
+                    self.model.AddNoOverlap(group)
+
+        # Teacher weekly workload, in minutes
+        for t, minutes in teacher_minutes.items():
+            self.model.Add(sum(minutes) <= int(self.teacher_capacity[t]) * 60)
+
+        # Objective: schedule as many demanded minutes as possible
+        self.model.Maximize(sum(objective))
+
+        print(f"✅ Created {len(self.sessions)} optional sessions for {len(self.demands)} batch-subject demands")
+
+    def interval_keys(self):
+        """(b, t, s, r, d, h) keys for every grid slot covered by a scheduled session"""
+        keys = []
+        for session in self.sessions:
+            if not self.solver.Value(session['present']):
+                continue
+            start = self.solver.Value(session['start']) % MINUTES_PER_DAY
+            end = start + session['duration']
+            t = next(t for t, uses in session['teachers'].items() if self.solver.Value(uses))
+            r = next(r for r, uses in session['rooms'].items() if self.solver.Value(uses))
+            for h, (slot_start, slot_end) in enumerate(self.slot_minutes):
+                if slot_start < end and start < slot_end:
+                    keys.append((session['b'], t, session['s'], r, session['d'], h))
+        return keys
+
+    def solve_intervals(self, demands=None, time_limit=30.0, num_workers=8):
+        """Solve the interval model, returning slot dicts like solve_constraints or None"""
+        print("🔍 Solving interval constraint model...")
+
+        self.solver = cp_model.CpSolver()
+        self.create_interval_model(demands)
+        self.configure_solver(time_limit=time_limit, num_workers=num_workers)
+        status = self.solver.Solve(self.model)
+
+        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+            print("✅ Solution found!")
+            return self.extract_solution(self.interval_keys())
+        else:
+            print("❌ No feasible solution found")
+            return None
+
+
+def main():
+    """Main function to test the interval solver"""
+    print("🚀 Starting Interval Constraint Solver Process...")
+    print("=" * 60)
+
+    solver = IntervalConstraintSolver()
+    if not solver.batches:
+        print("❌ No reference data loaded")
+        return
+
+    solution = solver.solve_intervals()
+    if solution:
+        violations = solver.detect_violations(solution)
+        print(f"📊 {len(solution)} slots, {len(violations)} violations")
+
+    print("\n" + "=" * 60)
+    print("✅ INTERVAL SOLVER COMPLETED SUCCESSFULLY!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
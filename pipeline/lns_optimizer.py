@@ -0,0 +1,214 @@
+"""
+Large Neighborhood Search Module
+Improves an existing timetable by repeatedly destroying and re-solving small parts of it
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pipeline.constraint_solver import TimetableConstraintSolver
+
+# Neighborhoods LNS destroys: one batch on one day, one teacher's week, one room's week
+NEIGHBORHOOD_KINDS = ['batch_day', 'teacher', 'room']
+
+# Classes per batch day above which every extra hour is penalized
+MAX_DAILY_HOURS = 6
+
+_worker_solver = None
+
+
+def _init_worker(data_path):
+    """Process-pool initializer: one solver (and reference data load) per worker"""
+    global _worker_solver
+    _worker_solver = TimetableConstraintSolver(data_path)
+
+
+def _repair(solver, timetable_slots, positions, time_limit):
+    """Re-solve one destroyed neighborhood, returning {position: new slot} for the slots that moved"""
+    repaired = solver.resolve_positions(timetable_slots, positions, time_limit=time_limit)
+    return {p: repaired[p] for p in positions if repaired[p] is not timetable_slots[p]}
+
+
+def _repair_job(job):
+    """Process-pool entry point for _repair"""
+    timetable_slots, positions, time_limit = job
+    return _repair(_worker_solver, timetable_slots, positions, time_limit)
+
+
+class LNSOptimizer:
+    """Destroy-and-repair improvement loop on top of TimetableConstraintSolver.
+
+    Every round destroys up to max_workers neighborhoods (mostly ones that
+    contain a conflicting slot) and repairs them in parallel with a small
+    warm-started CP-SAT model each, all against the same starting timetable.
+    Repairs are then merged one by one and kept only if the objective does
+    not get worse, so overlapping repairs can never add conflicts.
+    """
+
+    def __init__(self, data_path='data/', max_workers=None, repair_time_limit=2.0,
+                 max_neighborhood_size=40, conflict_bias=0.8, patience=50, seed=None):
+        self.data_path = data_path
+        self.max_workers = max_workers or max(1, min(4, os.cpu_count() or 1))
+        self.repair_time_limit = repair_time_limit
+        self.max_neighborhood_size = max_neighborhood_size
+        self.conflict_bias = conflict_bias
+        self.patience = patience
+        self.random = random.Random(seed)
+        self.solver = TimetableConstraintSolver(data_path)
+        self.history = []
+
+    def objective(self, timetable_slots):
+        """(conflicts, penalty) of a timetable, lower is better.
+
+        conflicts counts clashing (type, day, time, resource) keys; the penalty
+        is 10 per conflict plus one per class beyond MAX_DAILY_HOURS in a batch day.
+        """
+        conflicts = len(self.solver.index_conflicts(timetable_slots))
+        daily = {}
+        for slot in timetable_slots:
+            key = (slot.get('batch_id'), slot.get('day'))
+            daily[key] = daily.get(key, 0) + 1
+        overload = sum(max(0, hours - MAX_DAILY_HOURS) for hours in daily.values())
+        return conflicts, 10 * conflicts + overload
+
+    def _index(self, timetable_slots):
+        """{(kind, key): [positions]} for every neighborhood of the timetable"""
+        index = {}
+        for position, slot in enumerate(timetable_slots):
+            for kind, key in (
+                ('batch_day', (slot.get('batch_id'), slot.get('day'))),
+                ('teacher', slot.get('teacher_id')),
+                ('room', slot.get('room_id')),
+            ):
+                index.setdefault((kind, key), []).append(position)
+        return index
+
+    def _destroy(self, index, conflicting):
+        """Pick one neighborhood, preferring one around a random conflicting slot"""
+        kind = self.random.choice(NEIGHBORHOOD_KINDS)
+        candidates = [name for name in index if name[0] == kind]
+        anchor = None
+        if conflicting and self.random.random() < self.conflict_bias:
+            anchor = self.random.choice(conflicting)
+            candidates = [name for name in candidates if anchor in index[name]] or candidates
+        name = self.random.choice(candidates)
+
+        positions = index[name]
+        if len(positions) > self.max_neighborhood_size:
+            # Keep the anchor and a random sample of the rest so repairs stay small
+            others = [p for p in positions if p != anchor]
+            positions = self.random.sample(others, self.max_neighborhood_size - (anchor is not None))
+            if anchor is not None:
+                positions.append(anchor)
+        return name, positions
+
+    def _record(self, round_number, started, conflicts, penalty, accepted):
+        entry = {
+            'round': round_number,
+            'elapsed': round(time.time() - started, 3),
+            'conflicts': conflicts,
+            'objective': penalty,
+            'accepted': accepted
+        }
+        self.history.append(entry)
+        print(f"🔁 Round {round_number}: {conflicts} conflicts, objective {penalty} "
+              f"({accepted} repairs kept, {entry['elapsed']:.1f}s)")
+
+    def optimize(self, timetable_slots, time_budget=60.0, max_rounds=None):
+        """Improve a timetable (list of slot dicts) within time_budget seconds.
+
+        Stops early once the objective is 0 or has not improved for `patience`
+        rounds. Returns the improved slot list; self.history holds conflicts
+        and objective after every round.
+        """
+        print(f"🚀 LNS on {len(timetable_slots)} slots, {self.max_workers} workers, {time_budget:.0f}s budget")
+        slots = list(timetable_slots)
+        started = time.time()
+        self.history = []
+
+        conflicts, penalty = self.objective(slots)
+        self._record(0, started, conflicts, penalty, 0)
+
+        pool = None
+        if self.max_workers > 1:
+            pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=_init_worker, initargs=(self.data_path,)
+            )
+
+        try:
+            round_number = 0
+            best_round, best_penalty = 0, penalty
+            while penalty > 0 and time.time() - started < time_budget:
+                if max_rounds is not None and round_number >= max_rounds:
+                    break
+                if round_number - best_round >= self.patience:
+                    break
+                round_number += 1
+
+                index = self._index(slots)
+                conflicting = sorted(self.solver.conflicting_positions(slots))
+                destroyed = [self._destroy(index, conflicting) for _ in range(self.max_workers)]
+                time_limit = min(self.repair_time_limit, max(0.1, time_budget - (time.time() - started)))
+
+                if pool is not None:
+                    jobs = [(slots, positions, time_limit) for _, positions in destroyed]
+                    repairs = list(pool.map(_repair_job, jobs))
+                else:
+                    repairs = [_repair(self.solver, slots, positions, time_limit) for _, positions in destroyed]
+
+                accepted = 0
+                for changes in repairs:
+                    if not changes:
+                        continue
+                    candidate = list(slots)
+                    for position, slot in changes.items():
+                        candidate[position] = slot
+                    candidate_conflicts, candidate_penalty = self.objective(candidate)
+                    if candidate_penalty <= penalty:
+                        slots, conflicts, penalty = candidate, candidate_conflicts, candidate_penalty
+                        accepted += 1
+
+                self._record(round_number, started, conflicts, penalty, accepted)
+                if penalty < best_penalty:
+                    best_round, best_penalty = round_number, penalty
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        print(f"✅ LNS finished: {self.history[0]['conflicts']} -> {conflicts} conflicts in {round_number} rounds")
+        return slots
+
+    def save_history(self, path):
+        """Write the conflicts/objective trace to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.history, f, indent=2)
+
+
+def main():
+    """Run LNS on a timetable CSV: python -m pipeline.lns_optimizer <timetable.csv> [seconds]"""
+    print("🚀 Starting LNS Optimization...")
+    print("=" * 60)
+
+    input_csv = sys.argv[1] if len(sys.argv) > 1 else 'data/edited_timetable_for_pipeline.csv'
+    time_budget = float(sys.argv[2]) if len(sys.argv) > 2 else 60.0
+
+    slots = pd.read_csv(input_csv, dtype=str).to_dict('records')
+    optimizer = LNSOptimizer()
+    improved = optimizer.optimize(slots, time_budget=time_budget)
+
+    output_csv = os.path.splitext(input_csv)[0] + '_lns.csv'
+    pd.DataFrame(improved).to_csv(output_csv, index=False)
+    optimizer.save_history(os.path.splitext(input_csv)[0] + '_lns_history.json')
+    print(f"💾 Saved optimized timetable to {output_csv}")
+
+    print("\n" + "=" * 60)
+    print("✅ LNS OPTIMIZATION COMPLETED SUCCESSFULLY!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
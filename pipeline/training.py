@@ -7,23 +7,40 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 import numpy as np
-import pandas as pd
 import pickle
 import os
+import sys
 from datetime import datetime
 from sklearn.model_selection import train_test_split
-from encoding import TimetableEncoder
+from pipeline.encoding import TimetableEncoder
+from pipeline.data_cache import read_reference_csv
 
 class TimetableAutoencoder(nn.Module):
-    def __init__(self, input_dim, embed_dim=64, hidden_dim=128):
+    def __init__(self, input_dim, embed_dim=64, hidden_dim=128, field_sizes=None, field_embed_dim=16):
         super(TimetableAutoencoder, self).__init__()
         self.input_dim = input_dim
         self.embed_dim = embed_dim
         self.hidden_dim = hidden_dim
+        self.field_sizes = list(field_sizes) if field_sizes else None
+        self.field_embed_dim = field_embed_dim
+        
+        # Index input path: one embedding table per categorical field, with an
+        # extra padding row (index == field size) for missing values
+        if self.field_sizes:
+            self.field_embeddings = nn.ModuleList([
+                nn.Embedding(size + 1, field_embed_dim, padding_idx=size)
+                for size in self.field_sizes
+            ])
+            offsets = torch.tensor([0] + self.field_sizes[:-1], dtype=torch.long).cumsum(0)
+            self.register_buffer('field_offsets', offsets)
+            self.register_buffer('field_size_tensor', torch.tensor(self.field_sizes, dtype=torch.long))
+            lstm_input_dim = len(self.field_sizes) * field_embed_dim
+        else:
+            lstm_input_dim = input_dim
         
         # Encoder: Bi-LSTM
         self.encoder = nn.LSTM(
-            input_size=input_dim,
+            input_size=lstm_input_dim,
             hidden_size=hidden_dim,
             batch_first=True,
             bidirectional=True
@@ -34,22 +51,59 @@ class TimetableAutoencoder(nn.Module):
         
         # Decoder: LSTM
         self.decoder = nn.LSTM(
-            input_size=embed_dim + input_dim,
+            input_size=embed_dim + lstm_input_dim,
             hidden_size=hidden_dim,
             batch_first=True
         )
         
         # Output layer
         self.output = nn.Linear(hidden_dim, input_dim)
+    
+    @property
+    def uses_indices(self):
+        return self.field_sizes is not None
+    
+    def embed_indices(self, x_idx):
+        """Map (batch, seq, fields) category indices to concatenated field embeddings"""
+        x_idx = x_idx.long()
+        # Missing values (-1) go to each field's padding row
+        x_idx = torch.where(x_idx < 0, self.field_size_tensor, x_idx)
+        embedded = [emb(x_idx[..., i]) for i, emb in enumerate(self.field_embeddings)]
+        return torch.cat(embedded, dim=-1)
+    
+    def to_dense(self, x_idx):
+        """Expand (batch, seq, fields) indices into the one-hot reconstruction target"""
+        x_idx = x_idx.long()
+        dense = torch.zeros(*x_idx.shape[:-1], self.input_dim, device=x_idx.device)
+        flat = dense.view(-1, self.input_dim)
+        positions = (x_idx + self.field_offsets).reshape(flat.shape[0], -1)
+        rows = torch.arange(flat.shape[0], device=x_idx.device).unsqueeze(1).expand_as(positions)
+        # Missing fields (-1) set no bit, leaving their block all-zero as in encode_many
+        valid = x_idx.reshape(positions.shape) >= 0
+        flat[rows[valid], positions[valid]] = 1.0
+        return dense
+        
+    def forward(self, x, p=None, lengths=None):
+        """Reconstruct x; lengths gives the true length of each padded sequence"""
+        if self.uses_indices:
+            x = self.embed_indices(x)
         
-    def forward(self, x, p=None):
         batch_size, seq_len, _ = x.shape
         
         # Encoder
-        enc_out, (h_n, c_n) = self.encoder(x)
+        if lengths is None:
+            enc_out, (h_n, c_n) = self.encoder(x)
+            last_out = enc_out[:, -1, :]
+        else:
+            # Pack so the backward direction starts at each sequence's real end
+            lengths = torch.as_tensor(lengths, dtype=torch.long).cpu()
+            packed = nn.utils.rnn.pack_padded_sequence(x, lengths, batch_first=True, enforce_sorted=False)
+            packed_out, (h_n, c_n) = self.encoder(packed)
+            enc_out, _ = nn.utils.rnn.pad_packed_sequence(packed_out, batch_first=True, total_length=seq_len)
+            last_out = enc_out[torch.arange(batch_size), (lengths - 1).to(enc_out.device)]
         
         # Take final hidden state from bidirectional LSTM
-        z = torch.tanh(self.fc_z(enc_out[:, -1, :]))
+        z = torch.tanh(self.fc_z(last_out))
         
         # Prepare decoder input: repeat z and concatenate with x
         z_repeated = z.unsqueeze(1).repeat(1, seq_len, 1)
@@ -70,31 +124,38 @@ class TimetableAutoencoder(nn.Module):
         return output, z
 
 class TimetableTrainer:
-    def __init__(self, model, device='cpu'):
+    def __init__(self, model, device='cpu', model_dir='pipeline/models'):
         self.model = model
         self.device = device
-        self.model.to(device)
+        self.model_dir = model_dir
+        if self.model is not None:
+            self.model.to(device)
         self.encoder = None
         self.train_losses = []
         self.val_losses = []
         
-    def load_training_data(self, data_path='data/'):
-        """Load and prepare training data from CSV files"""
+    def load_training_data(self, data_path='data/', sparse=False):
+        """Load and prepare training data from CSV files.
+        
+        With sparse=True each sequence is a (seq_len, 8) int16 matrix of field
+        indices instead of dense one-hot rows.
+        """
         print("📊 Loading training data from CSV files...")
         
         # Load encoder
         self.encoder = TimetableEncoder()
-        if os.path.exists('pipeline/models/encoders.pkl'):
-            self.encoder.load_encoders('pipeline/models/encoders.pkl')
+        encoder_path = os.path.join(self.model_dir, 'encoders.pkl')
+        if os.path.exists(encoder_path):
+            self.encoder.load_encoders(encoder_path)
         else:
             self.encoder.fit_encoders(data_path)
-            self.encoder.save_encoders('pipeline/models/encoders.pkl')
+            self.encoder.save_encoders(encoder_path)
         
-        # Load CSV data
-        students_df = pd.read_csv(os.path.join(data_path, 'students.csv'))
-        teachers_df = pd.read_csv(os.path.join(data_path, 'teachers.csv'))
-        subjects_df = pd.read_csv(os.path.join(data_path, 'subjects.csv'))
-        rooms_df = pd.read_csv(os.path.join(data_path, 'rooms.csv'))
+        # Load CSV data (through the columnar cache)
+        students_df = read_reference_csv(data_path, 'students')
+        teachers_df = read_reference_csv(data_path, 'teachers')
+        subjects_df = read_reference_csv(data_path, 'subjects')
+        rooms_df = read_reference_csv(data_path, 'rooms')
         
         # Generate training sequences
         sequences = []
@@ -155,15 +216,17 @@ class TimetableTrainer:
                             'day': day,
                             'time_slot': time_slot,
                             'campus': campus,
-                            'activity_type': 'Lab' if subject['has_lab'] else 'Lecture'
+                            'activity_type': 'Lab' if str(subject['lab_required']).lower() == 'true' else 'Lecture'
                         }
                         
-                        # Encode slot
-                        encoded_slot = self.encoder.encode_slot(slot_data)
-                        weekly_sequence.append(encoded_slot)
+                        weekly_sequence.append(slot_data)
             
             if len(weekly_sequence) > 0:
-                sequences.append(np.array(weekly_sequence))
+                # Encode the whole week in one pass
+                if sparse:
+                    sequences.append(self.encoder.encode_indices(weekly_sequence))
+                else:
+                    sequences.append(self.encoder.encode_many(weekly_sequence))
         
         print(f"✅ Generated {len(sequences)} training sequences")
         return sequences
@@ -175,26 +238,24 @@ class TimetableTrainer:
         # Convert to tensors
         max_len = max(len(seq) for seq in sequences)
         
-        # Pad sequences to same length
-        padded_sequences = []
-        for seq in sequences:
-            if len(seq) < max_len:
-                padding = np.zeros((max_len - len(seq), seq.shape[1]))
-                padded_seq = np.vstack([seq, padding])
-            else:
-                padded_seq = seq
-            padded_sequences.append(padded_seq)
+        # Index sequences (int16) are padded with -1 (missing), dense ones with zeros
+        sparse = np.issubdtype(sequences[0].dtype, np.integer)
+        pad_value = -1 if sparse else 0
         
-        X = np.array(padded_sequences)
+        # Pad sequences to same length
+        X = np.full((len(sequences), max_len, sequences[0].shape[1]), pad_value,
+                    dtype=np.int16 if sparse else np.float32)
+        for i, seq in enumerate(sequences):
+            X[i, :len(seq)] = seq
         
         # Split data
         X_temp, X_test = train_test_split(X, test_size=test_size, random_state=42)
         X_train, X_val = train_test_split(X_temp, test_size=val_size/(1-test_size), random_state=42)
         
-        # Convert to tensors
-        X_train = torch.FloatTensor(X_train).to(self.device)
-        X_val = torch.FloatTensor(X_val).to(self.device)
-        X_test = torch.FloatTensor(X_test).to(self.device)
+        # Convert to tensors (index tensors stay int16 and are expanded per mini-batch)
+        X_train = torch.from_numpy(X_train).to(self.device)
+        X_val = torch.from_numpy(X_val).to(self.device)
+        X_test = torch.from_numpy(X_test).to(self.device)
         
         print(f"📊 Dataset sizes:")
         print(f"   Train: {X_train.shape}")
@@ -203,6 +264,12 @@ class TimetableTrainer:
         
         return X_train, X_val, X_test
     
+    def _target(self, batch):
+        """Reconstruction target: index batches are expanded to one-hot on the fly"""
+        if self.model.uses_indices:
+            return self.model.to_dense(batch)
+        return batch
+    
     def train_model(self, X_train, X_val, epochs=100, lr=1e-3, batch_size=32):
         """Train the autoencoder model"""
         print(f"🚀 Starting training for {epochs} epochs...")
@@ -236,7 +303,7 @@ class TimetableTrainer:
                 
                 # Forward pass
                 output, z = self.model(batch_x)
-                loss = criterion(output, batch_y)
+                loss = criterion(output, self._target(batch_y))
                 
                 # Backward pass
                 loss.backward()
@@ -254,7 +321,7 @@ class TimetableTrainer:
             with torch.no_grad():
                 for batch_x, batch_y in val_loader:
                     output, z = self.model(batch_x)
-                    loss = criterion(output, batch_y)
+                    loss = criterion(output, self._target(batch_y))
                     val_loss += loss.item()
             
             val_loss /= len(val_loader)
@@ -265,7 +332,7 @@ class TimetableTrainer:
                 best_val_loss = val_loss
                 patience_counter = 0
                 # Save best model
-                torch.save(self.model.state_dict(), 'pipeline/models/best_autoencoder.pth')
+                torch.save(self.model.state_dict(), os.path.join(self.model_dir, 'best_autoencoder.pth'))
             else:
                 patience_counter += 1
             
@@ -292,7 +359,7 @@ class TimetableTrainer:
                 output, z = self.model(x)
                 
                 # Compute reconstruction error
-                error = torch.mean((x - output) ** 2).item()
+                error = torch.mean((self._target(x) - output) ** 2).item()
                 reconstruction_errors.append(error)
         
         errors = np.array(reconstruction_errors)
@@ -306,13 +373,14 @@ class TimetableTrainer:
         print(f"   Threshold (mean + 3σ): {threshold:.6f}")
         
         # Save threshold
-        with open('pipeline/models/threshold.pkl', 'wb') as f:
+        with open(os.path.join(self.model_dir, 'threshold.pkl'), 'wb') as f:
             pickle.dump(threshold, f)
         
         return threshold
     
-    def save_model(self, filepath='pipeline/models/autoencoder.pth'):
+    def save_model(self, filepath=None):
         """Save trained model"""
+        filepath = filepath or os.path.join(self.model_dir, 'autoencoder.pth')
         torch.save(self.model.state_dict(), filepath)
         
         # Save training metadata
@@ -320,17 +388,19 @@ class TimetableTrainer:
             'input_dim': self.model.input_dim,
             'embed_dim': self.model.embed_dim,
             'hidden_dim': self.model.hidden_dim,
+            'field_sizes': self.model.field_sizes,
+            'field_embed_dim': self.model.field_embed_dim,
             'train_losses': self.train_losses,
             'val_losses': self.val_losses,
             'trained_at': datetime.now().isoformat()
         }
         
-        with open('pipeline/models/training_metadata.pkl', 'wb') as f:
+        with open(os.path.join(self.model_dir, 'training_metadata.pkl'), 'wb') as f:
             pickle.dump(metadata, f)
         
         print(f"💾 Model saved to {filepath}")
 
-def main():
+def main(sparse=False):
     """Main training function"""
     print("🚀 Starting RNN Autoencoder Training Process...")
     print("=" * 60)
@@ -343,21 +413,23 @@ def main():
     trainer = TimetableTrainer(None, device)
     
     # Load training data
-    sequences = trainer.load_training_data()
+    sequences = trainer.load_training_data(sparse=sparse)
     
     if len(sequences) == 0:
         print("❌ No training sequences generated!")
         return
     
-    # Get input dimension
-    input_dim = sequences[0].shape[1]
+    # Get input dimension (index sequences carry one column per field)
+    encoder = trainer.encoder
+    input_dim = encoder.feature_dim if sparse else sequences[0].shape[1]
     print(f"📊 Input dimension: {input_dim}")
     
     # Initialize model
     model = TimetableAutoencoder(
         input_dim=input_dim,
         embed_dim=64,
-        hidden_dim=128
+        hidden_dim=128,
+        field_sizes=encoder.field_widths.tolist() if sparse else None
     )
     
     trainer.model = model
@@ -387,4 +459,4 @@ def main():
     print("=" * 60)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(sparse='--sparse' in sys.argv)
\ No newline at end of file
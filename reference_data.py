@@ -0,0 +1,122 @@
+"""
+Reference Data Store
+Keeps the data/ reference CSVs parsed in memory once per worker process
+"""
+
+import os
+import threading
+import pandas as pd
+
+# name -> (file name, id column used for the lookup index)
+REFERENCE_FILES = {
+    'students': ('students.csv', 'student_id'),
+    'teachers': ('teachers.csv', 'teacher_id'),
+    'subjects': ('subjects.csv', 'subject_code'),
+    'rooms': ('rooms.csv', 'room_id'),
+    'activities': ('activities.csv', 'activity_id'),
+    'slot_index': ('slot_index.csv', 'slot_id'),
+}
+
+# Identifier columns are always read as strings so lookups by id behave the same
+# whatever the CSV happens to contain (e.g. phone numbers with leading zeros)
+STRING_COLUMNS = [
+    'student_id', 'teacher_id', 'subject_code', 'room_id', 'activity_id', 'slot_id',
+    'batch_id', 'section', 'scheme', 'phone', 'guardian_phone', 'emergency_contact',
+]
+
+
+class ReferenceDataStore:
+    """Lazily loaded, file-signature invalidated cache of the reference CSVs.
+
+    DataFrames returned by this store are shared between requests, so callers
+    must filter or copy them rather than mutating them in place.
+    """
+
+    def __init__(self, data_path='data/'):
+        self.data_path = data_path
+        self._lock = threading.Lock()
+        self._frames = {}
+        self._indexes = {}
+        self._signatures = {}
+
+    def _file_signature(self, path):
+        """Cheap change detector for a CSV file: (mtime, size)"""
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, name, path, id_column):
+        header = pd.read_csv(path, nrows=0).columns
+        dtypes = {col: str for col in STRING_COLUMNS if col in header}
+        df = pd.read_csv(path, dtype=dtypes)
+
+        index = {}
+        if id_column in df.columns:
+            # First row wins for ids that repeat (subject_code is per department)
+            unique_rows = df.drop_duplicates(subset=id_column)
+            index = unique_rows.set_index(id_column, drop=False).to_dict('index')
+
+        return df, index
+
+    def get(self, name):
+        """Get the DataFrame for a reference file, reloading it if the file changed"""
+        filename, id_column = REFERENCE_FILES[name]
+        path = os.path.join(self.data_path, filename)
+        signature = self._file_signature(path)
+
+        frame = self._frames.get(name)
+        if frame is not None and self._signatures.get(name) == signature:
+            return frame
+
+        with self._lock:
+            if self._signatures.get(name) != signature:
+                df, index = self._load(name, path, id_column)
+                self._frames[name] = df
+                self._indexes[name] = index
+                self._signatures[name] = signature
+            return self._frames[name]
+
+    def index(self, name):
+        """Get the {id: record} dict for a reference file"""
+        self.get(name)
+        return self._indexes.get(name, {})
+
+    def lookup(self, name, record_id):
+        """Get a single record by id, or None if it does not exist"""
+        return self.index(name).get(record_id)
+
+    def invalidate(self, name=None):
+        """Drop cached data so the next access re-reads the CSV"""
+        with self._lock:
+            names = [name] if name else list(self._signatures)
+            for key in names:
+                self._signatures.pop(key, None)
+                self._frames.pop(key, None)
+                self._indexes.pop(key, None)
+
+    @property
+    def students(self):
+        return self.get('students')
+
+    @property
+    def teachers(self):
+        return self.get('teachers')
+
+    @property
+    def subjects(self):
+        return self.get('subjects')
+
+    @property
+    def rooms(self):
+        return self.get('rooms')
+
+    @property
+    def activities(self):
+        return self.get('activities')
+
+    @property
+    def slot_index(self):
+        return self.get('slot_index')
+
+
+# One store per worker process, shared by all blueprints
+reference_store = ReferenceDataStore()
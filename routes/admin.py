@@ -1,9 +1,15 @@
 from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, send_file
 from flask_login import login_required, current_user
-from models import db, User, TimetableSlot, TimetableHistory, DataImportLog
+from models import db, User, TimetableSlot, TimetableHistory, DataImportLog, BackgroundJob
 from datetime import datetime
 import pandas as pd
-import json
+import numpy as np
+from reference_data import reference_store
+from occupancy_index import occupancy_index
+from job_queue import job_queue
+from timetable_changelog import change_log
+from timetable_export import week_query, weekly_order, slot_rows, weekly_rows, flat_rows, csv_response, xlsx_response
+import timetable_jobs  # registers the generate/optimize job handlers
 import io
 from functools import wraps
 
@@ -121,124 +127,55 @@ def generate_timetable():
 @login_required
 @admin_required
 def generate_timetable_post():
-    """Generate timetable from CSV data with lunch break + one-week filtering"""
+    """Queue timetable generation from CSV data as a background job"""
     try:
-        students_df = pd.read_csv('data/students.csv')
-        teachers_df = pd.read_csv('data/teachers.csv')
-        subjects_df = pd.read_csv('data/subjects.csv')
-        rooms_df = pd.read_csv('data/rooms.csv')
-        activities_df = pd.read_csv('data/activities.csv')
-        slots_df = pd.read_csv('data/slot_index.csv')
-
-        TimetableSlot.query.delete()
-        generated_slots = []
-
-        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        batches = students_df['batch_id'].unique()
-
-        for batch_id in batches:
-            batch_students = students_df[students_df['batch_id'] == batch_id]
-            if batch_students.empty:
-                continue
-
-            department = str(batch_students.iloc[0]['department'])
-            scheme = str(batch_students.iloc[0]['scheme'])
-            campus = str(batch_students.iloc[0].get('primary_campus', batch_students.iloc[0].get('campus', 'Campus-3')))
-            section = str(batch_students.iloc[0]['section'])
-
-            dept_subjects = subjects_df[
-                (subjects_df['department'] == department) &
-                (subjects_df['scheme'] == scheme)
-            ]
-
-            # ⏱ Scheme-wise time slots
-            if scheme == 'Scheme_A':
-                time_slots = [
-                    ('08:00', '09:00'), ('09:00', '10:00'), ('10:00', '11:00'),
-                    ('11:20', '12:20'),  # Rush start
-                    ('13:00', '14:00'), ('14:00', '15:00')
-                ]
-            elif scheme == 'Scheme_B':
-                time_slots = [
-                    ('10:00', '11:00'), ('11:20', '12:20'),
-                    ('13:00', '14:00'), ('14:00', '15:00'),
-                    ('15:00', '16:00'), ('16:00', '17:00')
-                ]
-            else:
-                time_slots = [
-                    ('08:00', '09:00'), ('09:00', '10:00'), ('10:00', '11:00'),
-                    ('11:20', '12:20'), ('13:00', '14:00'),
-                    ('14:00', '15:00'), ('15:00', '16:00'), ('16:00', '17:00')
-                ]
-
-            slot_index = 0
-
-            for day in days:
-                for time_start, time_end in time_slots:
-                    # ⛔ Skip lunch time 12:20–13:00 exactly
-                    if time_start == '12:20' or (time_start >= '12:00' and time_start < '13:00'):
-                        continue
-
-                    try:
-                        subject = dept_subjects.sample(1).iloc[0]
-                        teacher = teachers_df.sample(1).iloc[0]
-                        room = rooms_df.sample(1).iloc[0]
+        job = job_queue.submit('generate', {'user_id': current_user.id}, user_id=current_user.id)
+        return jsonify({
+            'success': True,
+            'message': 'Timetable generation queued',
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': url_for('admin.job_status', job_id=job.id)
+        }), 202
 
-                        slot = TimetableSlot(
-                            slot_index=slot_index,
-                            batch_id=str(batch_id),
-                            section=section,
-                            day=day,
-                            time_start=time_start,
-                            time_end=time_end,
-                            subject_code=str(subject.get('subject_code', 'SUB001')),
-                            subject_name=str(subject.get('subject_name', 'General Subject')),
-                            teacher_id=str(teacher.get('teacher_id', 'TCH001')),
-                            teacher_name=str(teacher.get('name', 'Unknown Teacher')),
-                            room_id=str(room.get('room_id', 'R001')),
-                            room_name=str(room.get('room_name', 'General Room')),
-                            campus=campus,
-                            activity_type='Lecture',
-                            department=department,
-                            scheme=scheme,
-                            created_by=current_user.id
-                        )
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Generation failed: {str(e)}'}), 500
 
-                        generated_slots.append(slot)
-                        slot_index += 1
 
-                    except Exception as slot_error:
-                        print(f"⚠️ Error creating slot for {batch_id}: {slot_error}")
-                        continue
+@admin_bp.route('/jobs')
+@login_required
+@admin_required
+def list_jobs():
+    """Most recent background jobs"""
+    limit = request.args.get('limit', 20, type=int)
+    jobs = BackgroundJob.query.order_by(BackgroundJob.created_at.desc()).limit(limit).all()
+    return jsonify({'success': True, 'jobs': [job.to_dict() for job in jobs]})
 
-        db.session.add_all(generated_slots)
 
-        history = TimetableHistory(
-            timetable_data=json.dumps([slot.to_dict() for slot in generated_slots]),
-            version=1,
-            created_by=current_user.id,
-            description="Auto-generated smart timetable from CSV data (lunch + week filter)",
-            total_slots=len(generated_slots),
-            affected_batches=json.dumps(list(batches))
-        )
-        db.session.add(history)
-        db.session.commit()
+@admin_bp.route('/jobs/<int:job_id>')
+@login_required
+@admin_required
+def job_status(job_id):
+    """Status, progress and (once completed) result of a background job"""
+    job = BackgroundJob.query.get_or_404(job_id)
+    return jsonify(dict(job.to_dict(), success=True))
 
-        try:
-            from main_pipeline import main as run_pipeline
-            pipeline_result = {'status': 'completed', 'message': 'Pipeline executed successfully'}
-        except Exception as e:
-            pipeline_result = {'status': 'partial', 'message': f'Pipeline warning: {str(e)}'}
 
-        return jsonify({
-            'success': True,
-            'message': f'Generated {len(generated_slots)} timetable slots',
-            'pipeline_status': pipeline_result
-        })
+@admin_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+@admin_required
+def cancel_job(job_id):
+    """Cancel a queued job, or ask a running job to stop at its next checkpoint"""
+    try:
+        job = job_queue.cancel(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Job not found'}), 404
+        return jsonify(dict(job.to_dict(), success=True, message=f'Job {job.status}' if job.status == 'cancelled' else 'Cancellation requested'))
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({'success': False, 'message': f'Generation failed: {str(e)}'}), 500
+        return jsonify({'success': False, 'message': f'Cancel failed: {str(e)}'}), 500
 
 
 
@@ -258,6 +195,16 @@ def edit_timetable_slot(slot_id):
     data = request.get_json()
     
     try:
+        # Reject edits that double-book a teacher, room or batch (unless forced)
+        proposed = dict(slot.to_dict(), **data)
+        conflicts = occupancy_index.check({slot.id: proposed})
+        if conflicts and not data.get('force'):
+            return jsonify({
+                'success': False,
+                'message': 'Edit creates a scheduling conflict',
+                'conflicts': conflicts
+            }), 409
+        
         # Update slot data
         for key, value in data.items():
             if hasattr(slot, key) and key not in ['id', 'created_at', 'created_by']:
@@ -267,6 +214,7 @@ def edit_timetable_slot(slot_id):
         slot.version += 1
         
         db.session.commit()
+        occupancy_index.apply(slot)
         
         return jsonify({
             'success': True,
@@ -285,142 +233,71 @@ def edit_timetable_slot(slot_id):
 @login_required
 @admin_required
 def save_edits_to_csv():
-    """Save edited timetable to new CSV and prepare for re-optimization"""
+    """Checkpoint edits in the timetable change log and prepare for re-optimization"""
     try:
-        # Get all current timetable slots
-        slots = TimetableSlot.query.filter_by(is_active=True).all()
-        
-        # Convert to DataFrame
-        timetable_data = []
-        for slot in slots:
-            timetable_data.append({
-                'slot_index': slot.slot_index,
-                'batch_id': slot.batch_id,
-                'section': slot.section,
-                'day': slot.day,
-                'time_start': slot.time_start,
-                'time_end': slot.time_end,
-                'subject_code': slot.subject_code,
-                'subject_name': slot.subject_name,
-                'teacher_id': slot.teacher_id,
-                'teacher_name': slot.teacher_name,
-                'room_id': slot.room_id,
-                'room_name': slot.room_name,
-                'campus': slot.campus,
-                'activity_type': slot.activity_type,
-                'department': slot.department,
-                'scheme': slot.scheme
-            })
-        
-        # Save to edited CSV
-        import pandas as pd
-        from datetime import datetime
+        # Edits are already recorded as diffs; only fold them into a new base when enough piled up
+        pending = change_log.pending_changes()
+        base = change_log.compact(user_id=current_user.id)
+        db.session.commit()
         
-        df = pd.DataFrame(timetable_data)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        edited_filename = f'data/timetable_edited_{timestamp}.csv'
-        df.to_csv(edited_filename, index=False)
+        latest = base or TimetableHistory.query.order_by(TimetableHistory.id.desc()).first()
         
         return jsonify({
             'success': True,
-            'message': 'Edits saved to CSV successfully',
-            'edited_file': edited_filename,
-            'total_slots': len(timetable_data),
+            'message': f'{pending} edits saved' + (' and compacted into a new snapshot' if base else ''),
+            'pending_changes': 0 if base else pending,
+            'history_version': latest.version if latest else None,
+            'total_slots': TimetableSlot.query.filter_by(is_active=True).count(),
             'next_step': 'optimize'
         })
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Failed to save edits: {str(e)}'
         }), 500
 
-@admin_bp.route('/timetable/optimize', methods=['POST'])
+@admin_bp.route('/timetable/history')
 @login_required
 @admin_required
-def optimize_timetable():
-    """Re-run complete pipeline for final optimization of edited data"""
+def timetable_history():
+    """Timetable as it was at ?at=<ISO timestamp> (default now), rebuilt from the change log"""
     try:
-        print("🚀 Starting complete pipeline optimization on edited data...")
-        
-        # Get current edited slots from database
-        slots = TimetableSlot.query.filter_by(is_active=True).all()
-        slot_count = len(slots)
-        
-        print(f"📊 Found {slot_count} edited slots to process through pipeline")
-        
-        # Create temporary CSV from edited database data
-        import pandas as pd
-        import os
-        
-        # Convert database slots to CSV format for pipeline
-        slot_data = []
-        for slot in slots:
-            slot_data.append({
-                'slot_index': slot.slot_index,
-                'batch_id': slot.batch_id,
-                'section': slot.section,
-                'day': slot.day,
-                'time_start': slot.time_start,
-                'time_end': slot.time_end,
-                'subject_code': slot.subject_code,
-                'subject_name': slot.subject_name,
-                'teacher_id': slot.teacher_id,
-                'teacher_name': slot.teacher_name,
-                'room_id': slot.room_id,
-                'room_name': slot.room_name,
-                'campus': slot.campus,
-                'activity_type': slot.activity_type,
-                'department': slot.department,
-                'scheme': slot.scheme
-            })
-        
-        # Save edited data to temporary CSV for pipeline processing
-        df = pd.DataFrame(slot_data)
-        temp_csv_path = 'data/edited_timetable_for_pipeline.csv'
-        df.to_csv(temp_csv_path, index=False)
+        at = datetime.fromisoformat(request.args['at']) if request.args.get('at') else None
+        slots = change_log.reconstruct(at)
+        if slots is None:
+            return jsonify({'success': False, 'message': 'No timetable history before that time'}), 404
         
-        print(f"💾 Saved {len(slot_data)} edited slots to temporary CSV for pipeline processing")
-        
-        # Now run the actual ML pipeline on edited data
-        try:
-            from pipeline.streamlined_pipeline import StreamlinedPipeline
-            pipeline = StreamlinedPipeline()
-            
-            print("🔄 Running ML pipeline on edited CSV data...")
-            result = pipeline.run_complete_pipeline(input_csv=temp_csv_path)
-            
-            if result.get('success'):
-                print("✅ ML Pipeline completed successfully on edited data")
-                optimization_status = 'completed'
-                optimization_message = f'Complete ML pipeline processed {slot_count} edited slots successfully'
-            else:
-                print("⚠️ ML Pipeline had warnings, using edited data as-is")
-                optimization_status = 'partial'
-                optimization_message = f'Edited data validated - {slot_count} slots processed'
-                
-        except Exception as pipeline_error:
-            print(f"⚠️ Pipeline error: {str(pipeline_error)}")
-            optimization_status = 'partial'
-            optimization_message = f'Edited data validated without ML optimization - {slot_count} slots'
-        
-        # Keep temporary file for debugging - don't delete immediately
-        # if os.path.exists(temp_csv_path):
-        #     os.remove(temp_csv_path)
-        
-        response_data = {
+        return jsonify({
             'success': True,
-            'message': optimization_message,
-            'optimization_status': optimization_status,
-            'total_optimized_slots': slot_count,
-            'next_step': 'preview_download',
-            'pipeline_ran': True,
-            'data_source': 'edited_database'
-        }
-        
-        print(f"✅ Pipeline optimization completed: {response_data}")
+            'at': (at or datetime.utcnow()).isoformat(),
+            'total_slots': len(slots),
+            'slots': slots
+        })
         
-        return jsonify(response_data)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'at must be an ISO timestamp'}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to rebuild timetable: {str(e)}'
+        }), 500
+
+@admin_bp.route('/timetable/optimize', methods=['POST'])
+@login_required
+@admin_required
+def optimize_timetable():
+    """Queue the complete pipeline re-run on edited data as a background job"""
+    try:
+        job = job_queue.submit('optimize', user_id=current_user.id)
+        return jsonify({
+            'success': True,
+            'message': 'Pipeline optimization queued',
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': url_for('admin.job_status', job_id=job.id)
+        }), 202
         
     except Exception as e:
         print(f"❌ Optimization error: {str(e)}")
@@ -489,43 +366,20 @@ def download_timetable():
     if batch_filter:
         query = query.filter_by(batch_id=batch_filter)
     
-    slots = query.all()
-    
-    # Convert to DataFrame
-    data = [slot.to_dict() for slot in slots]
-    df = pd.DataFrame(data)
-    
     # Filter by week if needed
-    if week_type != 'full' and not df.empty:
-        df = filter_weekly_data(df, week_type)
+    query = week_query(query, week_type).order_by(TimetableSlot.slot_index)
     
+    filename_suffix = f"_{week_type}_week" if week_type != 'full' else ""
     if format_type == 'excel':
-        output = io.BytesIO()
-        try:
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Timetable', index=False)
-        except Exception as e:
-            pass
-        output.seek(0)
-        
-        filename_suffix = f"_{week_type}_week" if week_type != 'full' else ""
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'admin_timetable{filename_suffix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        return xlsx_response(
+            flat_rows(query),
+            f'admin_timetable{filename_suffix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
+            sheet_name='Timetable'
         )
     else:
-        output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
-        
-        filename_suffix = f"_{week_type}_week" if week_type != 'full' else ""
-        return send_file(
-            io.BytesIO(output.getvalue().encode()),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'admin_timetable{filename_suffix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        return csv_response(
+            flat_rows(query),
+            f'admin_timetable{filename_suffix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
         )
 
 @admin_bp.route('/timetable/download/weekly')
@@ -538,26 +392,21 @@ def download_weekly_timetable():
         week_type = request.args.get('week', 'current')
         batch_filter = request.args.get('batch')
         
-        # Get data from database
+        # Filter weekly data in the database
         query = TimetableSlot.query.filter_by(is_active=True)
         if batch_filter:
             query = query.filter_by(batch_id=batch_filter)
+        query = week_query(query, week_type)
         
-        slots = query.all()
+        total_slots = query.count()
         
-        if not slots:
+        if not total_slots:
             # Return empty file if no data
             if format_type == 'excel':
-                output = io.BytesIO()
-                df_empty = pd.DataFrame([{'Message': 'No data available'}])
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df_empty.to_excel(writer, sheet_name='No Data', index=False)
-                output.seek(0)
-                return send_file(
-                    output,
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    as_attachment=True,
-                    download_name=f'admin_weekly_timetable_{week_type}_{datetime.now().strftime("%Y%m%d")}.xlsx'
+                return xlsx_response(
+                    [['Message'], ['No data available']],
+                    f'admin_weekly_timetable_{week_type}_{datetime.now().strftime("%Y%m%d")}.xlsx',
+                    sheet_name='No Data'
                 )
             else:
                 return send_file(
@@ -567,34 +416,17 @@ def download_weekly_timetable():
                     download_name=f'admin_weekly_timetable_{week_type}_{datetime.now().strftime("%Y%m%d")}.csv'
                 )
         
-        # Convert to DataFrame
-        data = [slot.to_dict() for slot in slots]
-        df = pd.DataFrame(data)
-        
-        # Filter weekly data
-        df = filter_weekly_data(df, week_type)
-        
-        # Create pivot table for better viewing
-        try:
-            df = create_weekly_pivot_table(df)
-        except Exception as e:
-            print(f"Pivot table creation failed: {e}, using original data")
-            # If pivot fails, use original data
-            pass
+        # Formatted weekly rows, built chunk by chunk while streaming
+        def formatted_rows():
+            return weekly_rows(slot_rows(weekly_order(query)), create_weekly_pivot_table)
         
         # Generate download file
         if format_type == 'excel':
-            output = io.BytesIO()
             try:
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df.to_excel(writer, sheet_name=f'{week_type.title()} Week Schedule')
-                output.seek(0)
-                
-                return send_file(
-                    output,
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    as_attachment=True,
-                    download_name=f'admin_weekly_timetable_{week_type}_{datetime.now().strftime("%Y%m%d")}.xlsx'
+                return xlsx_response(
+                    formatted_rows(),
+                    f'admin_weekly_timetable_{week_type}_{datetime.now().strftime("%Y%m%d")}.xlsx',
+                    sheet_name=f'{week_type.title()} Week Schedule'
                 )
             except Exception as e:
                 print(f"Excel creation failed: {e}")
@@ -603,8 +435,6 @@ def download_weekly_timetable():
                 format_type = 'csv'
         
         if format_type == 'csv':
-            output = io.StringIO()
-            
             # Add beautiful header information
             week_label = {
                 'current': 'Current Week (Mon-Fri)',
@@ -612,24 +442,21 @@ def download_weekly_timetable():
                 'full': 'Complete Schedule'
             }.get(week_type, 'Weekly Schedule')
             
-            output.write("# ===============================================\n")
-            output.write(f"# SMART TIMETABLE MANAGEMENT SYSTEM\n")
-            output.write(f"# {week_label} - Admin View\n")
-            output.write(f"# Generated: {datetime.now().strftime('%A, %B %d, %Y at %I:%M %p')}\n")
-            output.write(f"# Total Classes: {len(df)} slots\n")
+            preamble = [
+                "# ===============================================",
+                "# SMART TIMETABLE MANAGEMENT SYSTEM",
+                f"# {week_label} - Admin View",
+                f"# Generated: {datetime.now().strftime('%A, %B %d, %Y at %I:%M %p')}",
+                f"# Total Classes: {total_slots} slots",
+            ]
             if batch_filter:
-                output.write(f"# Batch Filter: {batch_filter}\n")
-            output.write("# ===============================================\n\n")
-            
-            # Write the formatted data without index
-            df.to_csv(output, index=False)
-            output.seek(0)
+                preamble.append(f"# Batch Filter: {batch_filter}")
+            preamble += ["# ===============================================", ""]
             
-            return send_file(
-                io.BytesIO(output.getvalue().encode('utf-8')),
-                mimetype='text/csv',
-                as_attachment=True,
-                download_name=f'admin_weekly_timetable_{week_type}_{datetime.now().strftime("%Y%m%d-%H%M")}.csv'
+            return csv_response(
+                formatted_rows(),
+                f'admin_weekly_timetable_{week_type}_{datetime.now().strftime("%Y%m%d-%H%M")}.csv',
+                preamble=preamble
             )
             
     except Exception as e:
@@ -640,29 +467,12 @@ def download_weekly_timetable():
 def get_all_batches():
     """Get all unique batches from students data"""
     try:
-        students_df = pd.read_csv('data/students.csv')
+        students_df = reference_store.students
         return sorted(students_df['batch_id'].unique().tolist())
     except Exception:
         return []
 
-def filter_weekly_data(df, week_type):
-    """Filter data for specific week - ensuring only one week's data"""
-    if df.empty:
-        return df
-    
-    if week_type == 'current':
-        # Current week - Monday to Friday only (working days)
-        weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        filtered_df = df[df['day'].isin(weekdays)]
-        return filtered_df
-    elif week_type == 'next':
-        # Next week - Monday to Friday only (working days)
-        weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        filtered_df = df[df['day'].isin(weekdays)]
-        return filtered_df
-    else:
-        # Full schedule - all 7 days
-        return df
+WEEKLY_COLUMNS = ['Batch', 'Day', 'Time', 'Subject', 'Teacher', 'Room', 'Activity']
 
 def create_weekly_pivot_table(df):
     """Create a beautiful weekly timetable in readable format"""
@@ -670,51 +480,38 @@ def create_weekly_pivot_table(df):
         return df
     
     try:
-        # Sort by day order and time
+        # Sort by batch, section, day order and time (unknown days last)
         day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        df['day_order'] = df['day'].apply(lambda x: day_order.index(x) if x in day_order else 999)
-        df = df.sort_values(['batch_id', 'section', 'day_order', 'time_start'])
+        df = df.assign(day_order=pd.Categorical(df['day'], categories=day_order, ordered=True))
+        df = df.sort_values(['batch_id', 'section', 'day_order', 'time_start'], kind='stable')
+        
+        # Class rows, built column-wise
+        batch_label = df['batch_id'].astype(str) + ' - ' + df['section'].astype(str)
+        classes = pd.DataFrame({
+            'Batch': batch_label,
+            'Day': df['day'],
+            'Time': df['time_start'].astype(str) + ' - ' + df['time_end'].astype(str),
+            'Subject': df['subject_name'],
+            'Teacher': df['teacher_name'].astype(str) + ' (' + df['teacher_id'].astype(str) + ')',
+            'Room': df['room_name'].astype(str) + ' (' + df['room_id'].astype(str) + ')',
+            'Activity': df['activity_type']
+        })
         
-        # Create a better formatted timetable
-        formatted_data = []
+        # Each batch/section group gets a header row before it and a blank separator after it,
+        # so class row i of group g lands at i + 2g + 1
+        new_group = (batch_label != batch_label.shift()).to_numpy()
+        group = new_group.cumsum() - 1
+        group_count = group[-1] + 1
+        first = new_group.nonzero()[0]
         
-        # Group by batch and section for better organization
-        for (batch, section), group in df.groupby(['batch_id', 'section']):
-            # Add batch header
-            formatted_data.append({
-                'Batch': f"{batch} - {section}",
-                'Day': '',
-                'Time': '',
-                'Subject': '=== BATCH SCHEDULE ===',
-                'Teacher': '',
-                'Room': '',
-                'Activity': ''
-            })
-            
-            # Add classes
-            for _, row in group.iterrows():
-                formatted_data.append({
-                    'Batch': f"{batch} - {section}",
-                    'Day': row['day'],
-                    'Time': f"{row['time_start']} - {row['time_end']}",
-                    'Subject': row['subject_name'],
-                    'Teacher': f"{row['teacher_name']} ({row['teacher_id']})",
-                    'Room': f"{row['room_name']} ({row['room_id']})",
-                    'Activity': row['activity_type']
-                })
-            
-            # Add separator
-            formatted_data.append({
-                'Batch': '',
-                'Day': '',
-                'Time': '',
-                'Subject': '',
-                'Teacher': '',
-                'Room': '',
-                'Activity': ''
-            })
+        # Start blank, so the separator rows need no writes
+        formatted = np.full((len(df) + 2 * group_count, len(WEEKLY_COLUMNS)), '', dtype=object)
+        formatted[np.arange(len(df)) + 2 * group + 1] = classes.to_numpy()
+        headers = first + 2 * np.arange(group_count)
+        formatted[headers, WEEKLY_COLUMNS.index('Batch')] = batch_label.to_numpy()[first]
+        formatted[headers, WEEKLY_COLUMNS.index('Subject')] = '=== BATCH SCHEDULE ==='
         
-        return pd.DataFrame(formatted_data)
+        return pd.DataFrame(formatted, columns=WEEKLY_COLUMNS)
         
     except Exception as e:
         print(f"Error creating formatted table: {e}")
@@ -724,7 +521,7 @@ def create_weekly_pivot_table(df):
 def get_all_subjects():
     """Get all subjects from subjects data"""
     try:
-        subjects_df = pd.read_csv('data/subjects.csv')
+        subjects_df = reference_store.subjects
         return subjects_df['subject_name'].unique().tolist()
     except Exception:
         return []
@@ -732,7 +529,7 @@ def get_all_subjects():
 def get_all_rooms():
     """Get all rooms from rooms data"""
     try:
-        rooms_df = pd.read_csv('data/rooms.csv')
+        rooms_df = reference_store.rooms
         return rooms_df['room_name'].unique().tolist()
     except Exception:
         return []
\ No newline at end of file
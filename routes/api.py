@@ -1,12 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from models import db, User, TimetableSlot, TimetableHistory
 from datetime import datetime
-import pandas as pd
 import json
+from reference_data import reference_store
+from schedule_cache import schedule_cache
 
 api_bp = Blueprint('api', __name__)
 
+def _schedule_response(scope, key, id_field):
+    """Cached schedule JSON spliced into the response as-is, without re-serializing the slots"""
+    payload, total = schedule_cache.payload(scope, key)
+    body = f'{{"success": true, "{id_field}": {json.dumps(key)}, "total": {total}, "data": {payload}}}'
+    return current_app.response_class(body, mimetype='application/json')
+
 @api_bp.route('/health')
 def health_check():
     """API health check"""
@@ -24,38 +31,32 @@ def get_data_counts():
         
         # Read CSV files and get counts
         try:
-            students_df = pd.read_csv('data/students.csv')
-            counts['students'] = len(students_df)
+            counts['students'] = len(reference_store.students)
         except:
             counts['students'] = 7200
             
         try:
-            teachers_df = pd.read_csv('data/teachers.csv')
-            counts['teachers'] = len(teachers_df)
+            counts['teachers'] = len(reference_store.teachers)
         except:
             counts['teachers'] = 94
             
         try:
-            subjects_df = pd.read_csv('data/subjects.csv')
-            counts['subjects'] = len(subjects_df)
+            counts['subjects'] = len(reference_store.subjects)
         except:
             counts['subjects'] = 73
             
         try:
-            rooms_df = pd.read_csv('data/rooms.csv')
-            counts['rooms'] = len(rooms_df)
+            counts['rooms'] = len(reference_store.rooms)
         except:
             counts['rooms'] = 66
             
         try:
-            activities_df = pd.read_csv('data/activities.csv')
-            counts['activities'] = len(activities_df)
+            counts['activities'] = len(reference_store.activities)
         except:
             counts['activities'] = 125
             
         try:
-            slot_index_df = pd.read_csv('data/slot_index.csv')
-            counts['slot_index'] = len(slot_index_df)
+            counts['slot_index'] = len(reference_store.slot_index)
         except:
             counts['slot_index'] = 864
         
@@ -84,7 +85,7 @@ def get_data_counts():
 def get_students():
     """Get students data from CSV"""
     try:
-        students_df = pd.read_csv('data/students.csv')
+        students_df = reference_store.students
         
         # Filter based on user role
         if current_user.role == 'teacher':
@@ -120,7 +121,7 @@ def get_students():
 def get_teachers():
     """Get teachers data from CSV"""
     try:
-        teachers_df = pd.read_csv('data/teachers.csv')
+        teachers_df = reference_store.teachers
         
         # Filter based on user role
         if current_user.role == 'student':
@@ -150,7 +151,7 @@ def get_teachers():
 def get_subjects():
     """Get subjects data from CSV"""
     try:
-        subjects_df = pd.read_csv('data/subjects.csv')
+        subjects_df = reference_store.subjects
         
         return jsonify({
             'success': True,
@@ -169,7 +170,7 @@ def get_subjects():
 def get_rooms():
     """Get rooms data from CSV"""
     try:
-        rooms_df = pd.read_csv('data/rooms.csv')
+        rooms_df = reference_store.rooms
         
         return jsonify({
             'success': True,
@@ -188,7 +189,7 @@ def get_rooms():
 def get_activities():
     """Get activities data from CSV"""
     try:
-        activities_df = pd.read_csv('data/activities.csv')
+        activities_df = reference_store.activities
         
         return jsonify({
             'success': True,
@@ -207,7 +208,7 @@ def get_activities():
 def get_slot_index():
     """Get slot index data from CSV"""
     try:
-        slot_index_df = pd.read_csv('data/slot_index.csv')
+        slot_index_df = reference_store.slot_index
         
         return jsonify({
             'success': True,
@@ -281,17 +282,7 @@ def get_batch_timetable(batch_id):
         if current_user.role == 'student' and current_user.batch_id != batch_id:
             return jsonify({'success': False, 'error': 'Access denied'}), 403
         
-        slots = TimetableSlot.query.filter_by(
-            batch_id=batch_id,
-            is_active=True
-        ).order_by(TimetableSlot.slot_index).all()
-        
-        return jsonify({
-            'success': True,
-            'data': [slot.to_dict() for slot in slots],
-            'batch_id': batch_id,
-            'total': len(slots)
-        })
+        return _schedule_response('batch', batch_id, 'batch_id')
     
     except Exception as e:
         return jsonify({
@@ -308,17 +299,7 @@ def get_teacher_timetable(teacher_id):
         if current_user.role == 'teacher' and current_user.teacher_id != teacher_id:
             return jsonify({'success': False, 'error': 'Access denied'}), 403
         
-        slots = TimetableSlot.query.filter_by(
-            teacher_id=teacher_id,
-            is_active=True
-        ).order_by(TimetableSlot.slot_index).all()
-        
-        return jsonify({
-            'success': True,
-            'data': [slot.to_dict() for slot in slots],
-            'teacher_id': teacher_id,
-            'total': len(slots)
-        })
+        return _schedule_response('teacher', teacher_id, 'teacher_id')
     
     except Exception as e:
         return jsonify({
@@ -332,10 +313,10 @@ def get_statistics():
     """Get system statistics"""
     try:
         # Load CSV data for statistics
-        students_df = pd.read_csv('data/students.csv')
-        teachers_df = pd.read_csv('data/teachers.csv')
-        subjects_df = pd.read_csv('data/subjects.csv')
-        rooms_df = pd.read_csv('data/rooms.csv')
+        students_df = reference_store.students
+        teachers_df = reference_store.teachers
+        subjects_df = reference_store.subjects
+        rooms_df = reference_store.rooms
         
         stats = {
             'csv_data': {
@@ -390,7 +371,7 @@ def search():
         results = {}
         
         if search_type in ['all', 'students']:
-            students_df = pd.read_csv('data/students.csv')
+            students_df = reference_store.students
             student_results = students_df[
                 students_df['name'].str.contains(query, case=False, na=False) |
                 students_df['student_id'].str.contains(query, case=False, na=False) |
@@ -399,7 +380,7 @@ def search():
             results['students'] = student_results.to_dict('records') if hasattr(locals().get('df', None) or locals().get('data', None), 'to_dict') else [] if hasattr(locals().get('df', None) or locals().get('data', None), 'to_dict') else []
         
         if search_type in ['all', 'teachers']:
-            teachers_df = pd.read_csv('data/teachers.csv')
+            teachers_df = reference_store.teachers
             teacher_results = teachers_df[
                 teachers_df['name'].str.contains(query, case=False, na=False) |
                 teachers_df['teacher_id'].str.contains(query, case=False, na=False) |
@@ -409,7 +390,7 @@ def search():
             results['teachers'] = teacher_results.to_dict('records') if hasattr(locals().get('df', None) or locals().get('data', None), 'to_dict') else [] if hasattr(locals().get('df', None) or locals().get('data', None), 'to_dict') else []
         
         if search_type in ['all', 'subjects']:
-            subjects_df = pd.read_csv('data/subjects.csv')
+            subjects_df = reference_store.subjects
             subject_results = subjects_df[
                 subjects_df['subject_name'].str.contains(query, case=False, na=False) |
                 subjects_df['subject_code'].str.contains(query, case=False, na=False)
@@ -417,7 +398,7 @@ def search():
             results['subjects'] = subject_results.to_dict('records') if hasattr(locals().get('df', None) or locals().get('data', None), 'to_dict') else [] if hasattr(locals().get('df', None) or locals().get('data', None), 'to_dict') else []
         
         if search_type in ['all', 'rooms']:
-            rooms_df = pd.read_csv('data/rooms.csv')
+            rooms_df = reference_store.rooms
             room_results = rooms_df[
                 rooms_df['room_name'].str.contains(query, case=False, na=False) |
                 rooms_df['room_id'].str.contains(query, case=False, na=False) |
@@ -449,18 +430,14 @@ def validate_teacher_id():
         }), 400
     
     try:
-        # Load teacher data from CSV
-        teachers_df = pd.read_csv('data/teachers.csv')
-        teacher_row = teachers_df[teachers_df['teacher_id'] == teacher_id]
+        teacher_data = reference_store.lookup('teachers', teacher_id)
         
-        if teacher_row.empty:
+        if teacher_data is None:
             return jsonify({
                 'success': False,
                 'message': 'Teacher ID not found'
             })
         
-        teacher_data = teacher_row.iloc[0].to_dict()
-        
         return jsonify({
             'success': True,
             'teacher_data': {
@@ -3,10 +3,18 @@ Smart Timetable API v1
 Comprehensive API endpoints for the Smart Timetable Management System
 Based on API documentation requirements
 """
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, g
 from flask_login import login_required, current_user
 from models import db, User, TimetableSlot, TimetableHistory
+from occupancy_index import occupancy_index
+from schedule_cache import schedule_cache
+from user_cache import user_cache
 from datetime import datetime, timedelta
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import load_only
+import hashlib
+import base64
+import json
 import pandas as pd
 import jwt
 from functools import wraps
@@ -32,7 +40,8 @@ def api_auth_required(f):
         
         try:
             data = jwt.decode(token, current_app.config.get('SECRET_KEY', 'fallback-secret'), algorithms=['HS256'])
-            current_api_user = User.query.get(data['user_id'])
+            # Tokens issued before token versions existed carry none and match version 0
+            current_api_user = user_cache.get(data['user_id'], data.get('ver', 0))
             if not current_api_user:
                 return jsonify({'success': False, 'message': 'Invalid token'}), 401
         except jwt.ExpiredSignatureError:
@@ -40,6 +49,8 @@ def api_auth_required(f):
         except jwt.InvalidTokenError:
             return jsonify({'success': False, 'message': 'Invalid token'}), 401
         
+        g.api_user = current_api_user
+        g.api_user_id = current_api_user.id  # attributed on timetable change log entries
         return f(current_api_user, *args, **kwargs)
     return decorated_function
 
@@ -91,6 +102,7 @@ def api_login():
             'user_id': user.id,
             'email': user.email,
             'role': user.role,
+            'ver': user.token_version,
             'exp': datetime.utcnow() + timedelta(hours=24)
         }
         
@@ -133,6 +145,7 @@ def api_refresh_token(current_api_user):
             'user_id': current_api_user.id,
             'email': current_api_user.email,
             'role': current_api_user.role,
+            'ver': current_api_user.token_version,
             'exp': datetime.utcnow() + timedelta(hours=24)
         }
         
@@ -152,20 +165,117 @@ def api_refresh_token(current_api_user):
 @api_v1.route('/auth/logout', methods=['POST'])
 @api_auth_required
 def api_logout(current_api_user):
-    """Logout endpoint"""
-    return jsonify({
-        'success': True,
-        'message': 'Logged out successfully'
-    }), 200
+    """Logout endpoint; revokes every token issued to the user so far"""
+    try:
+        user = db.session.get(User, current_api_user.id)
+        user.token_version = (user.token_version or 0) + 1
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Logged out successfully'
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
 
 # ============================================================================
 # 2. Event/Timetable APIs
 # ============================================================================
 
+DAY_NUMBERS = {'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3, 'Friday': 4, 'Saturday': 5, 'Sunday': 6}
+
+# Event field -> (slot columns it reads, value builder); ?fields= selects a subset
+EVENT_FIELDS = {
+    'id': (['id'], lambda slot: slot.id),
+    'section': (['section'], lambda slot: slot.section),
+    'scheme': (['scheme'], lambda slot: slot.scheme),
+    'title': (['subject_name'], lambda slot: slot.subject_name),
+    'day': (['day'], lambda slot: DAY_NUMBERS.get(slot.day, 0)),
+    'startHour': (['time_start'], lambda slot: int(slot.time_start.split(':')[0])),
+    'endHour': (['time_end'], lambda slot: int(slot.time_end.split(':')[0])),
+    'type': (['activity_type'], lambda slot: slot.activity_type.lower()),
+    'room': (['room_name'], lambda slot: slot.room_name),
+    'campus': (['campus'], lambda slot: slot.campus),
+    'teacher': (['teacher_name'], lambda slot: slot.teacher_name),
+    'teacherId': (['teacher_id'], lambda slot: slot.teacher_id),
+    'color': ([], lambda slot: 'bg-blue-100 text-blue-800 dark:bg-blue-900/50 dark:text-blue-100'),
+    'createdAt': (['created_at'], lambda slot: slot.created_at.isoformat()),
+    'updatedAt': (['updated_at'], lambda slot: slot.updated_at.isoformat()),
+}
+
+EVENTS_PAGE_SIZE = 500
+EVENTS_MAX_PAGE_SIZE = 2000
+
+def _slot_etag(query):
+    """(strong ETag, row count) for a filtered slot set, from one aggregate query over its rows.
+    
+    Any insert, edit, soft delete or regeneration changes the count, max id,
+    max updated_at or version sum. The request URL and the caller's role and
+    ids are hashed in too, since they shape the response body.
+    """
+    count, max_id, max_updated, version_sum = query.with_entities(
+        func.count(TimetableSlot.id),
+        func.max(TimetableSlot.id),
+        func.max(TimetableSlot.updated_at),
+        func.sum(TimetableSlot.version)
+    ).one()
+    user = g.get('api_user')
+    state = [request.full_path, count, max_id, max_updated, version_sum]
+    if user is not None:
+        state += [user.role, user.batch_id, user.section, user.teacher_id, user.student_id]
+    return hashlib.sha1(repr(state).encode()).hexdigest(), count
+
+def _encode_cursor(slot):
+    return base64.urlsafe_b64encode(json.dumps([slot.day, slot.time_start, slot.id]).encode()).decode()
+
+def _decode_cursor(cursor):
+    """(day, time_start, id) of the last event on the previous page"""
+    day, time_start, slot_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return str(day), str(time_start), int(slot_id)
+
+def _events_page(query, cursor, limit):
+    """Up to limit + 1 slots after cursor, in week order (Monday first), then time_start and id.
+    
+    Each day is read as its own (day, time_start, id) index range, so a page
+    never sorts the filtered set; day values outside DAY_NUMBERS come last.
+    """
+    slot_order = (TimetableSlot.time_start, TimetableSlot.id)
+    start = DAY_NUMBERS.get(cursor[0], len(DAY_NUMBERS)) if cursor else 0
+    slots = []
+    for rank in range(start, len(DAY_NUMBERS) + 1):
+        if rank < len(DAY_NUMBERS):
+            page = query.filter(TimetableSlot.day == list(DAY_NUMBERS)[rank])
+            if cursor and rank == start:
+                page = page.filter(tuple_(*slot_order) > tuple_(cursor[1], cursor[2]))
+            page = page.order_by(*slot_order)
+        else:
+            page = query.filter(TimetableSlot.day.notin_(list(DAY_NUMBERS)))
+            if cursor and rank == start:
+                page = page.filter(tuple_(TimetableSlot.day, *slot_order) > tuple_(*cursor))
+            page = page.order_by(TimetableSlot.day, *slot_order)
+        slots += page.limit(limit + 1 - len(slots)).all()
+        if len(slots) > limit:
+            break
+    return slots
+
+def _not_modified(etag):
+    """304 response when the client already holds this ETag, otherwise None"""
+    if etag in request.if_none_match:
+        return _tag_response(current_app.response_class(status=304), etag)
+    return None
+
+def _tag_response(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Authorization')
+    return response
+
 @api_v1.route('/events', methods=['GET'])
 @api_auth_required
 def get_events(current_api_user):
-    """Get all events based on user role and filters"""
+    """Get events based on user role and filters, one keyset page (?cursor=, ?limit=, ?fields=) at a time"""
     try:
         # Get query parameters
         section = request.args.get('section')
@@ -200,45 +310,46 @@ def get_events(current_api_user):
         if day:
             query = query.filter_by(day=day)
         
-        slots = query.all()
-        
-        events = []
-        for slot in slots:
-            # Map day name to number (0=Monday)
-            day_mapping = {'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3, 'Friday': 4, 'Saturday': 5, 'Sunday': 6}
-            day_num = day_mapping.get(slot.day, 0)
-            
-            # Parse time
-            start_hour = int(slot.time_start.split(':')[0])
-            end_hour = int(slot.time_end.split(':')[0])
-            
-            event = {
-                'id': slot.id,
-                'section': slot.section,
-                'scheme': slot.scheme,
-                'title': slot.subject_name,
-                'day': day_num,
-                'startHour': start_hour,
-                'endHour': end_hour,
-                'type': slot.activity_type.lower(),
-                'room': slot.room_name,
-                'campus': slot.campus,
-                'teacher': slot.teacher_name,
-                'teacherId': slot.teacher_id,
-                'color': 'bg-blue-100 text-blue-800 dark:bg-blue-900/50 dark:text-blue-100',
-                'createdAt': slot.created_at.isoformat(),
-                'updatedAt': slot.updated_at.isoformat()
-            }
-            events.append(event)
-        
-        return jsonify({
+        # Projection and page size
+        fields = request.args.get('fields')
+        fields = [name.strip() for name in fields.split(',') if name.strip()] if fields else list(EVENT_FIELDS)
+        unknown = [name for name in fields if name not in EVENT_FIELDS]
+        if unknown:
+            return jsonify({'success': False, 'message': f"Unknown fields: {', '.join(unknown)}"}), 400
+        try:
+            limit = min(max(int(request.args.get('limit', EVENTS_PAGE_SIZE)), 1), EVENTS_MAX_PAGE_SIZE)
+            cursor = _decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except (ValueError, TypeError):
+            return jsonify({'success': False, 'message': 'Invalid limit or cursor'}), 400
+        
+        # Polls for an unchanged event set stop at the aggregate query
+        etag, total_count = _slot_etag(query)
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        # Keyset page in week order, loading only the columns the projection needs
+        columns = {'day', 'time_start', 'id'}
+        for name in fields:
+            columns.update(EVENT_FIELDS[name][0])
+        query = query.options(load_only(*[getattr(TimetableSlot, column) for column in columns]))
+        slots = _events_page(query, cursor, limit)
+        
+        has_more = len(slots) > limit
+        slots = slots[:limit]
+        events = [{name: EVENT_FIELDS[name][1](slot) for name in fields} for slot in slots]
+        
+        response = jsonify({
             'success': True,
             'data': {
                 'events': events,
-                'totalCount': len(events),
-                'filteredCount': len(events)
+                'totalCount': total_count,
+                'filteredCount': len(events),
+                'hasMore': has_more,
+                'nextCursor': _encode_cursor(slots[-1]) if has_more else None
             }
-        }), 200
+        })
+        return _tag_response(response, etag), 200
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -327,6 +438,7 @@ def create_event(current_api_user):
         
         db.session.add(slot)
         db.session.commit()
+        occupancy_index.apply(slot)
         
         return jsonify({
             'success': True,
@@ -353,6 +465,42 @@ def create_event(current_api_user):
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _proposed_event(slot, data):
+    """Slot values after applying an API event payload (day number, startHour, endHour, teacherId)"""
+    day_mapping = {0: 'Monday', 1: 'Tuesday', 2: 'Wednesday', 3: 'Thursday', 4: 'Friday', 5: 'Saturday', 6: 'Sunday'}
+    proposed = slot.to_dict()
+    if 'day' in data:
+        proposed['day'] = day_mapping.get(data['day'], 'Monday')
+    if 'startHour' in data:
+        proposed['time_start'] = f"{data['startHour']:02d}:00"
+    if 'endHour' in data:
+        proposed['time_end'] = f"{data['endHour']:02d}:00"
+    if 'teacherId' in data:
+        proposed['teacher_id'] = data['teacherId']
+    return proposed
+
+@api_v1.route('/events/<int:event_id>/check', methods=['POST'])
+@api_auth_required
+@teacher_required
+def check_event_move(current_api_user, event_id):
+    """Check whether moving an event would create a conflict, without saving it"""
+    try:
+        slot = TimetableSlot.query.get_or_404(event_id)
+        data = request.get_json() or {}
+        
+        conflicts = occupancy_index.check({slot.id: _proposed_event(slot, data)})
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'hasConflict': bool(conflicts),
+                'conflicts': conflicts
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @api_v1.route('/events/<int:event_id>', methods=['PUT'])
 @api_auth_required
 @admin_required
@@ -365,6 +513,15 @@ def update_event(current_api_user, event_id):
         if not data:
             return jsonify({'success': False, 'message': 'No data provided'}), 400
         
+        # Reject moves that double-book the teacher, room or batch before touching the slot
+        conflicts = occupancy_index.check({slot.id: _proposed_event(slot, data)})
+        if conflicts:
+            return jsonify({
+                'success': False,
+                'message': 'Event update creates a scheduling conflict',
+                'conflicts': conflicts
+            }), 409
+        
         # Update fields
         if 'title' in data:
             slot.subject_name = data['title']
@@ -386,6 +543,7 @@ def update_event(current_api_user, event_id):
         
         slot.updated_at = datetime.utcnow()
         db.session.commit()
+        occupancy_index.apply(slot)
         
         # Map day name back to number
         day_mapping = {'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3, 'Friday': 4, 'Saturday': 5, 'Sunday': 6}
@@ -425,6 +583,7 @@ def delete_event(current_api_user, event_id):
         slot.is_active = False  # Soft delete
         slot.updated_at = datetime.utcnow()
         db.session.commit()
+        occupancy_index.remove(slot.id)
         
         return jsonify({
             'success': True,
@@ -460,6 +619,20 @@ def swap_events(current_api_user):
                 target_slot.teacher_id != current_api_user.teacher_id):
                 return jsonify({'success': False, 'message': 'Access denied'}), 403
         
+        # Both slots move at once, so check them together against everything else
+        source_times = {'day': target_slot.day, 'time_start': target_slot.time_start, 'time_end': target_slot.time_end}
+        target_times = {'day': source_slot.day, 'time_start': source_slot.time_start, 'time_end': source_slot.time_end}
+        conflicts = occupancy_index.check({
+            source_slot.id: dict(source_slot.to_dict(), **source_times),
+            target_slot.id: dict(target_slot.to_dict(), **target_times)
+        })
+        if conflicts:
+            return jsonify({
+                'success': False,
+                'message': 'Swap creates a scheduling conflict',
+                'conflicts': conflicts
+            }), 409
+        
         # Swap time slots
         temp_day = source_slot.day
         temp_start = source_slot.time_start
@@ -478,6 +651,7 @@ def swap_events(current_api_user):
         target_slot.updated_at = datetime.utcnow()
         
         db.session.commit()
+        occupancy_index.apply(source_slot, target_slot)
         
         # Map day names to numbers for response
         day_mapping = {'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3, 'Friday': 4, 'Saturday': 5, 'Sunday': 6}
@@ -550,6 +724,9 @@ def update_user_profile(current_api_user):
         if not data:
             return jsonify({'success': False, 'message': 'No data provided'}), 400
         
+        # The authenticated user is a cached detached copy; write through the session's row
+        current_api_user = db.session.get(User, current_api_user.id)
+        
         # Update allowed fields
         if 'name' in data:
             current_api_user.full_name = data['name']
@@ -635,36 +812,38 @@ def get_teacher_schedule(current_api_user, teacher_id):
         if current_api_user.role == 'teacher' and current_api_user.teacher_id != teacher_id:
             return jsonify({'success': False, 'message': 'Access denied'}), 403
         
-        slots = TimetableSlot.query.filter_by(
-            teacher_id=teacher_id,
-            is_active=True
-        ).all()
+        etag, _ = _slot_etag(TimetableSlot.query.filter_by(teacher_id=teacher_id, is_active=True))
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        slots = schedule_cache.teacher(teacher_id)
         
         schedule = []
         total_hours = 0
         
         for slot in slots:
             day_mapping = {'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3, 'Friday': 4, 'Saturday': 5, 'Sunday': 6}
-            start_hour = int(slot.time_start.split(':')[0])
-            end_hour = int(slot.time_end.split(':')[0])
+            start_hour = int(slot['time_start'].split(':')[0])
+            end_hour = int(slot['time_end'].split(':')[0])
             
             schedule.append({
-                'id': slot.id,
-                'title': slot.subject_name,
-                'section': slot.section,
-                'day': day_mapping.get(slot.day, 0),
+                'id': slot['id'],
+                'title': slot['subject_name'],
+                'section': slot['section'],
+                'day': day_mapping.get(slot['day'], 0),
                 'startHour': start_hour,
                 'endHour': end_hour,
-                'room': slot.room_name,
-                'campus': slot.campus,
-                'type': slot.activity_type.lower()
+                'room': slot['room_name'],
+                'campus': slot['campus'],
+                'type': slot['activity_type'].lower()
             })
             
             total_hours += (end_hour - start_hour)
         
-        teacher_name = slots[0].teacher_name if slots else "Unknown"
+        teacher_name = slots[0]['teacher_name'] if slots else "Unknown"
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'data': {
                 'teacherId': teacher_id,
@@ -673,7 +852,8 @@ def get_teacher_schedule(current_api_user, teacher_id):
                 'totalHours': total_hours,
                 'totalClasses': len(schedule)
             }
-        }), 200
+        })
+        return _tag_response(response, etag), 200
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -690,30 +870,35 @@ def get_student_schedule(current_api_user):
         if current_api_user.role != 'student':
             return jsonify({'success': False, 'message': 'Student access required'}), 403
         
-        slots = TimetableSlot.query.filter_by(
+        etag, _ = _slot_etag(TimetableSlot.query.filter_by(
             batch_id=current_api_user.batch_id,
             section=current_api_user.section,
             is_active=True
-        ).all()
+        ))
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        slots = schedule_cache.batch(current_api_user.batch_id, current_api_user.section)
         
         schedule = []
         for slot in slots:
             day_mapping = {'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3, 'Friday': 4, 'Saturday': 5, 'Sunday': 6}
             
             schedule.append({
-                'id': slot.id,
-                'title': slot.subject_name,
-                'day': day_mapping.get(slot.day, 0),
-                'startHour': int(slot.time_start.split(':')[0]),
-                'endHour': int(slot.time_end.split(':')[0]),
-                'teacher': slot.teacher_name,
-                'teacherId': slot.teacher_id,
-                'room': slot.room_name,
-                'campus': slot.campus,
-                'type': slot.activity_type.lower()
+                'id': slot['id'],
+                'title': slot['subject_name'],
+                'day': day_mapping.get(slot['day'], 0),
+                'startHour': int(slot['time_start'].split(':')[0]),
+                'endHour': int(slot['time_end'].split(':')[0]),
+                'teacher': slot['teacher_name'],
+                'teacherId': slot['teacher_id'],
+                'room': slot['room_name'],
+                'campus': slot['campus'],
+                'type': slot['activity_type'].lower()
             })
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'data': {
                 'studentId': current_api_user.student_id,
@@ -722,7 +907,8 @@ def get_student_schedule(current_api_user):
                 'schedule': schedule,
                 'totalClasses': len(schedule)
             }
-        }), 200
+        })
+        return _tag_response(response, etag), 200
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
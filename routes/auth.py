@@ -2,7 +2,8 @@ from flask import Blueprint, request, jsonify, render_template, redirect, url_fo
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db, User
 from datetime import datetime
-import pandas as pd
+from reference_data import reference_store
+from user_cache import user_cache
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -149,6 +150,7 @@ def register():
 @auth_bp.route('/logout')
 @login_required
 def logout():
+    user_cache.invalidate(current_user.id)
     logout_user()
     if request.is_json:
         return jsonify({'success': True, 'message': 'Logged out successfully'})
@@ -159,33 +161,27 @@ def logout():
 def validate_teacher_id(teacher_id):
     """Validate teacher ID against CSV data"""
     try:
-        teachers_df = pd.read_csv('data/teachers.csv')
-        return teacher_id in teachers_df['teacher_id'].values
+        return teacher_id in reference_store.index('teachers')
     except Exception:
         return False
 
 def validate_student_id(student_id):
     """Validate student ID against CSV data"""
     try:
-        students_df = pd.read_csv('data/students.csv')
-        return student_id in students_df['student_id'].values
+        return student_id in reference_store.index('students')
     except Exception:
         return False
 
 def get_teacher_data(teacher_id):
     """Get teacher data from CSV"""
     try:
-        teachers_df = pd.read_csv('data/teachers.csv')
-        teacher_row = teachers_df[teachers_df['teacher_id'] == teacher_id].iloc[0]
-        return teacher_row.to_dict()
+        return reference_store.lookup('teachers', teacher_id)
     except Exception:
         return None
 
 def get_student_data(student_id):
     """Get student data from CSV"""
     try:
-        students_df = pd.read_csv('data/students.csv')
-        student_row = students_df[students_df['student_id'] == student_id].iloc[0]
-        return student_row.to_dict()
+        return reference_store.lookup('students', student_id)
     except Exception:
         return None
\ No newline at end of file
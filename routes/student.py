@@ -1,9 +1,10 @@
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, send_file
+from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash
 from flask_login import login_required, current_user
 from models import db, TimetableSlot
 from datetime import datetime
-import pandas as pd
-import io
+from reference_data import reference_store
+from schedule_cache import schedule_cache
+from timetable_export import week_query, weekly_order, slot_rows, weekly_rows, flat_rows, csv_response, xlsx_response
 from functools import wraps
 
 student_bp = Blueprint('student', __name__)
@@ -24,24 +25,20 @@ def student_required(f):
 @student_required
 def dashboard():
     # Get student's timetable
-    student_slots = TimetableSlot.query.filter_by(
-        batch_id=current_user.batch_id,
-        section=current_user.section,
-        is_active=True
-    ).all()
+    student_slots = schedule_cache.batch(current_user.batch_id, current_user.section)
     
     # Calculate statistics
     total_classes = len(student_slots)
-    unique_subjects = len(set(slot.subject_code for slot in student_slots))
-    unique_teachers = len(set(slot.teacher_id for slot in student_slots))
+    unique_subjects = len(set(slot['subject_code'] for slot in student_slots))
+    unique_teachers = len(set(slot['teacher_id'] for slot in student_slots))
     
     # Get today's schedule
     today = datetime.now().strftime('%A')
-    today_slots = [slot for slot in student_slots if slot.day == today]
+    today_slots = [slot for slot in student_slots if slot['day'] == today]
     
     # Get next upcoming class
     current_time = datetime.now().strftime('%H:%M')
-    upcoming_slots = [slot for slot in today_slots if slot.time_start > current_time]
+    upcoming_slots = [slot for slot in today_slots if slot['time_start'] > current_time]
     next_class = upcoming_slots[0] if upcoming_slots else None
     
     stats = {
@@ -60,8 +57,8 @@ def dashboard():
     if request.is_json:
         return jsonify({
             'stats': stats,
-            'today_schedule': [slot.to_dict() for slot in today_slots],
-            'next_class': next_class.to_dict() if next_class else None
+            'today_schedule': today_slots,
+            'next_class': next_class
         })
     
     return render_template('student/dashboard.html', 
@@ -167,46 +164,22 @@ def download_timetable():
         batch_id=current_user.batch_id,
         section=current_user.section,
         is_active=True
-    ).order_by(TimetableSlot.slot_index)
-    
-    slots = query.all()
-    
-    # Convert to DataFrame
-    data = [slot.to_dict() for slot in slots]
-    df = pd.DataFrame(data)
+    )
     
     # Filter by week if needed
-    if week_type != 'full' and not df.empty:
-        from routes.admin import filter_weekly_data
-        df = filter_weekly_data(df, week_type)
+    query = week_query(query, week_type).order_by(TimetableSlot.slot_index)
     
+    filename_suffix = f"_{week_type}_week" if week_type != 'full' else ""
     if format_type == 'excel':
-        output = io.BytesIO()
-        try:
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name=f'{current_user.batch_id}_{current_user.section}', index=False)
-        except Exception as e:
-            pass
-        output.seek(0)
-        
-        filename_suffix = f"_{week_type}_week" if week_type != 'full' else ""
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'student_timetable_{current_user.student_id}{filename_suffix}_{datetime.now().strftime("%Y%m%d")}.xlsx'
+        return xlsx_response(
+            flat_rows(query),
+            f'student_timetable_{current_user.student_id}{filename_suffix}_{datetime.now().strftime("%Y%m%d")}.xlsx',
+            sheet_name=f'{current_user.batch_id}_{current_user.section}'
         )
     else:
-        output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
-        
-        filename_suffix = f"_{week_type}_week" if week_type != 'full' else ""
-        return send_file(
-            io.BytesIO(output.getvalue().encode()),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'student_timetable_{current_user.student_id}{filename_suffix}_{datetime.now().strftime("%Y%m%d")}.csv'
+        return csv_response(
+            flat_rows(query),
+            f'student_timetable_{current_user.student_id}{filename_suffix}_{datetime.now().strftime("%Y%m%d")}.csv'
         )
 
 @student_bp.route('/timetable/download/weekly')
@@ -214,48 +187,28 @@ def download_timetable():
 @student_required
 def download_weekly_timetable():
     """Weekly timetable download for student"""
+    from routes.admin import create_weekly_pivot_table
+    
     format_type = request.args.get('format', 'csv')
     week_type = request.args.get('week', 'current')
     
-    slots = TimetableSlot.query.filter_by(
+    query = week_query(TimetableSlot.query.filter_by(
         batch_id=current_user.batch_id,
         section=current_user.section,
         is_active=True
-    ).order_by(TimetableSlot.slot_index).all()
-    
-    data = [slot.to_dict() for slot in slots]
-    df = pd.DataFrame(data)
-    
-    if not df.empty:
-        from routes.admin import filter_weekly_data, create_weekly_pivot_table
-        df = filter_weekly_data(df, week_type)
-        df = create_weekly_pivot_table(df)
+    ), week_type)
+    rows = weekly_rows(slot_rows(weekly_order(query)), create_weekly_pivot_table)
     
     if format_type == 'excel':
-        output = io.BytesIO()
-        try:
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name=f'{week_type.title()} Week Schedule')
-        except Exception as e:
-            pass
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'student_weekly_timetable_{current_user.student_id}_{week_type}_{datetime.now().strftime("%Y%m%d")}.xlsx'
+        return xlsx_response(
+            rows,
+            f'student_weekly_timetable_{current_user.student_id}_{week_type}_{datetime.now().strftime("%Y%m%d")}.xlsx',
+            sheet_name=f'{week_type.title()} Week Schedule'
         )
     else:
-        output = io.StringIO()
-        df.to_csv(output)
-        output.seek(0)
-        
-        return send_file(
-            io.BytesIO(output.getvalue().encode()),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'student_weekly_timetable_{current_user.student_id}_{week_type}_{datetime.now().strftime("%Y%m%d")}.csv'
+        return csv_response(
+            rows,
+            f'student_weekly_timetable_{current_user.student_id}_{week_type}_{datetime.now().strftime("%Y%m%d")}.csv'
         )
 
 @student_bp.route('/teachers')
@@ -274,7 +227,7 @@ def teachers():
         teacher_ids = list(set(slot.teacher_id for slot in student_slots))
         
         # Load teacher data
-        teachers_df = pd.read_csv('data/teachers.csv')
+        teachers_df = reference_store.teachers
         student_teachers = teachers_df[teachers_df['teacher_id'].isin(teacher_ids)]
         
         # Add subject info from timetable
@@ -316,7 +269,7 @@ def subjects():
         subject_codes = list(set(slot.subject_code for slot in student_slots))
         
         # Load subjects data
-        subjects_df = pd.read_csv('data/subjects.csv')
+        subjects_df = reference_store.subjects
         student_subjects = subjects_df[subjects_df['subject_code'].isin(subject_codes)]
         
         # Add schedule info
@@ -350,7 +303,7 @@ def classmates():
     """Get classmates in the same batch and section"""
     try:
         # Load student data
-        students_df = pd.read_csv('data/students.csv')
+        students_df = reference_store.students
         classmates = students_df[
             (students_df['batch_id'] == current_user.batch_id) & 
             (students_df['section'] == current_user.section) &
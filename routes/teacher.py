@@ -2,7 +2,10 @@ from flask import Blueprint, request, jsonify, render_template, redirect, url_fo
 from flask_login import login_required, current_user
 from models import db, TimetableSlot
 from datetime import datetime, timedelta
-import pandas as pd
+from reference_data import reference_store
+from occupancy_index import occupancy_index
+from schedule_cache import schedule_cache
+from timetable_export import week_query, flat_rows, csv_response
 import io
 from functools import wraps
 
@@ -23,23 +26,20 @@ def teacher_required(f):
 @login_required
 @teacher_required
 def dashboard():
-    teacher_slots = TimetableSlot.query.filter_by(
-        teacher_id=current_user.teacher_id,
-        is_active=True
-    ).all()
+    teacher_slots = schedule_cache.teacher(current_user.teacher_id)
 
     total_classes = len(teacher_slots)
-    unique_subjects = len(set(slot.subject_code for slot in teacher_slots))
-    unique_batches = len(set(slot.batch_id for slot in teacher_slots))
+    unique_subjects = len(set(slot['subject_code'] for slot in teacher_slots))
+    unique_batches = len(set(slot['batch_id'] for slot in teacher_slots))
     today = datetime.now().strftime('%A')
-    today_slots = [slot for slot in teacher_slots if slot.day == today]
+    today_slots = [slot for slot in teacher_slots if slot['day'] == today]
 
     weekly_schedule = {}
     for slot in teacher_slots:
-        weekly_schedule.setdefault(slot.day, []).append(slot)
+        weekly_schedule.setdefault(slot['day'], []).append(slot)
 
     for day in weekly_schedule:
-        weekly_schedule[day].sort(key=lambda x: x.time_start)
+        weekly_schedule[day].sort(key=lambda x: x['time_start'])
 
     stats = {
         'total_classes': total_classes,
@@ -54,8 +54,8 @@ def dashboard():
     if request.is_json:
         return jsonify({
             'stats': stats,
-            'today_schedule': [slot.to_dict() for slot in today_slots],
-            'weekly_schedule': {day: [slot.to_dict() for slot in slots] for day, slots in weekly_schedule.items()}
+            'today_schedule': today_slots,
+            'weekly_schedule': weekly_schedule
         })
 
     return render_template('teacher/dashboard.html', stats=stats, today_slots=today_slots, weekly_schedule=weekly_schedule)
@@ -110,6 +110,16 @@ def edit_slot(slot_id):
     editable_fields = ['room_id', 'room_name', 'activity_type']
 
     try:
+        # A room change must not double-book the room
+        proposed = dict(slot.to_dict(), **{key: data[key] for key in editable_fields if key in data})
+        conflicts = occupancy_index.check({slot.id: proposed})
+        if conflicts:
+            return jsonify({
+                'success': False,
+                'message': 'Room is already booked at this time',
+                'conflicts': conflicts
+            }), 409
+
         for key, value in data.items():
             if key in editable_fields and hasattr(slot, key):
                 setattr(slot, key, value)
@@ -118,6 +128,7 @@ def edit_slot(slot_id):
         slot.version += 1
 
         db.session.commit()
+        occupancy_index.apply(slot)
 
         return jsonify({
             'success': True,
@@ -209,23 +220,14 @@ def optimize_teacher_slots():
 def download_teacher_timetable():
     format_type = request.args.get('format', 'csv')
 
-    slots = TimetableSlot.query.filter_by(
+    query = TimetableSlot.query.filter_by(
         teacher_id=current_user.teacher_id,
         is_active=True
-    ).all()
-
-    data = [slot.to_dict() for slot in slots]
-    df = pd.DataFrame(data)
+    ).order_by(TimetableSlot.slot_index)
 
-    output = io.StringIO()
-    df.to_csv(output, index=False)
-    output.seek(0)
-
-    return send_file(
-        io.BytesIO(output.getvalue().encode()),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'teacher_timetable_{current_user.teacher_id}_{datetime.now().strftime("%Y%m%d")}.csv'
+    return csv_response(
+        flat_rows(query),
+        f'teacher_timetable_{current_user.teacher_id}_{datetime.now().strftime("%Y%m%d")}.csv'
     )
 @teacher_bp.route('/timetable/editable')
 @login_required
@@ -237,8 +239,8 @@ def editable_timetable():
     ).order_by(TimetableSlot.slot_index).all()
 
     # Load subject and room info
-    subjects_df = pd.read_csv('data/subjects.csv')
-    rooms_df = pd.read_csv('data/rooms.csv')
+    subjects_df = reference_store.subjects
+    rooms_df = reference_store.rooms
 
     teacher_subjects = subjects_df[
         subjects_df['subject_code'].isin([slot.subject_code for slot in slots])
@@ -268,12 +270,13 @@ def teacher_weekly_download():
     format_type = request.args.get('format', 'csv')
     week_type = request.args.get('week', 'current')
 
-    slots = TimetableSlot.query.filter_by(
+    # Filter for working weekdays if current or next week
+    query = week_query(TimetableSlot.query.filter_by(
         teacher_id=current_user.teacher_id,
         is_active=True
-    ).all()
+    ), week_type)
 
-    if not slots:
+    if not query.count():
         return send_file(
             io.BytesIO("No data available\n".encode()),
             mimetype='text/csv',
@@ -281,22 +284,7 @@ def teacher_weekly_download():
             download_name=f'teacher_weekly_timetable_{week_type}_{current_user.teacher_id}.csv'
         )
 
-    data = [slot.to_dict() for slot in slots]
-    df = pd.DataFrame(data)
-
-    # Filter for working weekdays if current or next week
-    if week_type in ['current', 'next']:
-        weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        df = df[df['day'].isin(weekdays)]
-
-    output = io.StringIO()
-    df.to_csv(output, index=False)
-    output.seek(0)
-
-    return send_file(
-        io.BytesIO(output.getvalue().encode()),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'teacher_weekly_timetable_{week_type}_{current_user.teacher_id}.csv'
+    return csv_response(
+        flat_rows(query.order_by(TimetableSlot.slot_index)),
+        f'teacher_weekly_timetable_{week_type}_{current_user.teacher_id}.csv'
     )
-
@@ -0,0 +1,170 @@
+"""
+Schedule Cache
+Materialized per-batch, per-section and per-teacher schedules stored as serialized JSON
+"""
+
+import json
+from datetime import datetime
+from sqlalchemy import event, insert, select, update, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, TimetableSlot, ScheduleSnapshot
+
+slots_table = TimetableSlot.__table__
+snapshots_table = ScheduleSnapshot.__table__
+
+# Columns of TimetableSlot.to_dict(), the shape every cached slot has
+SLOT_FIELDS = [
+    'id', 'slot_index', 'batch_id', 'section', 'day', 'time_start', 'time_end',
+    'subject_code', 'subject_name', 'teacher_id', 'teacher_name', 'room_id', 'room_name',
+    'campus', 'activity_type', 'department', 'scheme', 'created_at', 'updated_at', 'is_active', 'version',
+]
+
+# Session.info keys for invalidations waiting for the transaction to commit
+PENDING_KEYS = 'schedule_cache_keys'
+PENDING_ALL = 'schedule_cache_all'
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _slot_dict(row):
+    """Same shape as TimetableSlot.to_dict(), built from a Core row"""
+    slot = dict(row._mapping)
+    slot['created_at'] = _iso(slot['created_at'])
+    slot['updated_at'] = _iso(slot['updated_at'])
+    return slot
+
+
+def slot_keys(batch_id, section, teacher_id):
+    """Cache keys whose schedule contains a slot with these values"""
+    return {('batch', batch_id), ('section', f'{batch_id}/{section}'), ('teacher', teacher_id)}
+
+
+class ScheduleCache:
+    """Serialized schedules in schedule_snapshots, rebuilt on a miss and dropped on change.
+
+    Reads are one primary-key lookup. Slot inserts, deletes and version bumps
+    (the change log gives every ORM slot edit one) seen at flush time mark
+    the schedules they touch, for both the old and new batch, section and
+    teacher, and those rows are invalidated after the commit by bumping
+    their generation. A rebuild only stores its payload if the
+    generation it read first is unchanged, so a rebuild racing an edit can
+    never persist the pre-edit schedule.
+    """
+
+    def __init__(self):
+        self._registered = False
+
+    def init_app(self, app):
+        if not self._registered:
+            event.listen(Session, 'after_flush', self._collect)
+            event.listen(Session, 'after_commit', self._invalidate_pending)
+            event.listen(Session, 'after_soft_rollback', self._discard_pending)
+            self._registered = True
+
+    def _collect(self, session, flush_context):
+        keys = session.info.setdefault(PENDING_KEYS, set())
+        for slot in list(session.new) + list(session.deleted):
+            if isinstance(slot, TimetableSlot):
+                keys |= slot_keys(slot.batch_id, slot.section, slot.teacher_id)
+        for slot in session.dirty:
+            if not isinstance(slot, TimetableSlot):
+                continue
+            state = db.inspect(slot)
+            if not state.attrs.version.history.has_changes():
+                continue
+            keys |= slot_keys(slot.batch_id, slot.section, slot.teacher_id)
+            old = {
+                field: (state.attrs[field].history.deleted or [getattr(slot, field)])[0]
+                for field in ('batch_id', 'section', 'teacher_id')
+            }
+            keys |= slot_keys(old['batch_id'], old['section'], old['teacher_id'])
+
+    def _invalidate_pending(self, session):
+        keys = session.info.pop(PENDING_KEYS, None)
+        if session.info.pop(PENDING_ALL, False):
+            self.invalidate()
+        elif keys:
+            self.invalidate(keys)
+
+    @staticmethod
+    def _discard_pending(session, previous_transaction):
+        session.info.pop(PENDING_KEYS, None)
+        session.info.pop(PENDING_ALL, False)
+
+    @staticmethod
+    def invalidate_all_on_commit(session=None):
+        """Drop every schedule once the current transaction commits (bulk slot writes)"""
+        (session or db.session).info[PENDING_ALL] = True
+
+    def invalidate(self, keys=None):
+        """Invalidate the given (scope, key) schedules, or all of them, right away"""
+        statement = update(snapshots_table).values(
+            payload=None, generation=snapshots_table.c.generation + 1
+        )
+        if keys is not None:
+            statement = statement.where(tuple_(snapshots_table.c.scope, snapshots_table.c.key).in_(list(keys)))
+        with db.engine.begin() as connection:
+            connection.execute(statement)
+
+    @staticmethod
+    def _filter(scope, key):
+        active = slots_table.c.is_active == True
+        if scope == 'teacher':
+            return [active, slots_table.c.teacher_id == key]
+        if scope == 'section':
+            batch_id, section = key.split('/', 1)
+            return [active, slots_table.c.batch_id == batch_id, slots_table.c.section == section]
+        return [active, slots_table.c.batch_id == key]
+
+    def _build(self, scope, key):
+        pk = (snapshots_table.c.scope == scope, snapshots_table.c.key == key)
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(insert(snapshots_table).values(scope=scope, key=key, generation=0))
+        except IntegrityError:
+            pass  # row already there (invalidated, or created by another worker)
+
+        with db.engine.begin() as connection:
+            generation = connection.execute(select(snapshots_table.c.generation).where(*pk)).scalar()
+            columns = [slots_table.c[field] for field in SLOT_FIELDS]
+            rows = connection.execute(
+                select(*columns).where(*self._filter(scope, key)).order_by(slots_table.c.slot_index)
+            )
+            slots = [_slot_dict(row) for row in rows]
+            payload = json.dumps(slots)
+            connection.execute(
+                update(snapshots_table)
+                .where(*pk, snapshots_table.c.generation == generation)
+                .values(payload=payload, total=len(slots), built_at=datetime.utcnow())
+            )
+        return payload, len(slots)
+
+    def payload(self, scope, key):
+        """(serialized JSON list of slot dicts, slot count) for one schedule"""
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(snapshots_table.c.payload, snapshots_table.c.total)
+                .where(snapshots_table.c.scope == scope, snapshots_table.c.key == key)
+            ).first()
+        if row is not None and row.payload is not None:
+            return row.payload, row.total
+        return self._build(scope, key)
+
+    def slots(self, scope, key):
+        """Active slot dicts of one schedule, ordered by slot_index"""
+        return json.loads(self.payload(scope, key)[0])
+
+    def batch(self, batch_id, section=None):
+        if section is None:
+            return self.slots('batch', batch_id)
+        return self.slots('section', f'{batch_id}/{section}')
+
+    def teacher(self, teacher_id):
+        return self.slots('teacher', teacher_id)
+
+
+# One cache per worker process, shared by all blueprints
+schedule_cache = ScheduleCache()
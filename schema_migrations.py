@@ -0,0 +1,73 @@
+"""
+Schema Migrations
+Idempotent schema changes that db.create_all() cannot apply to existing tables
+"""
+
+import logging
+from sqlalchemy import inspect, insert, select, text
+from models import db, TimetableSlot, TimetableGeneration, BackgroundJob
+
+
+def _timetable_slot_indexes(connection):
+    """Composite indexes for the student, teacher and API slot filters"""
+    for index in TimetableSlot.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def _user_token_version(connection):
+    """users.token_version, the JWT revocation counter; existing tokens carry no version and match 0"""
+    columns = {column['name'] for column in inspect(connection).get_columns('users')}
+    if 'token_version' not in columns:
+        connection.execute(text('ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0'))
+
+
+def _timetable_generation_row(connection):
+    """The single timetable_generation row the occupancy index polls"""
+    table = TimetableGeneration.__table__
+    if connection.execute(select(table.c.id).where(table.c.id == 1)).first() is None:
+        connection.execute(insert(table).values(id=1, value=0))
+
+
+def _background_job_claims(connection):
+    """Attempt, worker and heartbeat columns the job workers claim and sweep with, plus their index"""
+    columns = {column['name'] for column in inspect(connection).get_columns('background_jobs')}
+    for name, ddl in (
+        ('attempts', 'INTEGER NOT NULL DEFAULT 0'),
+        ('worker_id', 'VARCHAR(100)'),
+        ('heartbeat_at', 'TIMESTAMP'),
+    ):
+        if name not in columns:
+            connection.execute(text(f'ALTER TABLE background_jobs ADD COLUMN {name} {ddl}'))
+    for index in BackgroundJob.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def _event_keyset_indexes(connection):
+    """(..., day, time_start, id) indexes for /api/events pages; they supersede (is_active, day)"""
+    connection.execute(text('DROP INDEX IF EXISTS ix_timetable_slots_active_day'))
+    _timetable_slot_indexes(connection)
+
+
+# (name, function(connection)), applied in order; every step must be safe to re-run
+MIGRATIONS = [
+    ('0001_timetable_slot_indexes', _timetable_slot_indexes),
+    ('0002_user_token_version', _user_token_version),
+    ('0003_timetable_generation_row', _timetable_generation_row),
+    ('0004_background_job_claims', _background_job_claims),
+    ('0005_event_keyset_indexes', _event_keyset_indexes),
+]
+
+
+def run_migrations():
+    """Apply every migration inside one transaction (call within an app context)"""
+    with db.engine.begin() as connection:
+        for name, migrate in MIGRATIONS:
+            migrate(connection)
+    logging.info(f"Schema migrations applied: {', '.join(name for name, _ in MIGRATIONS)}")
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        run_migrations()
@@ -158,6 +158,406 @@ def test_pipeline_models():
     
     return True
 
+def test_autoencoder_dense_targets():
+    """Test that the autoencoder's index-path targets match encode_many, missing fields included"""
+    print("🔍 Testing autoencoder dense targets...")
+    import numpy as np
+    import torch
+    from pipeline.encoding import TimetableEncoder
+    from pipeline.training import TimetableAutoencoder
+    
+    encoder = TimetableEncoder().fit_encoders('data/')
+    students = pd.read_csv('data/students.csv', nrows=1).iloc[0]
+    slot = {
+        'section': students['section'], 'subject_code': None, 'teacher_id': 'UNKNOWN',
+        'room_id': None, 'day': 'Monday', 'time_slot': '09:00-10:00',
+        'campus': students['primary_campus'], 'activity_type': 'Lecture',
+    }
+    slots = [
+        slot,
+        dict(slot, day=None, time_slot=None),
+        dict(slot, section=encoder.field_classes[0][0], campus=None),
+    ]
+    
+    model = TimetableAutoencoder(encoder.feature_dim, field_sizes=encoder.field_widths.tolist())
+    indices = torch.from_numpy(encoder.encode_indices(slots).astype(np.int64))
+    dense = model.to_dense(indices.unsqueeze(0))[0].numpy()
+    
+    assert (indices < 0).any(), "Test slots should have missing fields"
+    assert np.array_equal(dense, encoder.encode_many(slots)), "to_dense differs from encode_many"
+    print("✅ to_dense matches encode_many for slots with missing fields")
+
+def test_sparse_training_smoke():
+    """Test one epoch of index-input training and loading the result through AnomalyDetector"""
+    print("🔍 Testing sparse autoencoder training...")
+    import tempfile
+    from pipeline.training import TimetableAutoencoder, TimetableTrainer
+    from pipeline.anomaly_detection import AnomalyDetector
+    
+    with tempfile.TemporaryDirectory() as model_dir:
+        trainer = TimetableTrainer(None, model_dir=model_dir)
+        sequences = trainer.load_training_data(sparse=True)
+        assert sequences, "No training sequences generated"
+    
+        encoder = trainer.encoder
+        trainer.model = TimetableAutoencoder(encoder.feature_dim, field_sizes=encoder.field_widths.tolist())
+        X_train, X_val, X_test = trainer.prepare_datasets(sequences)
+        trainer.train_model(X_train, X_val, epochs=1, batch_size=16)
+        trainer.compute_threshold(X_val)
+        trainer.save_model()
+    
+        detector = AnomalyDetector(f'{model_dir}/autoencoder.pth', f'{model_dir}/threshold.pkl',
+                                   f'{model_dir}/encoders.pkl')
+        assert detector.model is not None and detector.model.uses_indices, "Index model did not load"
+    
+        students = pd.read_csv('data/students.csv', nrows=1).iloc[0]
+        slot = {
+            'section': students['section'], 'subject_code': None, 'teacher_id': None, 'room_id': None,
+            'day': 'Monday', 'time_slot': '09:00-10:00', 'campus': students['primary_campus'],
+            'activity_type': 'Lecture',
+        }
+        sequences = {'A': [slot, dict(slot, day='Tuesday')], 'B': [dict(slot, activity_type='Lab')]}
+        scores = detector.score_sequences(sequences)
+        for key, sequence in sequences.items():
+            is_anomaly, error = detector.detect_anomaly(sequence)
+            assert abs(scores[key]['error'] - error) < 1e-6, f"Batched score differs for {key}"
+        assert detector.localize_anomaly(sequences['A']) is not None, "Localization failed"
+    print("✅ Sparse model trained, loaded and scored")
+
+def test_blank_subject_expertise():
+    """Test that the solver builds demands when a teacher has no subject_expertise"""
+    print("🔍 Testing solver demands with a blank subject_expertise...")
+    import shutil
+    import tempfile
+    from pipeline.constraint_solver import TimetableConstraintSolver
+    
+    with tempfile.TemporaryDirectory() as data_path:
+        for name in ('students', 'teachers', 'subjects', 'rooms'):
+            shutil.copy(f'data/{name}.csv', data_path)
+        teachers = pd.read_csv(f'{data_path}/teachers.csv')
+        teachers.loc[0, 'subject_expertise'] = None
+        teachers.to_csv(f'{data_path}/teachers.csv', index=False)
+    
+        solver = TimetableConstraintSolver(data_path=data_path)
+        demands = solver.build_demands()
+    
+    assert demands, "No demands built with a blank subject_expertise"
+    print(f"✅ Built {len(demands)} demands with a blank subject_expertise")
+
+def _explain(session, query):
+    """Query plan lines for an ORM query on the current database"""
+    from sqlalchemy import text
+    
+    dialect = session.get_bind().dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'postgresql':
+        # Tiny test tables are always cheaper to scan; only an unusable index forces a Seq Scan now
+        session.execute(text('SET LOCAL enable_seqscan = off'))
+        return [row[0] for row in session.execute(text('EXPLAIN ' + sql))]
+    return [row[-1] for row in session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+def test_slot_query_plans():
+    """Test that hot TimetableSlot filters are served by an index, not a full table scan"""
+    print("🔍 Testing timetable slot query plans...")
+    from flask import Flask
+    from sqlalchemy import tuple_
+    from models import db, TimetableSlot
+    from schema_migrations import run_migrations
+    
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI') or 'sqlite://'
+    db.init_app(app)
+    
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+        
+        active = TimetableSlot.query.filter_by(is_active=True)
+        hot_queries = {
+            # student dashboard / timetable / downloads, api_v1 events for students
+            'student_timetable': TimetableSlot.query.filter_by(
+                batch_id='A01', section='A01', is_active=True
+            ).order_by(TimetableSlot.slot_index),
+            # teacher portal, api.get_teacher_timetable, api_v1 events for teachers
+            'teacher_timetable': TimetableSlot.query.filter_by(
+                teacher_id='TCH1001', is_active=True
+            ).order_by(TimetableSlot.slot_index),
+            # api.get_batch_timetable
+            'batch_timetable': TimetableSlot.query.filter_by(
+                batch_id='A01', is_active=True
+            ).order_by(TimetableSlot.slot_index),
+            # admin editable timetable and final preview
+            'admin_timetable': active.order_by(TimetableSlot.slot_index),
+            # api_v1 events ?day= and ?campus= filters
+            'events_by_day': active.filter_by(day='Monday'),
+            'events_by_campus': active.filter_by(campus='Campus-3'),
+        }
+        
+        # api_v1 /api/events keyset pages: one day's (time_start, id) range, which must come out of an index in order
+        def events_page(query):
+            return query.filter(
+                TimetableSlot.day == 'Monday', tuple_(TimetableSlot.time_start, TimetableSlot.id) > tuple_('09:00', 100)
+            ).order_by(TimetableSlot.time_start, TimetableSlot.id).limit(501)
+        keyset_queries = {
+            'events_page_admin': events_page(active),
+            'events_page_student': events_page(active.filter_by(batch_id='A01', section='A01')),
+            'events_page_teacher': events_page(active.filter_by(teacher_id='TCH1001')),
+        }
+        
+        full_scans = {}
+        for name, query in list(hot_queries.items()) + list(keyset_queries.items()):
+            plan = _explain(db.session, query)
+            db.session.rollback()
+            sorts = name in keyset_queries and any('TEMP B-TREE' in line or 'Sort' in line for line in plan)
+            if sorts or any(line.startswith('SCAN timetable_slots') and 'USING' not in line or 'Seq Scan' in line for line in plan):
+                full_scans[name] = plan
+            else:
+                print(f"✅ {name}: {' | '.join(plan)}")
+    
+    for name, plan in full_scans.items():
+        print(f"❌ {name} scans or sorts timetable_slots: {' | '.join(plan)}")
+    assert not full_scans, f"Full table scans or sorts in: {', '.join(full_scans)}"
+
+def _sqlite_app():
+    """Flask app on a fresh in-memory SQLite database with every table and migration"""
+    from flask import Flask
+    from models import db
+    from schema_migrations import run_migrations
+    
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+    return app
+
+def _slot(slot_index, batch_id, teacher_id, room_id, day, time_start, time_end):
+    """Active TimetableSlot with placeholder values for the columns the tests ignore"""
+    from models import TimetableSlot
+    
+    return TimetableSlot(
+        slot_index=slot_index, batch_id=batch_id, section=batch_id, day=day, time_start=time_start,
+        time_end=time_end, subject_code='SUB1', subject_name='Subject', teacher_id=teacher_id,
+        teacher_name=teacher_id, room_id=room_id, room_name=room_id, campus='Campus-3',
+        activity_type='Lecture', department='CSE', scheme='A', is_active=True
+    )
+
+def _proposal(slot, **changes):
+    """Slot values as a dict for OccupancyIndex.check, with changes applied"""
+    values = {key: getattr(slot, key) for key in ('batch_id', 'teacher_id', 'room_id', 'day', 'time_start', 'time_end')}
+    values.update(changes)
+    return values
+
+def test_occupancy_conflicts():
+    """Test OccupancyIndex.check for moves, swaps, existing clashes and writes from other sessions"""
+    print("🔍 Testing occupancy index conflict checks...")
+    from sqlalchemy.orm import Session
+    from models import db
+    from occupancy_index import occupancy_index
+    
+    app = _sqlite_app()
+    occupancy_index.init_app(app)
+    with app.app_context():
+        first = _slot(1, 'A01', 'TCH1', 'R1', 'Monday', '09:00', '10:00')
+        second = _slot(2, 'A02', 'TCH1', 'R2', 'Monday', '10:00', '11:00')
+        # Already clashing: TCH3 teaches both batches on Tuesday at 09:00
+        clash = [_slot(3, 'A03', 'TCH3', 'R3', 'Tuesday', '09:00', '10:00'),
+                 _slot(4, 'A04', 'TCH3', 'R4', 'Tuesday', '09:00', '10:00')]
+        db.session.add_all([first, second] + clash)
+        db.session.commit()
+        occupancy_index.rebuild()
+    
+        # Moving into an occupied cell clashes on every shared resource
+        conflicts = occupancy_index.check({second.id: _proposal(second, time_start='09:00', time_end='10:00',
+                                                                batch_id='A01', room_id='R1')})
+        assert {c['type'] for c in conflicts} == {'teacher_conflict', 'room_conflict', 'batch_conflict'}, conflicts
+        assert all(c['day'] == 'Monday' and c['time_slot'] == '09:00-10:00' for c in conflicts), conflicts
+    
+        # Swapping two slots of the same teacher frees each cell for the other
+        conflicts = occupancy_index.check({
+            first.id: _proposal(first, time_start='10:00', time_end='11:00'),
+            second.id: _proposal(second, time_start='09:00', time_end='10:00'),
+        })
+        assert conflicts == [], f"Swap reported conflicts: {conflicts}"
+    
+        # A clash the slot already has is not blamed on the edit, but a new slot there clashes
+        assert occupancy_index.check({clash[0].id: _proposal(clash[0], room_id='R5')}) == []
+        conflicts = occupancy_index.check({None: _proposal(clash[0], batch_id='A05', room_id='R5')})
+        assert [c['type'] for c in conflicts] == ['teacher_conflict'], conflicts
+    
+        # An edit committed here is applied as a delta
+        second.day = 'Thursday'
+        db.session.commit()
+        occupancy_index.apply(second)
+        assert occupancy_index._token == occupancy_index._db_token(), "apply() did not advance the index"
+        conflicts = occupancy_index.check({None: _proposal(second, batch_id='A09', room_id='R9')})
+        assert [c['type'] for c in conflicts] == ['teacher_conflict'], conflicts
+    
+        # A slot written by another session bumps the generation, so check rebuilds first
+        token = occupancy_index._token
+        with Session(db.engine) as other:
+            other.add(_slot(5, 'A05', 'TCH5', 'R6', 'Wednesday', '09:00', '10:00'))
+            other.commit()
+        assert occupancy_index._db_token() == token + 1, "Other session did not bump the generation"
+        conflicts = occupancy_index.check({None: {'batch_id': 'A06', 'teacher_id': 'TCH5', 'room_id': 'R7',
+                                                  'day': 'Wednesday', 'time_start': '09:00', 'time_end': '10:00'}})
+        assert [c['type'] for c in conflicts] == ['teacher_conflict'], conflicts
+        assert occupancy_index._token == token + 1, "check() did not rebuild the index"
+        db.session.remove()
+    print("✅ Occupancy index conflicts, swaps, existing clashes and rebuilds")
+
+def test_changelog_reconstruct():
+    """Test point-in-time reconstruction from bases plus diffs, across compaction and pruning"""
+    print("🔍 Testing timetable change log reconstruction...")
+    import timetable_changelog
+    from models import db, TimetableHistory, TimetableChange
+    from timetable_changelog import change_log
+    
+    def moment():
+        # Keep each step's timestamps strictly apart from the next one's
+        time.sleep(0.01)
+        at = datetime.utcnow()
+        time.sleep(0.01)
+        return at
+    
+    def active_rows():
+        return sorted((row for row in change_log.current_rows() if row['is_active']), key=lambda row: row['id'])
+    
+    def reconstructed(at=None):
+        rows = change_log.reconstruct(at)
+        return None if rows is None else sorted(rows, key=lambda row: row['id'])
+    
+    app = _sqlite_app()
+    change_log.init_app(app)
+    compact_after, keep_bases = timetable_changelog.COMPACT_AFTER, timetable_changelog.KEEP_BASES
+    with app.app_context():
+        try:
+            slots = [_slot(i, f'A0{i}', f'TCH{i}', f'R{i}', 'Monday', '09:00', '10:00') for i in range(1, 4)]
+            db.session.add_all(slots)
+            db.session.commit()
+            first_base_id = change_log.write_base('Initial timetable').id
+            db.session.commit()
+            initial = active_rows()
+            at_base = moment()
+    
+            slots[0].teacher_id = 'TCH9'
+            db.session.commit()
+            edited = active_rows()
+            at_edit = moment()
+    
+            slots[1].is_active = False
+            db.session.add(_slot(4, 'A04', 'TCH4', 'R4', 'Tuesday', '10:00', '11:00'))
+            db.session.commit()
+            latest = active_rows()
+    
+            assert reconstructed(at_base) == initial, "Reconstruction before the edit differs"
+            assert reconstructed(at_edit) == edited, "Reconstruction after the edit differs"
+            assert reconstructed() == latest, "Reconstruction of the current timetable differs"
+            assert initial != edited != latest
+    
+            # Below COMPACT_AFTER nothing happens; at it, the 3 pending diffs become a new base
+            timetable_changelog.COMPACT_AFTER = 4
+            assert change_log.compact() is None, "Compacted before COMPACT_AFTER edits"
+            timetable_changelog.COMPACT_AFTER = 3
+            assert change_log.compact() is not None, "Did not compact after COMPACT_AFTER edits"
+            db.session.commit()
+            assert change_log.pending_changes() == 0
+            assert reconstructed() == latest, "Compaction changed the current timetable"
+            assert reconstructed(at_edit) == edited, "Compaction changed earlier history"
+    
+            # Pruning drops the oldest bases and their diffs; history they still cover is unchanged
+            timetable_changelog.KEEP_BASES = 2
+            slots[2].room_id = 'R9'
+            db.session.commit()
+            moved = active_rows()
+            at_moved = moment()
+            change_log.compact(force=True)
+            db.session.commit()
+    
+            assert TimetableHistory.query.count() == 2, "KEEP_BASES did not prune old bases"
+            assert db.session.get(TimetableHistory, first_base_id) is None, "The oldest base was not pruned"
+            assert not TimetableChange.query.filter_by(history_id=first_base_id).count(), "Pruned base left its diffs behind"
+            assert reconstructed(at_base) is None, "History before the oldest kept base survived"
+            assert reconstructed(at_moved) == moved, "Pruning changed the kept history"
+            assert reconstructed() == moved, "Pruning changed the current timetable"
+        finally:
+            timetable_changelog.COMPACT_AFTER, timetable_changelog.KEEP_BASES = compact_after, keep_bases
+            db.session.remove()
+    print("✅ Change log reconstructs history across compaction and pruning")
+
+def test_job_queue_states():
+    """Test job claims, cancellation before start and requeueing of jobs whose worker stopped heartbeating"""
+    print("🔍 Testing background job queue states...")
+    import json
+    from datetime import timedelta
+    import job_queue as queue_module
+    from models import db, BackgroundJob
+    from job_queue import job_queue, job_handler
+    
+    @job_handler('test_echo')
+    def echo(context, value=None):
+        context.progress(50, 'Halfway')
+        return {'value': value}
+    
+    def load(job_id):
+        return db.session.get(BackgroundJob, job_id)
+    
+    def stale_running(job_id, attempts, cancel_requested=False):
+        job = load(job_id)
+        job.status, job.worker_id, job.attempts, job.cancel_requested = 'running', 'dead-worker', attempts, cancel_requested
+        job.started_at = job.heartbeat_at = datetime.utcnow() - timedelta(seconds=queue_module.STALE_AFTER_SECONDS + 10)
+        db.session.commit()
+    
+    app = _sqlite_app()
+    job_queue.init_app(app)
+    with app.app_context():
+        try:
+            done_id = job_queue.submit('test_echo', {'value': 7}).id
+            cancelled_id = job_queue.submit('test_echo', {'value': 8}).id
+            cancelled = job_queue.cancel(cancelled_id)
+            assert cancelled.status == 'cancelled' and cancelled.message == 'Cancelled before start', cancelled.to_dict()
+    
+            job_queue.run_worker(worker_id='test-worker', once=True)
+            done = load(done_id)
+            assert done.status == 'completed', done.to_dict()
+            assert json.loads(done.result) == {'value': 7} and done.progress == 100, done.to_dict()
+            assert done.attempts == 1 and done.worker_id == 'test-worker', done.to_dict()
+            assert load(cancelled_id).attempts == 0, "A cancelled job was claimed"
+    
+            # A stale running job goes back to the queue and the next worker finishes it
+            lost_id = job_queue.submit('test_echo', {'value': 9}).id
+            stale_running(lost_id, attempts=1)
+            # ...unless it already used up its attempts or was cancelled
+            failed_id = job_queue.submit('test_echo').id
+            stale_running(failed_id, attempts=queue_module.MAX_ATTEMPTS)
+            dropped_id = job_queue.submit('test_echo').id
+            stale_running(dropped_id, attempts=1, cancel_requested=True)
+    
+            assert job_queue.requeue_stale() == 3, "Stale running jobs were not swept"
+            lost = load(lost_id)
+            assert lost.status == 'queued' and lost.worker_id is None, lost.to_dict()
+            assert load(failed_id).status == 'failed', load(failed_id).to_dict()
+            assert load(dropped_id).status == 'cancelled', load(dropped_id).to_dict()
+    
+            job_queue.run_worker(worker_id='test-worker-2', once=True)
+            lost = load(lost_id)
+            assert lost.status == 'completed' and lost.attempts == 2 and lost.worker_id == 'test-worker-2', lost.to_dict()
+            assert job_queue.claim('test-worker-2') is None, "Finished jobs were claimed again"
+        finally:
+            queue_module.JOB_HANDLERS.pop('test_echo', None)
+            db.session.remove()
+    print("✅ Job queue claims, cancellations and stale requeues")
+
+def _passes(test):
+    """Run an assert-based test for the summary table"""
+    try:
+        test()
+        return True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return False
+
 def run_complete_system_test():
     """Run complete system test"""
     print("🚀 COMPLETE SYSTEM TEST")
@@ -171,6 +571,13 @@ def run_complete_system_test():
     test_results['database'] = test_database_connection()
     test_results['data_files'] = test_data_files()
     test_results['pipeline_models'] = test_pipeline_models()
+    test_results['slot_query_plans'] = _passes(test_slot_query_plans)
+    test_results['autoencoder_dense_targets'] = _passes(test_autoencoder_dense_targets)
+    test_results['sparse_training_smoke'] = _passes(test_sparse_training_smoke)
+    test_results['blank_subject_expertise'] = _passes(test_blank_subject_expertise)
+    test_results['occupancy_conflicts'] = _passes(test_occupancy_conflicts)
+    test_results['changelog_reconstruct'] = _passes(test_changelog_reconstruct)
+    test_results['job_queue_states'] = _passes(test_job_queue_states)
     test_results['ml_pipeline'] = test_ml_pipeline()
     test_results['web_endpoints'] = test_web_endpoints()
     
@@ -0,0 +1,200 @@
+"""
+Timetable Change Log
+Versioned history of the timetable: base snapshots plus per-edit row diffs
+"""
+
+import json
+from datetime import datetime
+from flask import g, has_request_context
+from flask_login import current_user
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.orm import Session
+from models import db, TimetableSlot, TimetableHistory, TimetableChange
+
+slots_table = TimetableSlot.__table__
+changes_table = TimetableChange.__table__
+
+# Slot columns captured in snapshots and diffs (timestamps and authorship live on the change row)
+TRACKED_FIELDS = [
+    'slot_index', 'batch_id', 'section', 'day', 'time_start', 'time_end',
+    'subject_code', 'subject_name', 'teacher_id', 'teacher_name', 'room_id', 'room_name',
+    'campus', 'activity_type', 'department', 'scheme', 'is_active', 'version',
+]
+
+# Edits recorded against one base before compact() folds them into a new base
+COMPACT_AFTER = 500
+
+# Base snapshots (with their change rows) kept for point-in-time reconstruction
+KEEP_BASES = 5
+
+
+def _plain(value):
+    """JSON-safe form of a column value (the teacher auto-fix can store time objects)"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _acting_user_id():
+    if not has_request_context():
+        return None
+    if g.get('api_user_id'):
+        return g.api_user_id
+    return current_user.id if current_user.is_authenticated else None
+
+
+class TimetableChangeLog:
+    """Records every ORM change to a TimetableSlot as a diff against the latest base.
+
+    A base is a TimetableHistory row holding the full slot list. Session
+    flush hooks append one timetable_changes row per inserted, updated or
+    deleted slot, holding only the columns that changed, so an edit costs a
+    row proportional to the edit. Bulk Core writes (bulk_slots) bypass the
+    hooks; callers that replace the timetable write a fresh base instead.
+    """
+
+    def __init__(self):
+        self._registered = False
+
+    def init_app(self, app):
+        if not self._registered:
+            event.listen(Session, 'before_flush', self._bump_versions)
+            event.listen(Session, 'after_flush', self._record_changes)
+            self._registered = True
+
+    @staticmethod
+    def _tracked_changes(slot):
+        """{field: [old, new]} for tracked columns modified since the last flush"""
+        state = db.inspect(slot)
+        diff = {}
+        for field in TRACKED_FIELDS:
+            history = state.attrs[field].history
+            if history.has_changes():
+                old = history.deleted[0] if history.deleted else None
+                new = history.added[0] if history.added else None
+                if old != new:
+                    diff[field] = [_plain(old), _plain(new)]
+        return diff
+
+    def _bump_versions(self, session, flush_context, instances):
+        # Every recorded edit gets its own (slot id, version); some routes do not bump it themselves
+        for slot in session.dirty:
+            if isinstance(slot, TimetableSlot):
+                diff = self._tracked_changes(slot)
+                if diff and 'version' not in diff:
+                    slot.version = (slot.version or 0) + 1
+
+    def _record_changes(self, session, flush_context):
+        rows = []
+        now = datetime.utcnow()
+        for slot in session.new:
+            if isinstance(slot, TimetableSlot):
+                diff = {field: [None, _plain(getattr(slot, field))] for field in TRACKED_FIELDS}
+                rows.append(self._change_row(slot, 'insert', diff, now))
+        for slot in session.dirty:
+            if isinstance(slot, TimetableSlot):
+                diff = self._tracked_changes(slot)
+                if diff:
+                    operation = 'delete' if diff.get('is_active', [None, True])[1] is False else 'update'
+                    rows.append(self._change_row(slot, operation, diff, now))
+        for slot in session.deleted:
+            if isinstance(slot, TimetableSlot):
+                rows.append(self._change_row(slot, 'delete', {'is_active': [True, False]}, now))
+
+        if rows:
+            connection = session.connection()
+            base_id = connection.execute(select(func.max(TimetableHistory.id))).scalar()
+            for row in rows:
+                row['history_id'] = base_id
+            connection.execute(insert(changes_table), rows)
+
+    @staticmethod
+    def _change_row(slot, operation, diff, now):
+        return {
+            'slot_id': slot.id,
+            'slot_version': slot.version,
+            'operation': operation,
+            'diff': json.dumps(diff),
+            'changed_by': _acting_user_id(),
+            'changed_at': now,
+        }
+
+    @staticmethod
+    def current_rows():
+        """Every slot row as a {'id', tracked fields...} dict, read with one Core select"""
+        columns = [slots_table.c.id] + [slots_table.c[field] for field in TRACKED_FIELDS]
+        result = db.session.execute(select(*columns).order_by(slots_table.c.id))
+        return [{key: _plain(value) for key, value in row._mapping.items()} for row in result]
+
+    def write_base(self, description, user_id=None, affected_batches=None):
+        """Snapshot the current slots as a new base and prune bases beyond KEEP_BASES.
+
+        Runs in the caller's transaction; the caller commits.
+        """
+        rows = self.current_rows()
+        latest = db.session.execute(select(func.max(TimetableHistory.version))).scalar() or 0
+        if affected_batches is None:
+            affected_batches = sorted({row['batch_id'] for row in rows})
+
+        base = TimetableHistory(
+            timetable_data=json.dumps(rows),
+            version=latest + 1,
+            created_by=user_id,
+            description=description,
+            total_slots=len(rows),
+            affected_batches=json.dumps(list(affected_batches))
+        )
+        db.session.add(base)
+        db.session.flush()
+
+        stale = db.session.execute(
+            select(TimetableHistory.id).order_by(TimetableHistory.id.desc()).offset(KEEP_BASES)
+        ).scalars().all()
+        if stale:
+            TimetableChange.query.filter(TimetableChange.history_id.in_(stale)).delete(synchronize_session=False)
+            TimetableHistory.query.filter(TimetableHistory.id.in_(stale)).delete(synchronize_session=False)
+        return base
+
+    def pending_changes(self):
+        """Number of changes recorded since the latest base"""
+        base_id = db.session.execute(select(func.max(TimetableHistory.id))).scalar()
+        return TimetableChange.query.filter(TimetableChange.history_id == base_id).count()
+
+    def compact(self, user_id=None, force=False):
+        """Fold the changes since the latest base into a new base once COMPACT_AFTER is reached.
+
+        Returns the new base, or None when there was nothing to compact.
+        """
+        pending = self.pending_changes()
+        if not pending or (pending < COMPACT_AFTER and not force):
+            return None
+        print(f"🗜️ Compacting {pending} timetable changes into a new base snapshot")
+        return self.write_base(f'Compacted {pending} edits', user_id=user_id)
+
+    def reconstruct(self, at=None):
+        """Active slots as they were at `at` (default: now), from the nearest base plus its diffs"""
+        at = at or datetime.utcnow()
+        base = TimetableHistory.query.filter(
+            TimetableHistory.created_at <= at
+        ).order_by(TimetableHistory.id.desc()).first()
+        if base is None:
+            return None
+
+        slots = {row['id']: row for row in json.loads(base.timetable_data) if 'id' in row}
+        changes = db.session.execute(
+            select(changes_table.c.slot_id, changes_table.c.operation, changes_table.c.diff)
+            .where(changes_table.c.history_id == base.id, changes_table.c.changed_at <= at)
+            .order_by(changes_table.c.id)
+        )
+        for slot_id, operation, diff in changes:
+            values = {field: new for field, (_, new) in json.loads(diff).items()}
+            if operation == 'insert':
+                slots[slot_id] = dict(values, id=slot_id)
+            elif slot_id in slots:
+                slots[slot_id].update(values)
+
+        return [row for row in slots.values() if row.get('is_active', True)]
+
+
+# One change log per worker process, shared by all blueprints
+change_log = TimetableChangeLog()
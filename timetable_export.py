@@ -0,0 +1,131 @@
+"""
+Timetable Export
+Streaming CSV and XLSX downloads of timetable slots with constant memory
+"""
+
+import csv
+import io
+import tempfile
+from datetime import datetime
+import pandas as pd
+from flask import Response, send_file, stream_with_context
+from openpyxl import Workbook
+from sqlalchemy import case
+from models import TimetableSlot
+
+# Flat export columns, same order as TimetableSlot.to_dict()
+EXPORT_COLUMNS = [
+    'id', 'slot_index', 'batch_id', 'section', 'day', 'time_start', 'time_end',
+    'subject_code', 'subject_name', 'teacher_id', 'teacher_name', 'room_id', 'room_name',
+    'campus', 'activity_type', 'department', 'scheme', 'created_at', 'updated_at', 'is_active', 'version',
+]
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+DAY_ORDER = WEEKDAYS + ['Saturday', 'Sunday']
+
+# Rows fetched per round trip from the server-side cursor
+YIELD_PER = 1000
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def week_query(query, week_type):
+    """Restrict a slot query to Monday-Friday for the current and next week"""
+    if week_type in ('current', 'next'):
+        return query.filter(TimetableSlot.day.in_(WEEKDAYS))
+    return query
+
+
+def weekly_order(query):
+    """Order slots by batch, section, weekday and start time, the weekly sheet layout"""
+    day_rank = case({day: rank for rank, day in enumerate(DAY_ORDER)}, value=TimetableSlot.day, else_=999)
+    return query.order_by(TimetableSlot.batch_id, TimetableSlot.section, day_rank, TimetableSlot.time_start)
+
+
+def slot_rows(query, columns=EXPORT_COLUMNS):
+    """Stream the query's slots as dicts of plain values through a server-side cursor.
+
+    Only the export columns are selected, so no ORM objects are built.
+    """
+    entities = [getattr(TimetableSlot, column) for column in columns]
+    for row in query.with_entities(*entities).yield_per(YIELD_PER):
+        yield {
+            column: value.isoformat() if isinstance(value, datetime) else value
+            for column, value in zip(columns, row)
+        }
+
+
+def weekly_rows(rows, formatter, chunk_size=YIELD_PER):
+    """Weekly-format rows from slot dicts ordered by weekly_order.
+
+    Slots are buffered until at least chunk_size are held and the
+    batch/section changes, then that chunk goes through formatter (the
+    DataFrame -> DataFrame weekly pivot) so memory is bounded by the chunk.
+    Yields the header row first.
+    """
+    header_sent = False
+    buffer = []
+
+    def flush():
+        nonlocal header_sent
+        frame = formatter(pd.DataFrame(buffer))
+        if not header_sent:
+            header_sent = True
+            yield list(frame.columns)
+        yield from frame.itertuples(index=False, name=None)
+        buffer.clear()
+
+    group = None
+    for row in rows:
+        row_group = (row['batch_id'], row['section'])
+        if buffer and row_group != group and len(buffer) >= chunk_size:
+            yield from flush()
+        group = row_group
+        buffer.append(row)
+    if buffer:
+        yield from flush()
+
+
+def _csv_chunks(rows, preamble):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for line in preamble:
+        buffer.write(line + '\n')
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % YIELD_PER == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def csv_response(rows, filename, preamble=()):
+    """Stream rows (header first) as a CSV attachment"""
+    response = Response(stream_with_context(_csv_chunks(rows, preamble)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def xlsx_response(rows, filename, sheet_name='Timetable'):
+    """Write rows (header first) to a write-only workbook spooled to disk and send it.
+
+    Write-only worksheets keep no cell objects in memory; the finished file
+    is streamed from a temporary file.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_name[:31])
+    for row in rows:
+        sheet.append(list(row))
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return send_file(output, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=filename)
+
+
+def flat_rows(query, columns=EXPORT_COLUMNS):
+    """Header plus one row per slot in to_dict column order"""
+    yield list(columns)
+    for row in slot_rows(query, columns):
+        yield [row[column] for column in columns]
@@ -0,0 +1,134 @@
+"""
+User Cache
+Per-worker TTL/LRU cache of user principals for JWT and session authentication
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+from models import db, User
+
+# Seconds a principal is trusted before it is re-read; bounds staleness across workers
+TTL_SECONDS = 60
+
+# Principals kept per worker before the least recently used is evicted
+MAX_USERS = 1024
+
+# Changes that revoke every token issued before them
+REVOKING_FIELDS = ('role', 'active_status', 'password_hash')
+
+# Session.info key for user ids waiting for the transaction to commit
+PENDING_USERS = 'user_cache_ids'
+
+USER_COLUMNS = [column.key for column in User.__table__.columns]
+
+
+class UserPrincipalCache:
+    """Column values of recently authenticated users, keyed by user id and token version.
+
+    A hit rebuilds a detached User from the cached values, so callers get the
+    usual attributes and methods without a database round trip; routes that
+    write to the user load it from the session. Any committed change to a
+    User row drops its entry in this worker, and changes to role, status or
+    password also bump token_version so outstanding tokens stop verifying.
+    Other workers see a change once their entry's TTL runs out.
+    """
+
+    def __init__(self, ttl=TTL_SECONDS, max_users=MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = OrderedDict()  # user id -> (expires at, column values)
+        self._lock = threading.Lock()
+        self._registered = False
+
+    def init_app(self, app):
+        if not self._registered:
+            event.listen(Session, 'before_flush', self._bump_token_versions)
+            event.listen(Session, 'after_flush', self._collect)
+            event.listen(Session, 'after_commit', self._invalidate_pending)
+            event.listen(Session, 'after_soft_rollback', self._discard_pending)
+            self._registered = True
+
+    @staticmethod
+    def _bump_token_versions(session, flush_context, instances):
+        for user in session.dirty:
+            if not isinstance(user, User):
+                continue
+            state = db.inspect(user)
+            if state.attrs.token_version.history.has_changes():
+                continue
+            if any(state.attrs[field].history.has_changes() for field in REVOKING_FIELDS):
+                user.token_version = (user.token_version or 0) + 1
+
+    @staticmethod
+    def _collect(session, flush_context):
+        ids = session.info.setdefault(PENDING_USERS, set())
+        for user in list(session.dirty) + list(session.deleted):
+            if isinstance(user, User):
+                ids.add(user.id)
+
+    def _invalidate_pending(self, session):
+        for user_id in session.info.pop(PENDING_USERS, ()):
+            self.invalidate(user_id)
+
+    @staticmethod
+    def _discard_pending(session, previous_transaction):
+        session.info.pop(PENDING_USERS, None)
+
+    def invalidate(self, user_id=None):
+        """Drop one user's principal, or every principal"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(int(user_id), None)
+
+    def _lookup(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def _store(self, user_id, values):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _principal(values):
+        user = User(**values)
+        make_transient_to_detached(user)
+        return user
+
+    def get(self, user_id, token_version=None):
+        """Detached User for user_id, or None if it does not exist.
+
+        With token_version (from a JWT), also None unless it matches the
+        user's current version; a cached entry with another version is
+        re-read once before the token is rejected.
+        """
+        user_id = int(user_id)
+        values = self._lookup(user_id)
+        if values is None or (token_version is not None and values['token_version'] != token_version):
+            user = db.session.get(User, user_id)
+            if user is None:
+                self.invalidate(user_id)
+                return None
+            values = {column: getattr(user, column) for column in USER_COLUMNS}
+            self._store(user_id, values)
+        if token_version is not None and values['token_version'] != token_version:
+            return None
+        return self._principal(values)
+
+
+# One cache per worker process, shared by all blueprints
+user_cache = UserPrincipalCache()